@@ -5,155 +5,453 @@ FastAPI 后端服务，提供 biz schema 数据查询接口和设备实时数据
 
 from fastapi import FastAPI, Query, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, text
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from sqlalchemy import create_engine, text, bindparam
 from datetime import datetime, timedelta
 import json
 import asyncio
+import struct
+from array import array
+from collections import deque
 import httpx
-from typing import List, Dict, Set
+import importlib.util
+import threading
+import time
+from typing import List, Dict
 from contextlib import asynccontextmanager
+from etl_core.common.config import DB_CONFIG, API_POOL
+from etl_core.common.events import EVENT_CHANNEL
+from etl_core.common.curves import downsample, DOWNSAMPLE_METHODS, resample_linear, make_grid, band_stats
+from etl_core.common.spc import Moments, RESULT_STEP, pooled_sigma, capability, control_chart
 
-# --- Database Configuration ---
-DB_CONFIG = {
-    'host': '10.18.120.240',
-    'port': 35432,
-    'database': 'equipment_mechanism',
-    'user': 'postgres',
-    'password': '6edef2d746f2274cab951a452d5fc13d',
-}
-
-conn_str = f"postgresql+pg8000://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-engine = create_engine(conn_str, echo=False)
+# --- Database Configuration (shared with the ETL, overridable via ETL_DB_* env vars) ---
+conn_str = f"postgresql+{DB_CONFIG['driver']}://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+engine = create_engine(conn_str, echo=False, **API_POOL)
 
 # --- External API for time series data ---
 TIMESERIES_API_URL = "https://bff-model-product-infra-system.iot-2f.seres.cn/bff/aggquery/v2/query/v2/queryCurrentRawValueByUri"
+TIMESERIES_HISTORY_API_URL = "https://bff-model-product-infra-system.iot-2f.seres.cn/bff/aggquery/v2/query/v2/queryHistoryRawValueByUri"
+TIMESERIES_CACHE_TTL = 1.0          # seconds an identical realtime query is served from cache
+TIMESERIES_HISTORY_CACHE_TTL = 30.0  # history windows change slowly
+
+# --- Curve streaming ---
+CURVE_STREAM_FORMATS = ("json", "f32")
+CURVE_STREAM_CHUNK = 50  # rows fetched per round trip from the server-side cursor
 
 # --- Proxy Configuration (for VPN/aTrust) ---
 PROXY_URL = "http://127.0.0.1:7897"
 
+# --- Shared upstream client ---
+class UpstreamError(Exception):
+    def __init__(self, status_code, body):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+class TimeseriesClient:
+    """
+    One long-lived httpx client for the IoT platform (keep-alive, HTTP/2 when h2 is installed).
+    Identical concurrent requests are coalesced into one upstream call, run as
+    its own task so a waiter that is cancelled (client gone) does not cancel it
+    for the others, and successful responses are cached for a short TTL.
+    trust_env: honour HTTP(S)_PROXY from the environment.
+    """
+    def __init__(self, trust_env=False):
+        self.trust_env = trust_env
+        self.client: httpx.AsyncClient = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._cache: Dict[str, tuple] = {}  # key -> (expires_at, data)
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            timeout=30.0,
+            verify=False,
+            trust_env=self.trust_env,
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0),
+            headers={"Content-Type": "application/json"}
+        )
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def post(self, url, payload, ttl=TIMESERIES_CACHE_TTL):
+        """POST payload to url; returns the decoded JSON body or raises UpstreamError / httpx errors"""
+        key = url + "|" + json.dumps(payload, sort_keys=True)
+        now = time.monotonic()
+
+        cached = self._cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, url, payload, ttl))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: cancelling this waiter leaves the shared call running
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, url, payload, ttl):
+        response = await self.client.post(url, json=payload)
+        if response.status_code != 200:
+            raise UpstreamError(response.status_code, response.text[:200])
+        data = response.json()
+        if ttl:
+            self._cache[key] = (time.monotonic() + ttl, data)
+        return data
+
+    def _finish(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Every waiter may be gone; mark the exception as retrieved
+        if not task.cancelled():
+            task.exception()
+        self._evict(time.monotonic())
+
+    def _evict(self, now):
+        if len(self._cache) > 1000:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+
+timeseries = TimeseriesClient()
+# The history proxy always used the environment's HTTP(S)_PROXY (httpx default trust_env=True)
+timeseries_history = TimeseriesClient(trust_env=True)
+
 # --- WebSocket Connection Manager ---
+WS_QUEUE_SIZE = 20        # pending messages per socket before the oldest is dropped
+WS_SEND_TIMEOUT = 10.0    # seconds a single send may block before the socket is dropped
+WS_SNAPSHOT_EVERY = 20    # ticks between full snapshots (deltas in between)
+
+
+class ClientConnection:
+    """One WebSocket with its own bounded send queue and sender task"""
+    def __init__(self, websocket: WebSocket, device_id: str):
+        self.websocket = websocket
+        self.device_id = device_id
+        self.queue = deque()
+        self.has_data = asyncio.Event()
+        self.needs_snapshot = True  # new sockets and sockets that lost messages get a full snapshot
+        self.ticks_since_snapshot = 0
+        self.dropped = 0
+        self.task: asyncio.Task = None
+
+    def enqueue(self, message: dict):
+        if len(self.queue) >= WS_QUEUE_SIZE:
+            self.queue.popleft()
+            self.dropped += 1
+            self.needs_snapshot = True
+        self.queue.append(message)
+        self.has_data.set()
+
+    async def run_sender(self, on_dead):
+        try:
+            while True:
+                await self.has_data.wait()
+                self.has_data.clear()
+                while self.queue:
+                    message = self.queue.popleft()
+                    await asyncio.wait_for(self.websocket.send_json(message), WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Dropping slow/dead WebSocket for {self.device_id}: {type(e).__name__}: {e}")
+            on_dead(self)
+
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, Set[WebSocket]] = {}  # device_id -> set of websockets
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}  # device_id -> websocket -> client
     
     async def connect(self, websocket: WebSocket, device_id: str):
         await websocket.accept()
-        if device_id not in self.active_connections:
-            self.active_connections[device_id] = set()
-        self.active_connections[device_id].add(websocket)
+        client = ClientConnection(websocket, device_id)
+        client.task = asyncio.create_task(client.run_sender(self._drop))
+        self.active_connections.setdefault(device_id, {})[websocket] = client
         print(f"✅ WebSocket connected: {device_id} (total: {len(self.active_connections[device_id])})")
     
     def disconnect(self, websocket: WebSocket, device_id: str):
-        if device_id in self.active_connections:
-            self.active_connections[device_id].discard(websocket)
-            if not self.active_connections[device_id]:
+        clients = self.active_connections.get(device_id)
+        if clients and websocket in clients:
+            client = clients.pop(websocket)
+            client.task.cancel()
+            if not clients:
                 del self.active_connections[device_id]
         print(f"❌ WebSocket disconnected: {device_id}")
-    
-    async def broadcast(self, device_id: str, message: dict):
-        if device_id in self.active_connections:
-            dead_connections = set()
-            for connection in self.active_connections[device_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    dead_connections.add(connection)
-            for dc in dead_connections:
-                self.active_connections[device_id].discard(dc)
+
+    def _drop(self, client: ClientConnection):
+        self.disconnect(client.websocket, client.device_id)
+        asyncio.create_task(self._close(client.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, device_id: str, message: dict):
+        """Queue a message for a single socket"""
+        client = self.active_connections.get(device_id, {}).get(websocket)
+        if client:
+            client.enqueue(message)
+
+    def broadcast(self, device_id: str, message: dict):
+        """Queue a message for every socket of a device (never blocks on slow clients)"""
+        for client in list(self.active_connections.get(device_id, {}).values()):
+            client.enqueue(message)
+
+    def publish_values(self, device_id: str, changed: list, snapshot: list, fetch_time: str):
+        """
+        Queue realtime values: a uri_delta with only the changed URIs, or a full
+        uri_data snapshot for new/lagging sockets and every WS_SNAPSHOT_EVERY ticks
+        """
+        for client in list(self.active_connections.get(device_id, {}).values()):
+            client.ticks_since_snapshot += 1
+            if client.needs_snapshot or client.ticks_since_snapshot >= WS_SNAPSHOT_EVERY:
+                client.needs_snapshot = False
+                client.ticks_since_snapshot = 0
+                client.enqueue({
+                    "type": "uri_data",
+                    "device_id": device_id,
+                    "data": snapshot,
+                    "fetch_time": fetch_time
+                })
+            elif changed:
+                client.enqueue({
+                    "type": "uri_delta",
+                    "device_id": device_id,
+                    "data": changed,
+                    "fetch_time": fetch_time
+                })
 
 manager = ConnectionManager()
 
+# --- ETL result push (/ws/results) ---
+RESULT_EVENT_POLL = 0.5  # seconds between notification drains on the LISTEN connection
+
+
+class ResultEventHub:
+    """
+    Listens on the biz_events NOTIFY channel (published by the ETL pipelines on commit)
+    and forwards each result summary to the /ws/results subscribers whose filters match.
+    """
+    def __init__(self):
+        self.subscribers: Dict[WebSocket, tuple] = {}  # websocket -> (client, filters)
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._loop: asyncio.AbstractEventLoop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="result-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def subscribe(self, websocket: WebSocket, filters: dict):
+        await websocket.accept()
+        client = ClientConnection(websocket, "results")
+        client.task = asyncio.create_task(client.run_sender(lambda c: self.unsubscribe(c.websocket)))
+        self.subscribers[websocket] = (client, filters)
+        print(f"✅ Result subscriber connected (total: {len(self.subscribers)})")
+        return client
+
+    def unsubscribe(self, websocket: WebSocket):
+        entry = self.subscribers.pop(websocket, None)
+        if entry:
+            entry[0].task.cancel()
+            print(f"❌ Result subscriber disconnected (total: {len(self.subscribers)})")
+
+    @staticmethod
+    def matches(event: dict, filters: dict):
+        if filters.get("craft_type") and event.get("craft_type") != filters["craft_type"]:
+            return False
+        if filters.get("status") is not None and event.get("result_status") != filters["status"]:
+            return False
+        if filters.get("device_names") is not None and event.get("device_name") not in filters["device_names"]:
+            return False
+        return True
+
+    def dispatch(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        for client, filters in list(self.subscribers.values()):
+            if self.matches(event, filters):
+                client.enqueue(event)
+
+    def _listen(self):
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                raw.detach()  # dedicated LISTEN connection, never returned to the pool
+                dbapi_conn = raw.driver_connection
+                dbapi_conn.autocommit = True
+                cursor = dbapi_conn.cursor()
+                cursor.execute(f"LISTEN {EVENT_CHANNEL}")
+                print(f"👂 Listening for ETL events on '{EVENT_CHANNEL}'")
+                while not self._stop.is_set():
+                    # pg8000 collects notifications while reading any server response
+                    cursor.execute("SELECT 1")
+                    while dbapi_conn.notifications:
+                        _, _, payload = dbapi_conn.notifications.popleft()
+                        if self.subscribers:
+                            self._loop.call_soon_threadsafe(self.dispatch, payload)
+                    self._stop.wait(RESULT_EVENT_POLL)
+            except Exception as e:
+                print(f"⚠️ Result event listener error: {type(e).__name__}: {e}")
+                self._stop.wait(5)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+result_events = ResultEventHub()
+
 # --- Background task for fetching real-time data ---
+REALTIME_POLL_INTERVAL = 3.0   # seconds per tick
+REALTIME_URI_CACHE_TTL = 60.0  # seconds before a device's URI list is re-read from biz.device_uri
+REALTIME_BATCH_SIZE = 200      # URIs per upstream request
+REALTIME_CONCURRENCY = 4       # upstream requests in flight per tick
+
+
+class DeviceUriCache:
+    """In-memory device_id -> [(uri, name)] map, refreshed in one query for all stale devices"""
+    def __init__(self, ttl=REALTIME_URI_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}  # device_id -> (expires_at, [(uri, name)])
+
+    def invalidate(self, device_id: str):
+        self._entries.pop(device_id, None)
+
+    def _load(self, device_ids):
+        query = text("""
+            SELECT device_id, uri, name FROM biz.device_uri
+            WHERE device_id IN :device_ids
+            ORDER BY device_id, id
+        """).bindparams(bindparam("device_ids", expanding=True))
+        loaded = {d: [] for d in device_ids}
+        with engine.connect() as conn:
+            for row in conn.execute(query, {"device_ids": device_ids}):
+                loaded[row[0]].append((row[1], row[2]))
+        return loaded
+
+    async def get(self, device_ids):
+        now = time.monotonic()
+        stale = [d for d in device_ids if d not in self._entries or self._entries[d][0] <= now]
+        if stale:
+            loaded = await asyncio.to_thread(self._load, stale)
+            for device_id, rows in loaded.items():
+                self._entries[device_id] = (now + self.ttl, rows)
+        return {d: self._entries[d][1] for d in device_ids if d in self._entries}
+
+
+device_uri_cache = DeviceUriCache()
+device_values: Dict[str, Dict[str, dict]] = {}  # device_id -> uri -> latest item sent to clients
+
+
+async def fetch_uri_values(uris):
+    """Fetch current values for a deduplicated URI list; returns uri -> upstream result"""
+    semaphore = asyncio.Semaphore(REALTIME_CONCURRENCY)
+    chunks = [uris[i:i + REALTIME_BATCH_SIZE] for i in range(0, len(uris), REALTIME_BATCH_SIZE)]
+
+    async def fetch_chunk(chunk):
+        async with semaphore:
+            data = await timeseries.post(TIMESERIES_API_URL, chunk)
+        if data.get("code") != "0x00000000":
+            print(f"⚠️ API returned error code: {data.get('code')}")
+            return {}
+        return dict(zip(chunk, data.get("result", [])))
+
+    values = {}
+    responses = await asyncio.gather(*[fetch_chunk(c) for c in chunks], return_exceptions=True)
+    for chunk, response in zip(chunks, responses):
+        if isinstance(response, UpstreamError):
+            print(f"❌ API returned status {response.status_code}: {response.body}")
+        elif isinstance(response, httpx.TimeoutException):
+            print(f"⏱️ Timeout fetching {len(chunk)} URIs: {response}")
+        elif isinstance(response, Exception):
+            print(f"🌐 Error fetching {len(chunk)} URIs: {type(response).__name__}: {response}")
+        else:
+            values.update(response)
+    return values
+
+
+async def poll_devices_once():
+    """One tick: one merged upstream fetch for every subscribed device, then fan out changed values"""
+    device_ids = list(manager.active_connections.keys())
+    if not device_ids:
+        return
+
+    uri_map = await device_uri_cache.get(device_ids)
+    all_uris = list(dict.fromkeys(uri for rows in uri_map.values() for uri, _ in rows))
+    if not all_uris:
+        return
+
+    values = await fetch_uri_values(all_uris)
+    fetch_time = datetime.now().isoformat()
+
+    for device_id, rows in uri_map.items():
+        current = device_values.setdefault(device_id, {})
+        changed = []
+        for uri, name in rows:
+            result = values.get(uri)
+            if result is None:
+                continue
+            item = {
+                "uri": uri,
+                "name": name or uri,
+                "value": result.get("v", "").strip() if result.get("v") else None,
+                "timestamp": result.get("t"),
+                "status": result.get("s")
+            }
+            if current.get(uri) != item:
+                current[uri] = item
+                changed.append(item)
+        manager.publish_values(device_id, changed, list(current.values()), fetch_time)
+
+    # Forget devices nobody is watching any more
+    for device_id in list(device_values):
+        if device_id not in manager.active_connections:
+            del device_values[device_id]
+
+
 async def fetch_device_uri_data():
     """Periodically fetch device URI data and broadcast to WebSocket clients"""
-    async with httpx.AsyncClient(timeout=30.0, verify=False, trust_env=False) as client:
-        while True:
-            try:
-                # Get all device URIs that have active connections
-                device_ids = list(manager.active_connections.keys())
-                if device_ids:
-                    for device_id in device_ids:
-                        try:
-                            # Get URIs for this device
-                            with engine.connect() as conn:
-                                query = text("""
-                                    SELECT id, uri, name FROM biz.device_uri 
-                                    WHERE device_id = :device_id
-                                """)
-                                rows = conn.execute(query, {"device_id": device_id}).fetchall()
-                            
-                            if rows:
-                                uris = [row[1] for row in rows]
-                                uri_names = {row[1]: row[2] for row in rows}
-                                
-                                print(f"📡 Fetching data for {device_id}, URIs: {uris}")
-                                
-                                # Fetch current values from external API
-                                response = await client.post(
-                                    TIMESERIES_API_URL,
-                                    json=uris,
-                                    headers={"Content-Type": "application/json"}
-                                )
-                                
-                                print(f"📥 Response status: {response.status_code}")
-                                
-                                if response.status_code == 200:
-                                    data = response.json()
-                                    print(f"📦 Response data: {data}")
-                                    
-                                    if data.get("code") == "0x00000000":
-                                        results = data.get("result", [])
-                                        # Map results to URI names
-                                        uri_values = []
-                                        for i, uri in enumerate(uris):
-                                            if i < len(results):
-                                                result = results[i]
-                                                uri_values.append({
-                                                    "uri": uri,
-                                                    "name": uri_names.get(uri, uri),
-                                                    "value": result.get("v", "").strip() if result.get("v") else None,
-                                                    "timestamp": result.get("t"),
-                                                    "status": result.get("s")
-                                                })
-                                        
-                                        # Broadcast to connected clients
-                                        await manager.broadcast(device_id, {
-                                            "type": "uri_data",
-                                            "device_id": device_id,
-                                            "data": uri_values,
-                                            "fetch_time": datetime.now().isoformat()
-                                        })
-                                        print(f"✅ Broadcast {len(uri_values)} values to {device_id}")
-                                    else:
-                                        print(f"⚠️ API returned error code: {data.get('code')}")
-                                else:
-                                    print(f"❌ API returned status {response.status_code}: {response.text[:200]}")
-                            else:
-                                print(f"ℹ️ No URIs found for device {device_id}")
-                        except httpx.TimeoutException as e:
-                            print(f"⏱️ Timeout fetching data for {device_id}: {type(e).__name__}: {e}")
-                        except httpx.RequestError as e:
-                            print(f"🌐 Network error for {device_id}: {type(e).__name__}: {e}")
-                            import traceback
-                            traceback.print_exc()
-                        except Exception as e:
-                            print(f"❌ Error fetching data for {device_id}: {type(e).__name__}: {e}")
-                            import traceback
-                            traceback.print_exc()
-                
-                await asyncio.sleep(3)  # Fetch every 3 seconds
-            except Exception as e:
-                print(f"Background fetch error: {type(e).__name__}: {e}")
-                await asyncio.sleep(5)
+    while True:
+        started = time.monotonic()
+        try:
+            await poll_devices_once()
+        except Exception as e:
+            print(f"Background fetch error: {type(e).__name__}: {e}")
+            import traceback
+            traceback.print_exc()
+        await asyncio.sleep(max(0.0, REALTIME_POLL_INTERVAL - (time.monotonic() - started)))
 
 # --- App Lifecycle ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start background task
+    # Shared upstream client, then the background task that uses it
+    await timeseries.start()
+    await timeseries_history.start()
     task = asyncio.create_task(fetch_device_uri_data())
     print("🔄 Started background data fetching task")
+    result_events.start()
     yield
+    result_events.stop()
     task.cancel()
+    await timeseries.close()
+    await timeseries_history.close()
 
 # --- FastAPI App ---
 app = FastAPI(title="BIZ Dashboard API", version="2.0.0", lifespan=lifespan)
@@ -167,12 +465,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 大曲线响应压缩 (包括流式响应)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 
 def row_to_dict(row, keys):
     """Convert SQLAlchemy row to dict"""
     return dict(zip(keys, row))
 
 
+def parse_csv_param(value, cast=str):
+    """Split a comma separated query parameter ("TORQUE,ANGLE") into a list"""
+    if not value:
+        return []
+    return [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
 # ========== WebSocket Endpoint ==========
 
 @app.websocket("/ws/device/{device_id}")
@@ -190,7 +498,7 @@ async def websocket_device(websocket: WebSocket, device_id: str):
             rows = conn.execute(query, {"device_id": device_id}).fetchall()
             uri_list = [{"id": r[0], "uri": r[1], "name": r[2], "level": r[3]} for r in rows]
         
-        await websocket.send_json({
+        manager.send(websocket, device_id, {
             "type": "uri_list",
             "device_id": device_id,
             "uris": uri_list
@@ -201,11 +509,48 @@ async def websocket_device(websocket: WebSocket, device_id: str):
             data = await websocket.receive_text()
             # Can handle client messages here if needed
             if data == "ping":
-                await websocket.send_json({"type": "pong"})
+                manager.send(websocket, device_id, {"type": "pong"})
     except WebSocketDisconnect:
         manager.disconnect(websocket, device_id)
 
 
+@app.websocket("/ws/results")
+async def websocket_results(
+    websocket: WebSocket,
+    device_name: str = None,
+    craft_type: str = None,
+    structure_id: int = None,
+    status: int = None
+):
+    """
+    WebSocket 推送新入库的结果/报警摘要 (替代轮询 /api/results, /api/alarms)
+    过滤: device_name / craft_type / structure_id (含子节点设备) / status (0=NOK)
+    """
+    filters = {"craft_type": craft_type, "status": status, "device_names": None}
+    if device_name:
+        filters["device_names"] = {device_name}
+    if structure_id:
+        with engine.connect() as conn:
+            path_res = conn.execute(text("SELECT path FROM biz.structure WHERE id = :sid"), {"sid": structure_id}).fetchone()
+            names = set()
+            if path_res:
+                rows = conn.execute(text("""
+                    SELECT device_name FROM biz.structure
+                    WHERE path LIKE :path_like AND device_name IS NOT NULL
+                """), {"path_like": f"{path_res[0]}%"}).fetchall()
+                names = {r[0] for r in rows}
+        filters["device_names"] = names if filters["device_names"] is None else filters["device_names"] & names
+
+    client = await result_events.subscribe(websocket, filters)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            if data == "ping":
+                client.enqueue({"type": "pong"})
+    except WebSocketDisconnect:
+        result_events.unsubscribe(websocket)
+
+
 # ========== Device URI REST API ==========
 
 @app.get("/api/devices/{device_name}/uris")
@@ -239,29 +584,21 @@ async def get_device_uri_current_values(device_name: str):
     uri_names = {r[0]: r[1] for r in rows}
     
     try:
-        async with httpx.AsyncClient(timeout=30.0, verify=False, trust_env=False) as client:
-            response = await client.post(
-                TIMESERIES_API_URL,
-                json=uris,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("code") == "0x00000000":
-                    results = data.get("result", [])
-                    items = []
-                    for i, uri in enumerate(uris):
-                        if i < len(results):
-                            result = results[i]
-                            items.append({
-                                "uri": uri,
-                                "name": uri_names.get(uri, uri),
-                                "value": result.get("v", "").strip() if result.get("v") else None,
-                                "timestamp": result.get("t"),
-                                "status": result.get("s")
-                            })
-                    return {"items": items}
+        data = await timeseries.post(TIMESERIES_API_URL, uris)
+        if data.get("code") == "0x00000000":
+            results = data.get("result", [])
+            items = []
+            for i, uri in enumerate(uris):
+                if i < len(results):
+                    result = results[i]
+                    items.append({
+                        "uri": uri,
+                        "name": uri_names.get(uri, uri),
+                        "value": result.get("v", "").strip() if result.get("v") else None,
+                        "timestamp": result.get("t"),
+                        "status": result.get("s")
+                    })
+            return {"items": items}
     except Exception as e:
         print(f"❌ Proxy error: {type(e).__name__}: {e}")
         return {"error": str(e), "items": []}
@@ -275,22 +612,10 @@ async def proxy_timeseries(uris: list[str]):
     print(f"🔄 Proxy request for {len(uris)} URIs: {uris}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0, verify=False, trust_env=False) as client:
-            response = await client.post(
-                TIMESERIES_API_URL,
-                json=uris,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            print(f"📥 Proxy response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f"✅ Proxy success: {data}")
-                return data
-            else:
-                print(f"❌ Proxy failed: {response.status_code} - {response.text[:200]}")
-                return {"code": "error", "msg": f"HTTP {response.status_code}"}
+        return await timeseries.post(TIMESERIES_API_URL, uris)
+    except UpstreamError as e:
+        print(f"❌ Proxy failed: {e.status_code} - {e.body}")
+        return {"code": "error", "msg": f"HTTP {e.status_code}"}
     except httpx.TimeoutException as e:
         print(f"⏱️ Proxy timeout: {e}")
         return {"code": "timeout", "msg": "Request timeout"}
@@ -348,15 +673,43 @@ def get_stats():
         }
 
 
+# /api/results 的 KPI 范围参数 -> (biz.result_kpi 列, 比较符)
+RESULT_KPI_FILTERS = {
+    "min_force": ("final_force", ">="),
+    "max_force": ("final_force", "<="),
+    "min_stroke": ("final_stroke", ">="),
+    "max_stroke": ("final_stroke", "<="),
+    "min_velocity": ("velocity", ">="),
+    "max_velocity": ("velocity", "<="),
+}
+
+
 @app.get("/api/results")
 def get_results(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     craft_type: str = None,
     status: int = None,
-    structure_id: int = None
+    structure_id: int = None,
+    min_force: float = None,
+    max_force: float = None,
+    min_stroke: float = None,
+    max_stroke: float = None,
+    min_velocity: float = None,
+    max_velocity: float = None,
+    kpi_type: int = None,
+    kpi_step: int = None,
+    min_kpi: float = None,
+    max_kpi: float = None
 ):
-    """获取结果列表"""
+    """
+    获取结果列表
+    - min_/max_force, stroke, velocity: 按 biz.result_kpi 的类型化 KPI 过滤 (SPR)
+    - kpi_type (+ kpi_step) 与 min_kpi/max_kpi: 按 biz.step_kpi 的步骤 KPI 过滤 (FDS 单值结果)
+    """
+    if kpi_type is None and (kpi_step is not None or min_kpi is not None or max_kpi is not None):
+        return {"error": "kpi_step, min_kpi and max_kpi require kpi_type"}
+
     with engine.connect() as conn:
         # 构建查询
         where_clauses = []
@@ -368,6 +721,32 @@ def get_results(
         if status is not None:
             where_clauses.append("result_status = :status")
             params["status"] = status
+
+        # KPI 范围过滤走 B-tree 索引, 不再解析 extension.extra_data
+        filters = {"min_force": min_force, "max_force": max_force, "min_stroke": min_stroke,
+                   "max_stroke": max_stroke, "min_velocity": min_velocity, "max_velocity": max_velocity}
+        kpi_clauses = []
+        for name, value in filters.items():
+            if value is not None:
+                column, op = RESULT_KPI_FILTERS[name]
+                kpi_clauses.append(f"{column} {op} :{name}")
+                params[name] = value
+        if kpi_clauses:
+            where_clauses.append(f"(id, start_time) IN (SELECT result_id, start_time FROM biz.result_kpi WHERE {' AND '.join(kpi_clauses)})")
+
+        if kpi_type is not None:
+            step_clauses = ["kpi_type = :kpi_type"]
+            params["kpi_type"] = kpi_type
+            if kpi_step is not None:
+                step_clauses.append("step_index = :kpi_step")
+                params["kpi_step"] = kpi_step
+            if min_kpi is not None:
+                step_clauses.append("value >= :min_kpi")
+                params["min_kpi"] = min_kpi
+            if max_kpi is not None:
+                step_clauses.append("value <= :max_kpi")
+                params["max_kpi"] = max_kpi
+            where_clauses.append(f"(id, start_time) IN (SELECT result_id, start_time FROM biz.step_kpi WHERE {' AND '.join(step_clauses)})")
         
         # Hierarchy Filter
         if 'structure_id' in locals() and locals()['structure_id']:
@@ -486,32 +865,450 @@ def get_result_steps(result_id: int):
         return items
 
 
+def build_curve_query(select_fields, result_id, type_list=None, step_list=None):
+    """Build the biz.curve query for one result with optional curve_type / step filters"""
+    where_clauses = ["result_id = :rid"]
+    params = {"rid": result_id}
+    bind_params = []
+
+    if type_list:
+        where_clauses.append("curve_type IN :types")
+        params["types"] = type_list
+        bind_params.append(bindparam("types", expanding=True))
+    if step_list:
+        where_clauses.append("step IN :steps")
+        params["steps"] = step_list
+        bind_params.append(bindparam("steps", expanding=True))
+
+    query = text(f"""
+        SELECT {select_fields}
+        FROM biz.curve
+        WHERE {" AND ".join(where_clauses)}
+        ORDER BY step, curve_type
+    """).bindparams(*bind_params)
+    return query, params
+
+
 @app.get("/api/results/{result_id}/curves")
-def get_result_curves(result_id: int):
-    """获取结果的曲线数据"""
+def get_result_curves(
+    result_id: int,
+    width: int = Query(None, ge=3, le=20000),
+    method: str = "lttb",
+    curve_types: str = None,
+    steps: str = None
+):
+    """
+    获取结果的曲线数据
+    - width: 降采样目标点数 (不传则返回全部点)
+    - method: lttb | minmax
+    - curve_types / steps: 逗号分隔的过滤条件, 如 curve_types=TORQUE,ANGLE&steps=1,2
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        return {"error": f"Unknown method: {method}, expected one of {list(DOWNSAMPLE_METHODS)}"}
+
+    try:
+        type_list = parse_csv_param(curve_types, str.upper)
+        step_list = parse_csv_param(steps, int)
+    except ValueError:
+        return {"error": "Invalid steps parameter"}
+
     with engine.connect() as conn:
-        query = text("""
-            SELECT id, step, curve_type, start_time, end_time, data_points
-            FROM biz.curve
-            WHERE result_id = :rid
-            ORDER BY step, curve_type
-        """)
-        rows = conn.execute(query, {"rid": result_id}).fetchall()
+        query, params = build_curve_query(
+            "id, step, curve_type, start_time, end_time, data_points",
+            result_id, type_list, step_list
+        )
+        rows = conn.execute(query, params).fetchall()
         
         items = []
         for row in rows:
+            data_points = row[5] if row[5] else None
+            if width:
+                data_points = downsample(data_points, width, method)
             item = {
                 "id": row[0],
                 "step": row[1],
                 "curve_type": row[2],
                 "start_time": row[3].isoformat() if row[3] else None,
                 "end_time": row[4].isoformat() if row[4] else None,
-                "data_points": row[5] if row[5] else None
+                "data_points": data_points
             }
             items.append(item)
         
         return items
 
+@app.get("/api/results/{result_id}/curves/raw")
+def get_result_curves_raw(
+    result_id: int,
+    format: str = "json",
+    curve_types: str = None,
+    steps: str = None
+):
+    """
+    曲线数据直通接口 (不在 Python 中解码 jsonb)
+    - format=json: data_points::text 原样拼接为 JSON 数组, 分块流式返回
+    - format=f32: 二进制帧, 每条曲线为
+        uint32 header_len | header JSON (按4字节补齐) | float32[n] x | float32[n] y  (little-endian)
+    两种格式都通过服务端游标逐行读取, 内存占用与曲线总量无关; 压缩由 GZipMiddleware 完成
+    """
+    if format not in CURVE_STREAM_FORMATS:
+        return {"error": f"Unknown format: {format}, expected one of {list(CURVE_STREAM_FORMATS)}"}
+
+    try:
+        type_list = parse_csv_param(curve_types, str.upper)
+        step_list = parse_csv_param(steps, int)
+    except ValueError:
+        return {"error": "Invalid steps parameter"}
+
+    if format == "f32":
+        return StreamingResponse(
+            stream_curves_f32(result_id, type_list, step_list),
+            media_type="application/octet-stream"
+        )
+    return StreamingResponse(
+        stream_curves_json(result_id, type_list, step_list),
+        media_type="application/json"
+    )
+
+
+def iter_curve_rows(select_fields, result_id, type_list, step_list):
+    """Yield biz.curve rows through a server-side cursor"""
+    query, params = build_curve_query(select_fields, result_id, type_list, step_list)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=CURVE_STREAM_CHUNK).execute(query, params)
+        for row in result:
+            yield row
+
+
+def curve_header(row):
+    return {
+        "id": row[0],
+        "step": row[1],
+        "curve_type": row[2],
+        "start_time": row[3].isoformat() if row[3] else None,
+        "end_time": row[4].isoformat() if row[4] else None,
+    }
+
+
+def stream_curves_json(result_id, type_list, step_list):
+    """Splice data_points::text into the response without decoding it"""
+    rows = iter_curve_rows(
+        "id, step, curve_type, start_time, end_time, data_points::text",
+        result_id, type_list, step_list
+    )
+    yield "["
+    first = True
+    for row in rows:
+        head = json.dumps(curve_header(row))
+        yield ("" if first else ",") + head[:-1] + ', "data_points": ' + (row[5] or "null") + "}"
+        first = False
+    yield "]"
+
+
+# One axis of data_points as packed big-endian float32 (float4send); JSON nulls become NaN
+F32_AXIS_SQL = """(SELECT string_agg(float4send(COALESCE(e::float4, 'NaN')), ''::bytea ORDER BY i)
+                   FROM jsonb_array_elements_text(data_points->'{axis}') WITH ORDINALITY AS t(e, i))"""
+
+
+def stream_curves_f32(result_id, type_list, step_list):
+    """
+    Emit one float32 frame per curve.
+    Postgres still parses the jsonb and packs every point (server CPU per
+    point), but each axis reaches Python as one bytea: no per-point Python
+    objects, only a C-level byteswap from network order.
+    """
+    rows = iter_curve_rows(
+        f"""id, step, curve_type, start_time, end_time,
+           {F32_AXIS_SQL.format(axis="x")},
+           {F32_AXIS_SQL.format(axis="y")}""",
+        result_id, type_list, step_list
+    )
+    for row in rows:
+        xs = array("f")
+        ys = array("f")
+        xs.frombytes(row[5] or b"")
+        ys.frombytes(row[6] or b"")
+        n = min(len(xs), len(ys))
+        del xs[n:], ys[n:]
+        # float4send is big-endian; reversing each value gives the little-endian body on any host
+        xs.byteswap()
+        ys.byteswap()
+
+        header = curve_header(row)
+        header["n"] = n
+        head = json.dumps(header).encode("utf-8")
+        head += b" " * (-len(head) % 4)
+        yield struct.pack("<I", len(head)) + head + xs.tobytes() + ys.tobytes()
+
+
+@app.get("/api/curves/compare")
+def compare_curves(
+    curve_type: str,
+    result_ids: str = None,
+    program_id: str = None,
+    device_name: str = None,
+    start_time: datetime = None,
+    end_time: datetime = None,
+    step: int = None,
+    width: int = Query(500, ge=10, le=5000),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """
+    多结果曲线叠加对比 (一次查询)
+    - 结果集: result_ids=1,2,3 或 program_id / device_name / start_time / end_time 过滤 (按时间倒序取 limit 条)
+    - curve_type: 对比的曲线类型; step 不传时返回所有步骤
+    - 每个步骤单独对齐到自己的 x 网格 (width 点), 返回各曲线及包络/均值/分位带;
+      不同步骤的 x (如角度) 各自从头开始, 不拼接
+    """
+    try:
+        id_list = parse_csv_param(result_ids, int)
+    except ValueError:
+        return {"error": "Invalid result_ids parameter"}
+    if not (id_list or program_id or device_name or start_time or end_time):
+        return {"error": "result_ids or at least one filter (program_id, device_name, start_time, end_time) is required"}
+
+    where_clauses = []
+    params = {"ctype": curve_type.upper(), "limit": limit}
+    bind_params = []
+    if id_list:
+        where_clauses.append("id IN :ids")
+        params["ids"] = id_list
+        bind_params.append(bindparam("ids", expanding=True))
+    if program_id:
+        where_clauses.append("program_id = :program_id")
+        params["program_id"] = program_id
+    if device_name:
+        where_clauses.append("device_name = :device_name")
+        params["device_name"] = device_name
+    if start_time:
+        where_clauses.append("start_time >= :start_time")
+        params["start_time"] = start_time
+    if end_time:
+        where_clauses.append("start_time < :end_time")
+        params["end_time"] = end_time
+
+    step_sql = ""
+    if step is not None:
+        step_sql = "AND c.step = :step"
+        params["step"] = step
+
+    query = text(f"""
+        WITH picked AS (
+            SELECT id, device_name, result_status, start_time
+            FROM biz.result
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY start_time DESC
+            LIMIT :limit
+        )
+        SELECT p.id, p.device_name, p.result_status, p.start_time, c.step, c.data_points
+        FROM picked p
+        JOIN biz.curve c ON c.result_id = p.id AND c.curve_type = :ctype {step_sql}
+        ORDER BY p.start_time, p.id, c.step
+    """).bindparams(*bind_params)
+
+    with engine.connect() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    # One curve per (step, result); steps are never concatenated
+    by_step = {}
+    for row in rows:
+        if not row[5] or not row[5].get("x") or not row[5].get("y"):
+            continue
+        by_step.setdefault(row[4], []).append({
+            "result_id": row[0],
+            "device_name": row[1],
+            "result_status": row[2],
+            "start_time": row[3].isoformat() if row[3] else None,
+            "x": row[5]["x"],
+            "y": row[5]["y"]
+        })
+
+    steps = []
+    for step_index in sorted(by_step):
+        curves = by_step[step_index]
+        grid = make_grid(min(min(c["x"]) for c in curves), max(max(c["x"]) for c in curves), width)
+        aligned = []
+        for c in curves:
+            c["y"] = resample_linear(c.pop("x"), c["y"], grid)
+            aligned.append(c["y"])
+        steps.append({
+            "step": step_index,
+            "grid": grid,
+            "results": curves,
+            "stats": band_stats(aligned)
+        })
+
+    return {"curve_type": params["ctype"], "steps": steps}
+
+
+SPC_DEFAULT_WINDOW = timedelta(days=7)  # /api/spc window when start_time is not given
+
+
+def spc_window(start_time, end_time):
+    end_time = end_time or datetime.now()
+    return start_time or end_time - SPC_DEFAULT_WINDOW, end_time
+
+
+def load_spc_buckets(program_id, parameter_type, step_index, device_name, start_time, end_time):
+    """
+    biz.spc_bucket rows of one series in [start_time, end_time), merged across
+    devices per hour when device_name is not given.
+    Returns ([(bucket_start, Moments)], latest {target_value, upper_limit, lower_limit}).
+    """
+    params = {"program_id": program_id, "parameter_type": parameter_type, "step_index": step_index,
+              "start_time": start_time, "end_time": end_time}
+    device_sql = ""
+    if device_name:
+        device_sql = "AND device_name = :device_name"
+        params["device_name"] = device_name
+    query = text(f"""
+        SELECT bucket_start, n, mean, m2, min_value, max_value, nok_count,
+               target_value, NULLIF(upper_limit, 0), NULLIF(lower_limit, 0)
+        FROM biz.spc_bucket
+        WHERE program_id = :program_id AND parameter_type = :parameter_type
+          AND step_index = :step_index {device_sql}
+          AND bucket_start >= :start_time AND bucket_start < :end_time
+        ORDER BY bucket_start
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    buckets = {}
+    spec = {"target_value": None, "upper_limit": None, "lower_limit": None}
+    for row in rows:
+        m = Moments(row[1], row[2], row[3], row[4], row[5], row[6])
+        if row[0] in buckets:
+            buckets[row[0]].merge(m)
+        else:
+            buckets[row[0]] = m
+        for key, value in zip(("target_value", "upper_limit", "lower_limit"), row[7:10]):
+            if value is not None:
+                spec[key] = float(value)
+    return list(buckets.items()), spec
+
+
+@app.get("/api/spc/series")
+def get_spc_series(
+    craft_type: str = None,
+    program_id: str = None,
+    device_name: str = None,
+    start_time: datetime = None,
+    end_time: datetime = None
+):
+    """
+    SPC 序列列表 (程序, 参数类型, 步骤, 设备) 及窗口内样本数/均值/NOK 数
+    - step_index = -1 为 result.key_value, 其余为 step.step_value
+    - 默认窗口: 最近 7 天
+    """
+    start_time, end_time = spc_window(start_time, end_time)
+    where_clauses = ["bucket_start >= :start_time", "bucket_start < :end_time"]
+    params = {"start_time": start_time, "end_time": end_time}
+    if craft_type:
+        where_clauses.append("craft_type = :craft_type")
+        params["craft_type"] = craft_type
+    if program_id:
+        where_clauses.append("program_id = :program_id")
+        params["program_id"] = program_id
+    if device_name:
+        where_clauses.append("device_name = :device_name")
+        params["device_name"] = device_name
+
+    query = text(f"""
+        SELECT program_id, parameter_type, step_index, device_name, max(craft_type),
+               sum(n), sum(n * mean) / sum(n), sum(nok_count), max(bucket_start)
+        FROM biz.spc_bucket
+        WHERE {" AND ".join(where_clauses)}
+        GROUP BY program_id, parameter_type, step_index, device_name
+        ORDER BY program_id, parameter_type, step_index, device_name
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    keys = ["program_id", "parameter_type", "step_index", "device_name", "craft_type",
+            "n", "mean", "nok_count", "last_bucket"]
+    items = []
+    for row in rows:
+        item = row_to_dict(row, keys)
+        item["last_bucket"] = item["last_bucket"].isoformat() if item["last_bucket"] else None
+        items.append(item)
+    return {"start_time": start_time.isoformat(), "end_time": end_time.isoformat(), "items": items}
+
+
+@app.get("/api/spc/capability")
+def get_spc_capability(
+    program_id: str,
+    parameter_type: str = "DEFAULT",
+    step_index: int = RESULT_STEP,
+    device_name: str = None,
+    start_time: datetime = None,
+    end_time: datetime = None,
+    usl: float = None,
+    lsl: float = None
+):
+    """
+    过程能力 Cp/Cpk (组内 sigma) 与 Pp/Ppk (整体 sigma)
+    - 规格限默认取 biz.program 最近的 upper_limit/lower_limit, 可用 usl/lsl 覆盖
+    - device_name 不传时合并该程序所有设备
+    """
+    start_time, end_time = spc_window(start_time, end_time)
+    buckets, spec = load_spc_buckets(program_id, parameter_type, step_index, device_name, start_time, end_time)
+    usl = usl if usl is not None else spec["upper_limit"]
+    lsl = lsl if lsl is not None else spec["lower_limit"]
+
+    overall = Moments()
+    for _, m in buckets:
+        overall.merge(m)
+    sigma_within = pooled_sigma([m for _, m in buckets])
+
+    return {
+        "program_id": program_id,
+        "parameter_type": parameter_type,
+        "step_index": step_index,
+        "device_name": device_name,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+        "n": overall.n,
+        "nok_count": overall.nok,
+        "mean": overall.mean if overall.n else None,
+        "std_overall": overall.std,
+        "std_within": sigma_within,
+        "min": overall.min,
+        "max": overall.max,
+        "target_value": spec["target_value"],
+        "usl": usl,
+        "lsl": lsl,
+        **capability(overall, sigma_within, usl, lsl)
+    }
+
+
+@app.get("/api/spc/chart")
+def get_spc_chart(
+    program_id: str,
+    parameter_type: str = "DEFAULT",
+    step_index: int = RESULT_STEP,
+    device_name: str = None,
+    start_time: datetime = None,
+    end_time: datetime = None
+):
+    """
+    X-bar 控制图 (每小时一个子组) 与漂移检测
+    - 每点: 均值/标准差/样本数及随样本数变化的 UCL/LCL
+    - violations: Nelson 规则 1 (超 3 sigma), 2 (连续 9 点同侧), 3 (连续 6 点单调); drift = 规则 2 或 3
+    """
+    start_time, end_time = spc_window(start_time, end_time)
+    buckets, spec = load_spc_buckets(program_id, parameter_type, step_index, device_name, start_time, end_time)
+    return {
+        "program_id": program_id,
+        "parameter_type": parameter_type,
+        "step_index": step_index,
+        "device_name": device_name,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+        "usl": spec["upper_limit"],
+        "lsl": spec["lower_limit"],
+        "target_value": spec["target_value"],
+        **control_chart(buckets)
+    }
+
 
 @app.get("/api/alarms")
 def get_alarms(
@@ -979,33 +1776,6 @@ def get_points(structure_id: int = None, plc_id: int = None):
 
 
 
-@app.post("/api/proxy/timeseries")
-async def proxy_timeseries(request: Request):
-    """
-    Proxy time-series request to external IoT platform (Realtime Value)
-    Target: .../queryCurrentRawValueByUri
-    """
-    try:
-        data = await request.json()
-        if not data:
-            return {"code": "400", "msg": "Empty body"}
-        
-        target_url = "https://bff-model-product-infra-system.iot-2f.seres.cn/bff/aggquery/v2/query/v2/queryCurrentRawValueByUri"
-        
-        async with httpx.AsyncClient(verify=False) as client:
-            resp = await client.post(target_url, json=data, headers={"Content-Type": "application/json"}, timeout=5.0)
-            if resp.status_code == 200:
-                # print(f"✅ Proxy success: {resp.json().get('code')}")
-                return resp.json()
-            else:
-                print(f"❌ Proxy failed: {resp.status_code} - {resp.text}")
-                return {"code": str(resp.status_code), "msg": "Upstream error"}
-                
-    except Exception as e:
-        print(f"❌ Proxy exception: {e}")
-        return {"code": "500", "msg": str(e)}
-
-
 @app.post("/api/proxy/timeseries/history")
 async def proxy_timeseries_history(request: Request):
     """
@@ -1018,17 +1788,12 @@ async def proxy_timeseries_history(request: Request):
         if not data:
             return {"code": "400", "msg": "Empty body"}
         
-        target_url = "https://bff-model-product-infra-system.iot-2f.seres.cn/bff/aggquery/v2/query/v2/queryHistoryRawValueByUri"
-        
-        async with httpx.AsyncClient(verify=False) as client:
-            resp = await client.post(target_url, json=data, headers={"Content-Type": "application/json"}, timeout=30.0)
-            if resp.status_code == 200:
-                print(f"✅ History Proxy success: {resp.json().get('code')}")
-                return resp.json()
-            else:
-                print(f"❌ History Proxy failed: {resp.status_code} - {resp.text}")
-                return {"code": str(resp.status_code), "msg": "Upstream error"}
-                
+        result = await timeseries_history.post(TIMESERIES_HISTORY_API_URL, data, ttl=TIMESERIES_HISTORY_CACHE_TTL)
+        print(f"✅ History Proxy success: {result.get('code')}")
+        return result
+    except UpstreamError as e:
+        print(f"❌ History Proxy failed: {e.status_code} - {e.body}")
+        return {"code": str(e.status_code), "msg": "Upstream error"}
     except Exception as e:
         print(f"❌ History Proxy exception: {e}")
         return {"code": "500", "msg": str(e)}
@@ -1039,4 +1804,5 @@ if __name__ == "__main__":
     print("🚀 Starting BIZ Dashboard API Server with WebSocket...")
     print("📖 API Docs: http://localhost:8000/docs")
     print("🔌 WebSocket: ws://localhost:8000/ws/device/{device_id}")
+    print("🔔 Result push: ws://localhost:8000/ws/results?device_name=&craft_type=&structure_id=")
     uvicorn.run(app, host="0.0.0.0", port=8000)
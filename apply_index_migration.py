@@ -0,0 +1,18 @@
+import argparse
+from etl_core.common.db import create_db_engine
+from etl_core.common.indexes import apply_indexes
+
+# Creates the indexes listed in etl_core/common/indexes.py (CONCURRENTLY, safe on a live database)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply biz.* query indexes")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the statements")
+    args = parser.parse_args()
+
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    try:
+        apply_indexes(engine, dry_run=args.dry_run)
+        print("✅ Index migration successful!")
+    except Exception as e:
+        print(f"❌ Index migration failed: {e}")
+        raise
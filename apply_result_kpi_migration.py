@@ -0,0 +1,82 @@
+import argparse
+from sqlalchemy import text
+from etl_core.common.db import create_db_engine
+from etl_core.common.indexes import INDEXES, apply_indexes
+
+# Creates biz.result_kpi (typed projection of extension.extra_data, see init_db.sql)
+# and its indexes, optionally backfilling it from the extra_data already stored.
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS "biz"."result_kpi" (
+  "result_id" int8 PRIMARY KEY,
+  "start_time" timestamp(6) NOT NULL,
+  "craft_type" varchar(64),
+  "final_force" numeric(10,3),
+  "final_stroke" numeric(10,3),
+  "start_distance" numeric(10,3),
+  "end_distance" numeric(10,3),
+  "velocity" numeric(10,3),
+  "force_limit_high" numeric(10,3),
+  "force_limit_low" numeric(10,3),
+  "stroke_limit_high" numeric(10,3),
+  "stroke_limit_low" numeric(10,3)
+)
+"""
+
+BACKFILL = text("""
+    INSERT INTO biz.result_kpi (result_id, start_time, craft_type, final_force, final_stroke,
+                                start_distance, end_distance, velocity,
+                                force_limit_high, force_limit_low, stroke_limit_high, stroke_limit_low)
+    SELECT r.id, r.start_time, r.craft_type,
+           (e.extra_data->>'final_force')::numeric,
+           (e.extra_data->>'final_stroke')::numeric,
+           (e.extra_data->>'start_distance')::numeric,
+           (e.extra_data->>'end_distance')::numeric,
+           (e.extra_data->>'velocity')::numeric,
+           (e.extra_data #>> '{parameter_limits,Final Force,limit_high}')::numeric,
+           (e.extra_data #>> '{parameter_limits,Final Force,limit_low}')::numeric,
+           (e.extra_data #>> '{parameter_limits,Final Stroke,limit_high}')::numeric,
+           (e.extra_data #>> '{parameter_limits,Final Stroke,limit_low}')::numeric
+    FROM biz.result r
+    JOIN biz.extension e ON e.result_id = r.id
+    WHERE r.id > :first_id AND r.id <= :last_id
+      AND e.extra_data ? 'final_force'
+    ON CONFLICT (result_id) DO NOTHING
+""")
+
+
+def backfill(engine, chunk):
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT max(id) FROM biz.result")).scalar() or 0
+    first_id = 0
+    total = 0
+    while first_id < max_id:
+        last_id = first_id + chunk
+        with engine.begin() as conn:
+            added = conn.execute(BACKFILL, {"first_id": first_id, "last_id": last_id}).rowcount
+        total += added
+        print(f"  result id ({first_id}, {last_id}]: +{added} rows")
+        first_id = last_id
+    print(f"✅ Backfilled {total} result KPI rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and backfill biz.result_kpi")
+    parser.add_argument("--backfill", action="store_true", help="Project the extra_data of already loaded results")
+    parser.add_argument("--chunk", type=int, default=10000, help="Result ids per backfill transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the index statements")
+    args = parser.parse_args()
+
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    try:
+        if not args.dry_run:
+            with engine.begin() as conn:
+                conn.execute(text(CREATE_TABLE))
+            print("✅ biz.result_kpi ready")
+        apply_indexes(engine, [i for i in INDEXES if i["table"] == "biz.result_kpi"], dry_run=args.dry_run)
+        if args.backfill and not args.dry_run:
+            backfill(engine, args.chunk)
+        print("✅ Result KPI migration successful!")
+    except Exception as e:
+        print(f"❌ Result KPI migration failed: {e}")
+        raise
@@ -0,0 +1,64 @@
+import argparse
+from sqlalchemy import text
+from etl_core.common.db import create_db_engine
+from etl_core.common.indexes import INDEXES, apply_indexes
+
+# Adds the unique source key uq_result_source (source_id, craft_type, start_time)
+# to biz.result, which BizWriter inserts against with ON CONFLICT DO NOTHING.
+# Concurrent SPR workers used to load the same source id twice, so duplicates
+# must be removed (--dedup) before the unique index can be built.
+
+DUPLICATES = text("""
+    SELECT id FROM (
+        SELECT id, row_number() OVER (PARTITION BY source_id, craft_type, start_time ORDER BY id) AS rn
+        FROM biz.result
+        WHERE source_id IS NOT NULL
+    ) d
+    WHERE rn > 1
+    ORDER BY id
+""")
+
+# Child tables first, biz.result last
+CHILD_TABLES = ["biz.alarm", "biz.curve", "biz.step_kpi", "biz.step", "biz.result_kpi", "biz.extension"]
+
+
+def dedup(engine, chunk, dry_run):
+    with engine.connect() as conn:
+        ids = [r[0] for r in conn.execute(DUPLICATES)]
+    print(f"  {len(ids)} duplicate biz.result rows (the lowest id per source record is kept)")
+    if dry_run or not ids:
+        return len(ids)
+    for i in range(0, len(ids), chunk):
+        part = ids[i:i + chunk]
+        with engine.begin() as conn:
+            for table in CHILD_TABLES:
+                conn.execute(text(f"DELETE FROM {table} WHERE result_id = ANY(:ids)"), {"ids": part})
+            conn.execute(text("DELETE FROM biz.result WHERE id = ANY(:ids)"), {"ids": part})
+        print(f"  deleted {i + len(part)}/{len(ids)}")
+    return len(ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplicate biz.result and add its unique source key")
+    parser.add_argument("--dedup", action="store_true", help="Delete duplicate results (and their rows in child tables) first")
+    parser.add_argument("--chunk", type=int, default=1000, help="Results deleted per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Only count duplicates and print the index statements")
+    args = parser.parse_args()
+
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    try:
+        if args.dedup:
+            removed = dedup(engine, args.chunk, args.dry_run)
+            if removed:
+                print("  ⚠️ biz.spc_bucket still counts the duplicates: "
+                      "stop the ETL and run apply_spc_migration.py --backfill --rebuild")
+        apply_indexes(engine, [i for i in INDEXES if i["name"] == "uq_result_source"], dry_run=args.dry_run)
+        # Superseded by the unique index (same leading columns)
+        print("  DROP INDEX IF EXISTS biz.idx_result_source;")
+        if not args.dry_run:
+            with engine.begin() as conn:
+                conn.execute(text("DROP INDEX IF EXISTS biz.idx_result_source"))
+        print("✅ Result source key migration successful!")
+    except Exception as e:
+        print(f"❌ Result source key migration failed: {e}")
+        raise
@@ -0,0 +1,120 @@
+import argparse
+from sqlalchemy import text
+from etl_core.common.db import create_db_engine
+from etl_core.common.indexes import INDEXES, apply_indexes
+from etl_core.common.spc import SPC_COLUMNS, MERGE_SQL
+
+# Creates biz.spc_bucket (hourly Welford moments per SPC series, see init_db.sql
+# and etl_core/common/spc.py) and its indexes, optionally backfilling it from
+# the results loaded before the ETL maintained it.
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS "biz"."spc_bucket" (
+  "program_id" varchar(64) NOT NULL,
+  "parameter_type" varchar(64) NOT NULL,
+  "step_index" int4 NOT NULL,
+  "device_name" varchar(64) NOT NULL,
+  "bucket_start" timestamp(6) NOT NULL,
+  "craft_type" varchar(64),
+  "n" int8 NOT NULL,
+  "mean" float8 NOT NULL,
+  "m2" float8 NOT NULL,
+  "min_value" float8,
+  "max_value" float8,
+  "nok_count" int8 NOT NULL DEFAULT 0,
+  "target_value" numeric(10,2),
+  "upper_limit" numeric(10,2),
+  "lower_limit" numeric(10,2),
+  "update_time" timestamp(6) DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY ("program_id", "parameter_type", "step_index", "device_name", "bucket_start")
+)
+"""
+
+# Same series as spc.record_rows(): result.key_value (step -1) and step values;
+# FDS steps without single results only hold a 0.0 placeholder and are skipped,
+# 0.0 program limits are missing limits (spc.spec_limit).
+# Each chunk is aggregated in SQL and merged into existing buckets with MERGE_SQL.
+BACKFILL = text(f"""
+    WITH obs AS (
+        SELECT r.program_id, p.parameter_type, -1 AS step_index, r.device_name, r.start_time, r.craft_type,
+               r.key_value::float8 AS v, r.result_status = 0 AS nok,
+               p.target_value, NULLIF(p.upper_limit, 0) AS upper_limit, NULLIF(p.lower_limit, 0) AS lower_limit
+        FROM biz.result r
+        LEFT JOIN biz.program p ON p.id = r.program_ver_id
+        WHERE r.id > :first_id AND r.id <= :last_id AND r.key_value IS NOT NULL
+        UNION ALL
+        SELECT r.program_id, p.parameter_type, st.step_index, r.device_name, r.start_time, r.craft_type,
+               st.step_value::float8, st.step_result = 0,
+               st.target_value, NULL, NULL
+        FROM biz.result r
+        JOIN biz.step st ON st.result_id = r.id
+        LEFT JOIN biz.program p ON p.id = r.program_ver_id
+        WHERE r.id > :first_id AND r.id <= :last_id AND st.step_value IS NOT NULL
+          AND (r.craft_type <> 'FDS_DEFAULT' OR EXISTS (
+              SELECT 1 FROM biz.step_kpi k WHERE k.result_id = r.id AND k.step_index = st.step_index))
+    )
+    INSERT INTO biz.spc_bucket AS s ({", ".join(SPC_COLUMNS)})
+    SELECT COALESCE(program_id, ''), COALESCE(parameter_type, 'DEFAULT'), step_index, COALESCE(device_name, ''),
+           date_trunc('hour', start_time), max(craft_type),
+           count(*), avg(v), COALESCE(var_pop(v) * count(*), 0), min(v), max(v), count(*) FILTER (WHERE nok),
+           max(target_value), max(upper_limit), max(lower_limit)
+    FROM obs
+    GROUP BY 1, 2, 3, 4, 5
+    {MERGE_SQL}
+""")
+
+
+def backfill(engine, chunk, until_id=None):
+    """
+    Merge results with id <= until_id (None: all, only on an emptied table);
+    results the ETL wrote after the table existed are already counted.
+    """
+    with engine.connect() as conn:
+        max_id = until_id if until_id is not None else conn.execute(text("SELECT max(id) FROM biz.result")).scalar() or 0
+    first_id = 0
+    total = 0
+    while first_id < max_id:
+        last_id = min(first_id + chunk, max_id)
+        with engine.begin() as conn:
+            merged = conn.execute(BACKFILL, {"first_id": first_id, "last_id": last_id}).rowcount
+        total += merged
+        print(f"  result id ({first_id}, {last_id}]: {merged} buckets")
+        first_id = last_id
+    print(f"✅ Merged {total} SPC bucket rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and backfill biz.spc_bucket")
+    parser.add_argument("--backfill", action="store_true", help="Aggregate already loaded results (run once)")
+    parser.add_argument("--until-id", type=int, default=None,
+                        help="Last result id to backfill: the last id loaded before the ETL started "
+                             "maintaining biz.spc_bucket, so no result is counted twice")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="With --backfill: empty biz.spc_bucket first and backfill all results (stop the ETL)")
+    parser.add_argument("--chunk", type=int, default=10000, help="Result ids per backfill transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the index statements")
+    args = parser.parse_args()
+    if args.backfill and args.until_id is None and not args.rebuild:
+        # The merge is additive: defaulting to max(id) would count the results the ETL already merged twice
+        parser.error("--backfill needs --until-id (last result id loaded before the ETL maintained "
+                     "biz.spc_bucket) or --rebuild")
+    if args.rebuild and args.until_id is not None:
+        parser.error("--rebuild backfills all results, --until-id would leave the newer ones out")
+
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    try:
+        if not args.dry_run:
+            with engine.begin() as conn:
+                conn.execute(text(CREATE_TABLE))
+            print("✅ biz.spc_bucket ready")
+        apply_indexes(engine, [i for i in INDEXES if i["table"] == "biz.spc_bucket"], dry_run=args.dry_run)
+        if args.backfill and not args.dry_run:
+            if args.rebuild:
+                with engine.begin() as conn:
+                    conn.execute(text("TRUNCATE TABLE biz.spc_bucket"))
+                print("  biz.spc_bucket emptied")
+            backfill(engine, args.chunk, args.until_id)
+        print("✅ SPC migration successful!")
+    except Exception as e:
+        print(f"❌ SPC migration failed: {e}")
+        raise
@@ -0,0 +1,74 @@
+import argparse
+from sqlalchemy import text
+from etl_core.common.db import create_db_engine
+from etl_core.common.indexes import INDEXES, apply_indexes
+
+# Creates biz.step_kpi (typed per-step KPIs, see init_db.sql) and its indexes,
+# optionally backfilling it for FDS results loaded before the table existed.
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS "biz"."step_kpi" (
+  "result_id" int8 NOT NULL,
+  "step_index" int4 NOT NULL,
+  "kpi_type" int4 NOT NULL,
+  "value" numeric(12,4) NOT NULL,
+  "result_index" int4,
+  "start_time" timestamp(6) NOT NULL
+)
+"""
+
+BACKFILL = text("""
+    INSERT INTO biz.step_kpi (result_id, step_index, kpi_type, value, result_index, start_time)
+    SELECT r.id, s.step, s.type, s.value, s.resultindex, r.start_time
+    FROM biz.result r
+    JOIN origin.bs_fds_singleresult s ON s.resultlistid = r.source_id
+    WHERE r.craft_type = 'FDS_DEFAULT' AND r.id > :first_id AND r.id <= :last_id
+      AND s.value IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM biz.step_kpi k WHERE k.result_id = r.id)
+""")
+
+# The pipeline no longer writes the list into extension.extra_data
+STRIP_EXTENSION = text("""
+    UPDATE biz.extension SET extra_data = extra_data - 'single_results'
+    WHERE result_id > :first_id AND result_id <= :last_id AND extra_data ? 'single_results'
+""")
+
+
+def backfill(engine, chunk, strip_extension):
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT max(id) FROM biz.result WHERE craft_type = 'FDS_DEFAULT'")).scalar() or 0
+    first_id = 0
+    total = 0
+    while first_id < max_id:
+        last_id = first_id + chunk
+        with engine.begin() as conn:
+            added = conn.execute(BACKFILL, {"first_id": first_id, "last_id": last_id}).rowcount
+            if strip_extension:
+                conn.execute(STRIP_EXTENSION, {"first_id": first_id, "last_id": last_id})
+        total += added
+        print(f"  result id ({first_id}, {last_id}]: +{added} KPIs")
+        first_id = last_id
+    print(f"✅ Backfilled {total} KPIs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and backfill biz.step_kpi")
+    parser.add_argument("--backfill", action="store_true", help="Fill biz.step_kpi for already loaded FDS results")
+    parser.add_argument("--strip-extension", action="store_true", help="With --backfill: drop single_results from extension.extra_data")
+    parser.add_argument("--chunk", type=int, default=10000, help="Result ids per backfill transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the index statements")
+    args = parser.parse_args()
+
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    try:
+        if not args.dry_run:
+            with engine.begin() as conn:
+                conn.execute(text(CREATE_TABLE))
+            print("✅ biz.step_kpi ready")
+        apply_indexes(engine, [i for i in INDEXES if i["table"] == "biz.step_kpi"], dry_run=args.dry_run)
+        if args.backfill and not args.dry_run:
+            backfill(engine, args.chunk, args.strip_extension)
+        print("✅ Step KPI migration successful!")
+    except Exception as e:
+        print(f"❌ Step KPI migration failed: {e}")
+        raise
@@ -0,0 +1,190 @@
+"""
+Microbenchmarks for the curve decode / serialize hot path.
+
+Covers parse_fds_curve, parse_spr_curve, generate_time_axis and the
+data_points JSON built by both pipelines (fds.build_step_curves,
+spr.build_curve_payload) on fixtures of realistic blob sizes. Reports
+ns/frame (or ns/point), serialize MB/s and peak allocations (tracemalloc).
+
+Golden check: every fixture's parsed values and data_points text are
+hashed and compared with benchmarks/golden/curve_payloads.json, so a new
+fast path must produce byte-identical payloads. Regenerate the golden file
+only when the stored format is meant to change (--update-golden).
+
+    python -m benchmarks.curve_decode --output decode_new.json --compare decode_old.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import timeit
+import tracemalloc
+
+from etl_core.pipelines.fds import parse_fds_curve, build_step_curves
+from etl_core.pipelines.spr import parse_spr_curve, generate_time_axis, build_curve_payload
+from benchmarks.sources import fds_blob, spr_graph
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "curve_payloads.json")
+
+# name -> (kind, size); FDS sizes are frames, SPR sizes are float32 points
+FIXTURES = {
+    "fds_600": ("fds", 600),
+    "fds_3000": ("fds", 3000),
+    "spr_1000": ("spr", 1000),
+    "spr_5000": ("spr", 5000),
+}
+FDS_STEPS = 4
+FDS_DURATION = 2.5
+SPR_CYCLE_TIME = 1.8
+
+
+def fds_payloads(parsed, duration):
+    """data_points texts for one FDS record, step by step as FdsPipeline.process_item does"""
+    points_by_step = {}
+    for p in parsed:
+        points_by_step.setdefault(p['step'], []).append(p)
+    time_per_pt = duration / len(parsed) if parsed else 0
+    out = []
+    current_pt_idx = 0
+    for s_num in sorted(points_by_step):
+        pts = points_by_step[s_num]
+        out.extend(build_step_curves(pts, current_pt_idx, time_per_pt))
+        current_pt_idx += len(pts)
+    return out
+
+
+def make_fixture(kind, size):
+    if kind == "fds":
+        return fds_blob(size, FDS_STEPS, seed=0)
+    return spr_graph(size, 'Force/Time', seed=0)
+
+
+def cases(name, kind, size, blob):
+    """name -> (callable, units processed per call, output bytes per call or None)"""
+    if kind == "fds":
+        parsed = parse_fds_curve(blob)
+        out_bytes = sum(len(d) for _, d in fds_payloads(parsed, FDS_DURATION))
+        return {
+            f"{name}/decode": (lambda: parse_fds_curve(blob), size, None),
+            f"{name}/serialize": (lambda: fds_payloads(parsed, FDS_DURATION), size, out_bytes),
+            f"{name}/end_to_end": (lambda: fds_payloads(parse_fds_curve(blob), FDS_DURATION), size, out_bytes),
+        }
+    values = parse_spr_curve(blob)
+    out_bytes = len(build_curve_payload(values, SPR_CYCLE_TIME))
+    return {
+        f"{name}/decode": (lambda: parse_spr_curve(blob), size, None),
+        f"{name}/time_axis": (lambda: generate_time_axis(size, SPR_CYCLE_TIME), size, None),
+        f"{name}/serialize": (lambda: build_curve_payload(values, SPR_CYCLE_TIME), size, out_bytes),
+        f"{name}/end_to_end": (lambda: build_curve_payload(parse_spr_curve(blob), SPR_CYCLE_TIME), size, out_bytes),
+    }
+
+
+def measure(fn, units, out_bytes, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "us_per_call": round(best * 1e6, 2),
+        "ns_per_unit": round(best * 1e9 / units, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+    if out_bytes:
+        result["mb_per_s"] = round(out_bytes / best / 1e6, 1)
+    return result
+
+
+def golden_digests():
+    """sha256 of parsed values and data_points text per fixture"""
+    digests = {}
+    for name, (kind, size) in FIXTURES.items():
+        blob = make_fixture(kind, size)
+        if kind == "fds":
+            parsed = parse_fds_curve(blob)
+            payloads = fds_payloads(parsed, FDS_DURATION)
+        else:
+            parsed = parse_spr_curve(blob)
+            payloads = [("FORCE", build_curve_payload(parsed, SPR_CYCLE_TIME))]
+        h_parsed = hashlib.sha256(json.dumps(parsed).encode()).hexdigest()
+        h_payloads = hashlib.sha256("\n".join(f"{t}:{d}" for t, d in payloads).encode()).hexdigest()
+        digests[name] = {"parsed": h_parsed, "data_points": h_payloads, "curves": len(payloads)}
+    return digests
+
+
+def check_golden(update):
+    digests = golden_digests()
+    if update or not os.path.exists(GOLDEN_FILE):
+        os.makedirs(os.path.dirname(GOLDEN_FILE), exist_ok=True)
+        with open(GOLDEN_FILE, "w", encoding="utf-8") as f:
+            json.dump(digests, f, indent=2)
+        print(f"💾 Golden digests written to {GOLDEN_FILE}")
+        return True
+    with open(GOLDEN_FILE, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    ok = True
+    for name, digest in digests.items():
+        if golden.get(name) != digest:
+            print(f"❌ {name}: output differs from golden ({golden.get(name)} != {digest})")
+            ok = False
+    if ok:
+        print(f"✅ Golden output matches for {len(digests)} fixtures")
+    return ok
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Curve decode / serialize microbenchmarks")
+    parser.add_argument("--only", help="Comma-separated fixture names")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--compare", help="Previous --output to diff against")
+    parser.add_argument("--update-golden", action="store_true")
+    args = parser.parse_args()
+
+    if not check_golden(args.update_golden):
+        raise SystemExit(1)
+
+    only = set(args.only.split(",")) if args.only else None
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+
+    results = {}
+    for name, (kind, size) in FIXTURES.items():
+        if only and name not in only:
+            continue
+        blob = make_fixture(kind, size)
+        unit = "frame" if kind == "fds" else "point"
+        print(f"📦 {name}: {len(blob)} byte blob ({size} {unit}s)")
+        for case, (fn, units, out_bytes) in cases(name, kind, size, blob).items():
+            r = measure(fn, units, out_bytes, args.repeat)
+            results[case] = r
+            line = f"  {case:<22} {r['ns_per_unit']:>9.1f} ns/{unit}  {r['us_per_call']:>10.1f} us  peak {r['peak_kb']:>8.1f} KB"
+            if "mb_per_s" in r:
+                line += f"  {r['mb_per_s']:>7.1f} MB/s"
+            if case in previous:
+                change = (r["ns_per_unit"] / previous[case]["ns_per_unit"] - 1) * 100
+                line += f"  ({change:+.1f}%)"
+            print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "results": results}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
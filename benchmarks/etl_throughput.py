@@ -0,0 +1,219 @@
+"""
+End-to-end ETL throughput benchmark.
+
+Runs FdsPipeline / SprPipeline against synthetic origin.* sources (see
+benchmarks/sources.py) on a local Postgres, once per combination of
+--pipelines x --batch-sizes x --workers x --modes. Each case runs in its
+own process on an empty biz schema and reports:
+
+    rec/s          biz.result rows written per wall-clock second
+    stmts/rec      SQL statements sent per record
+    db ms/rec      client-observed statement time per record (all threads)
+    cpu s          user + system CPU of the pipeline process
+    rss MB         peak resident set size of the pipeline process
+
+    ETL_DB_HOST=127.0.0.1 ETL_DB_PORT=5432 ETL_DB_NAME=etl_bench \
+        python -m benchmarks.etl_throughput --setup --fds 5000 --spr 5000
+    python -m benchmarks.etl_throughput --batch-sizes 200,2000 --workers 4,10,20 --output etl.json
+    python -m benchmarks.etl_throughput --modes default,no_events --workers 20   # NOTIFY cost
+"""
+import argparse
+import contextlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+
+from etl_core.common.db import create_db_engine
+from benchmarks import synthetic
+from benchmarks.sources import load_sources
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PIPELINES = {
+    "FDS": ("etl_core.pipelines.fds", "FdsPipeline", "FDS_DEFAULT"),
+    "SPR": ("etl_core.pipelines.spr", "SprPipeline", "SPR"),
+}
+
+# name -> callable(pipeline) applied before run(); add entries as pipelines grow run modes
+MODES = {
+    "default": lambda pipeline: None,
+    # default without the per-record dashboard NOTIFY: the difference to "default" is its cost
+    "no_events": lambda pipeline: pipeline.set_event_publishing("off"),
+    # head/tail cursors from the first batch: the head starts one batch below the source head
+    "dual": lambda pipeline: pipeline.enable_dual_cursor(lag_threshold=0),
+    # one server-side cursor over the whole source, batch_size rows per chunk
+    "stream": lambda pipeline: pipeline.enable_streaming(),
+    # FDS only: batches read from the base tables / a local copy instead of the view
+    "base": lambda pipeline: pipeline.use_source("base"),
+    "local": lambda pipeline: pipeline.use_source("local"),
+}
+
+BIZ_TABLES = "biz.result, biz.curve, biz.step, biz.step_kpi, biz.alarm, biz.extension, biz.result_kpi, biz.spc_bucket, biz.program"
+
+
+def setup(args):
+    synthetic.check_target(args.allow_remote)
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    print("1. Creating biz schema...")
+    with engine.begin() as conn:
+        synthetic.init_schema(conn)
+        span = timedelta(seconds=max(args.fds, args.spr) * 5)
+        synthetic.create_partitions(conn, datetime.now() - span, datetime.now() + timedelta(days=31))
+    print("2. Loading sources...")
+    load_sources(engine, args.fds, args.spr, args.fds_frames, args.fds_steps, args.spr_points)
+
+
+def reset_biz(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {BIZ_TABLES} RESTART IDENTITY"))
+
+
+def count_results(engine, craft_type):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM biz.result WHERE craft_type = :craft"),
+                            {"craft": craft_type}).scalar()
+
+
+def instrument(engine):
+    """Count statements and client-side execute time on every pooled connection"""
+    stats = {"statements": 0, "db_time": 0.0}
+    lock = threading.Lock()
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._bench_t0 = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._bench_t0
+        with lock:
+            stats["statements"] += 1
+            stats["db_time"] += elapsed
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+    return stats
+
+
+def run_case(case, verbose, queue):
+    """Child process: run one pipeline configuration to exhaustion"""
+    module_name, class_name, _ = PIPELINES[case["pipeline"]]
+    PipelineClass = getattr(importlib.import_module(module_name), class_name)
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = PipelineClass(
+            checkpoint_file=os.path.join(tmp, "checkpoint.json"),
+            batch_size=case["batch_size"], workers=case["workers"], limit=case["limit"]
+        )
+        MODES[case["mode"]](pipeline)
+        stats = instrument(pipeline.engine)
+
+        cpu0 = time.process_time()
+        t0 = time.perf_counter()
+        with open(os.devnull, "w") as devnull, \
+                (contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull)):
+            pipeline.run(resume=False, loop_interval=None, start_autoindex=0)
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+        with open(pipeline.checkpoint_file) as f:
+            checkpoint = json.load(f)
+        pipeline.engine.dispose()
+
+    queue.put({
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+        "statements": stats["statements"],
+        "db_time_s": stats["db_time"],
+        "failed": checkpoint.get("fail_count", 0),
+    })
+
+
+def benchmark(case, engine, verbose):
+    reset_biz(engine)
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=run_case, args=(case, verbose, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+
+    records = count_results(engine, PIPELINES[case["pipeline"]][2])
+    per_rec = max(records, 1)
+    return dict(
+        case,
+        records=records,
+        failed=result["failed"],
+        rec_per_s=round(records / result["wall_s"], 1) if result["wall_s"] else 0,
+        statements_per_record=round(result["statements"] / per_rec, 2),
+        db_ms_per_record=round(result["db_time_s"] * 1000 / per_rec, 3),
+        wall_s=round(result["wall_s"], 2),
+        cpu_s=round(result["cpu_s"], 2),
+        rss_mb=round(result["rss_mb"], 1) if result["rss_mb"] else None,
+    )
+
+
+def parse_list(value, cast=str):
+    return [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FDS/SPR pipeline throughput on synthetic sources")
+    parser.add_argument("--setup", action="store_true", help="Rebuild biz + origin.* sources first")
+    parser.add_argument("--fds", type=int, default=5000, help="FDS source records (with --setup)")
+    parser.add_argument("--spr", type=int, default=5000, help="SPR source records (with --setup)")
+    parser.add_argument("--fds-frames", type=int, default=600, help="40-byte frames per FDS curve blob")
+    parser.add_argument("--fds-steps", type=int, default=4)
+    parser.add_argument("--spr-points", type=int, default=1000, help="float32 points per SPR graph")
+    parser.add_argument("--allow-remote", action="store_true")
+    parser.add_argument("--pipelines", default="FDS,SPR")
+    parser.add_argument("--batch-sizes", default="200")
+    parser.add_argument("--workers", default="10")
+    parser.add_argument("--modes", default="default", help=f"Any of: {', '.join(MODES)}")
+    parser.add_argument("--limit", type=int, help="Stop each run after this many source rows")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline output")
+    args = parser.parse_args()
+
+    if args.setup:
+        setup(args)
+
+    synthetic.check_target(args.allow_remote)
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    cases = [
+        {"pipeline": p, "batch_size": b, "workers": w, "mode": m, "limit": args.limit}
+        for p, b, w, m in itertools.product(
+            parse_list(args.pipelines), parse_list(args.batch_sizes, int),
+            parse_list(args.workers, int), parse_list(args.modes)
+        )
+    ]
+    for case in cases:
+        if case["pipeline"] not in PIPELINES or case["mode"] not in MODES:
+            parser.error(f"Unknown pipeline/mode in {case}")
+
+    print(f"{'pipeline':<8} {'batch':>6} {'workers':>7} {'mode':<10} {'records':>8} {'rec/s':>8} "
+          f"{'stmts/rec':>9} {'db ms/rec':>9} {'cpu s':>7} {'rss MB':>7}")
+    results = []
+    for case in cases:
+        r = benchmark(case, engine, args.verbose)
+        results.append(r)
+        fail = f"  ⚠️ {r['failed']} failed" if r["failed"] else ""
+        print(f"{r['pipeline']:<8} {r['batch_size']:>6} {r['workers']:>7} {r['mode']:<10} {r['records']:>8} "
+              f"{r['rec_per_s']:>8.1f} {r['statements_per_record']:>9.2f} {r['db_ms_per_record']:>9.3f} "
+              f"{r['cpu_s']:>7.2f} {r['rss_mb'] or 0:>7.1f}{fail}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Query-plan regression harness for the API server (and the pipelines' biz lookups).
+
+Every scenario calls an api_server endpoint function directly; the SQL it
+sends is captured from the engine, then each statement is re-run under
+EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON). Each scenario is also timed over
+--runs iterations for p50/p95/p99.
+
+The run fails (exit 1) when, compared to --baseline:
+  - a statement starts seq-scanning a relation that holds more than
+    --seq-scan-rows rows (partitions are reported under their parent), or
+  - a scenario's p95 grows by more than --tolerance and --min-delta-ms.
+Without a baseline, --strict fails on any such seq scan.
+
+Load a dataset with benchmarks/synthetic.py first, then:
+
+    ETL_DB_HOST=127.0.0.1 ETL_DB_PORT=5432 ETL_DB_NAME=etl_bench \
+        python -m benchmarks.query_plans --baseline plans_baseline.json --update-baseline
+    ... change code / indexes ...
+    python -m benchmarks.query_plans --baseline plans_baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import event, text
+
+import api_server
+
+SPR_CHECK_EXIST = text("SELECT id FROM biz.result WHERE source_id = :sid AND craft_type = :craft")
+PROGRAM_LOOKUP = text("SELECT id FROM biz.program WHERE program_id = :pid AND version = :ver AND parameter_type = :param_type")
+
+
+def _run_sql(query, params):
+    with api_server.engine.connect() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def _drain(chunks):
+    return sum(len(c) for c in chunks)
+
+
+# name -> callable(sample); every Query() default is passed explicitly
+SCENARIOS = [
+    ("stats", lambda s: api_server.get_stats()),
+    ("results_page1", lambda s: api_server.get_results(page=1, page_size=20, craft_type=None, status=None, structure_id=None)),
+    ("results_page50", lambda s: api_server.get_results(page=50, page_size=20, craft_type=None, status=None, structure_id=None)),
+    ("results_nok", lambda s: api_server.get_results(page=1, page_size=20, craft_type=None, status=0, structure_id=None)),
+    ("results_craft", lambda s: api_server.get_results(page=1, page_size=20, craft_type="SPR", status=None, structure_id=None)),
+    ("results_force", lambda s: api_server.get_results(page=1, page_size=20, craft_type=None, status=None, structure_id=None,
+                                                        min_force=s["final_force"], max_force=s["final_force"] + 1)),
+    ("results_structure", lambda s: api_server.get_results(page=1, page_size=20, craft_type=None, status=None, structure_id=s["line_id"])),
+    ("result_detail", lambda s: api_server.get_result_detail(s["result_id"])),
+    ("result_steps", lambda s: api_server.get_result_steps(s["result_id"])),
+    ("result_curves", lambda s: api_server.get_result_curves(s["result_id"], width=None, method="lttb", curve_types=None, steps=None)),
+    ("result_curves_width", lambda s: api_server.get_result_curves(s["result_id"], width=800, method="lttb", curve_types=None, steps=None)),
+    ("result_curves_raw_json", lambda s: _drain(api_server.stream_curves_json(s["result_id"], None, None))),
+    ("result_curves_raw_f32", lambda s: _drain(api_server.stream_curves_f32(s["result_id"], None, None))),
+    ("compare_program", lambda s: api_server.compare_curves(
+        s["curve_type"], result_ids=None, program_id=s["program_id"], device_name=None,
+        start_time=None, end_time=None, step=None, width=500, limit=50)),
+    ("compare_device", lambda s: api_server.compare_curves(
+        s["curve_type"], result_ids=None, program_id=None, device_name=s["device_name"],
+        start_time=None, end_time=None, step=None, width=500, limit=50)),
+    ("spc_series", lambda s: api_server.get_spc_series(
+        craft_type=None, program_id=None, device_name=None, start_time=None, end_time=None)),
+    ("spc_capability", lambda s: api_server.get_spc_capability(
+        s["program_id"], parameter_type=s["parameter_type"], step_index=-1, device_name=None,
+        start_time=None, end_time=None, usl=None, lsl=None)),
+    ("spc_chart_device", lambda s: api_server.get_spc_chart(
+        s["program_id"], parameter_type=s["parameter_type"], step_index=-1, device_name=s["device_name"],
+        start_time=None, end_time=None)),
+    ("alarms_page1", lambda s: api_server.get_alarms(page=1, page_size=20, result_id=None, structure_id=None, limit=None)),
+    ("alarms_structure", lambda s: api_server.get_alarms(page=1, page_size=20, result_id=None, structure_id=s["line_id"], limit=None)),
+    ("alarm_hierarchy", lambda s: api_server.get_alarm_hierarchy(s["alarm_id"])),
+    ("devices", lambda s: api_server.get_devices()),
+    ("device_detail", lambda s: api_server.get_device_detail(s["device_name"])),
+    ("device_results", lambda s: api_server.get_device_results(s["device_name"], page=1, page_size=20, limit=None)),
+    ("device_alarms", lambda s: api_server.get_device_alarms(s["device_name"], page=1, page_size=20, limit=None)),
+    ("device_uris", lambda s: api_server.get_device_uris(s["device_name"])),
+    ("realtime_uri_cache", lambda s: asyncio.run(api_server.DeviceUriCache().get(s["device_names"]))),
+    ("structure_tree", lambda s: api_server.get_structure_tree()),
+    ("points_structure", lambda s: api_server.get_points(structure_id=s["line_id"], plc_id=None)),
+    ("points_plc", lambda s: api_server.get_points(structure_id=None, plc_id=s["plc_id"])),
+    ("spr_check_exist", lambda s: _run_sql(SPR_CHECK_EXIST, {"sid": s["source_id"], "craft": "SPR"})),
+    ("program_lookup", lambda s: _run_sql(PROGRAM_LOOKUP, {"pid": s["program_id"], "ver": "v1", "param_type": "DEFAULT"})),
+]
+
+
+def pick_sample():
+    """Representative ids/names taken from the loaded data"""
+    with api_server.engine.connect() as conn:
+        max_id = conn.execute(text("SELECT MAX(id) FROM biz.result")).scalar() or 0
+        result = conn.execute(text("""
+            SELECT id, device_name, program_id, source_id FROM biz.result
+            WHERE id <= :mid ORDER BY id DESC LIMIT 1
+        """), {"mid": max_id // 2}).fetchone()
+        curve_type = conn.execute(text("SELECT curve_type FROM biz.curve WHERE result_id = :rid LIMIT 1"),
+                                  {"rid": result[0]}).scalar() if result else None
+        final_force = conn.execute(text("SELECT final_force FROM biz.result_kpi WHERE result_id = :rid"),
+                                   {"rid": result[0]}).scalar() if result else None
+        parameter_type = conn.execute(text(
+            "SELECT p.parameter_type FROM biz.result r JOIN biz.program p ON p.id = r.program_ver_id WHERE r.id = :rid"),
+            {"rid": result[0]}).scalar() if result else None
+        alarm_id = conn.execute(text("SELECT MAX(id) FROM biz.alarm")).scalar()
+        line_id = conn.execute(text("SELECT MIN(id) FROM biz.structure WHERE level_type = 'LINE'")).scalar()
+        plc_id = conn.execute(text("SELECT MIN(id) FROM biz.structure WHERE level_type = 'PLC'")).scalar()
+        devices = [r[0] for r in conn.execute(text(
+            "SELECT DISTINCT device_id FROM biz.device_uri ORDER BY device_id LIMIT 20"))]
+    if not result:
+        print("❌ biz.result is empty, load a dataset with benchmarks/synthetic.py first")
+        sys.exit(2)
+    return {
+        "result_id": result[0], "device_name": result[1], "program_id": result[2], "source_id": result[3],
+        "curve_type": curve_type or "TORQUE", "final_force": float(final_force or 0),
+        "parameter_type": parameter_type or "DEFAULT",
+        "alarm_id": alarm_id or 0, "line_id": line_id or 0,
+        "plc_id": plc_id or 0, "device_names": devices,
+    }
+
+
+def relation_map():
+    """relname -> (reported name, reltuples); partitions map to their parent"""
+    with api_server.engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT c.relname, COALESCE(pn.nspname || '.' || p.relname, n.nspname || '.' || c.relname), c.reltuples
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+            LEFT JOIN pg_class p ON p.oid = i.inhparent
+            LEFT JOIN pg_namespace pn ON pn.oid = p.relnamespace
+            WHERE c.relkind IN ('r', 'p', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+        """)).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def capture(fn, sample):
+    """Run a scenario once and return the (statement, parameters) it executed"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(api_server.engine, "before_cursor_execute", on_execute)
+    try:
+        fn(sample)
+    finally:
+        event.remove(api_server.engine, "before_cursor_execute", on_execute)
+    return statements
+
+
+def explain(statement, parameters, relations, seq_scan_rows):
+    raw = api_server.engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+        plan = cur.fetchone()[0]
+        raw.rollback()
+    finally:
+        raw.close()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    top = plan[0]
+
+    seq_scans = set()
+    index_names = set()
+    for node in walk(top["Plan"]):
+        rel = node.get("Relation Name")
+        if node.get("Index Name"):
+            index_names.add(node["Index Name"])
+        if node["Node Type"] == "Seq Scan" and rel:
+            name, tuples = relations.get(rel, (rel, 0))
+            if tuples >= seq_scan_rows:
+                seq_scans.add(name)
+    root = top["Plan"]
+    return {
+        "sql": " ".join(statement.split())[:300],
+        "execution_ms": round(top.get("Execution Time", 0.0), 3),
+        "planning_ms": round(top.get("Planning Time", 0.0), 3),
+        "shared_hit": root.get("Shared Hit Blocks", 0),
+        "shared_read": root.get("Shared Read Blocks", 0),
+        "seq_scans": sorted(seq_scans),
+        "indexes": sorted(index_names),
+        "plan": top,
+    }
+
+
+def percentile(values, q):
+    values = sorted(values)
+    pos = (len(values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def run_scenario(name, fn, sample, args, relations):
+    fn(sample)  # warm-up (plan cache, shared buffers)
+    timings = []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        fn(sample)
+        timings.append((time.perf_counter() - t0) * 1000)
+
+    statements = []
+    for statement, parameters in capture(fn, sample):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append(explain(statement, parameters, relations, args.seq_scan_rows))
+    return {
+        "p50": round(percentile(timings, 0.5), 3),
+        "p95": round(percentile(timings, 0.95), 3),
+        "p99": round(percentile(timings, 0.99), 3),
+        "statements": statements,
+    }
+
+
+def compare(report, baseline, args):
+    """List of human-readable failures"""
+    failures = []
+    for name, current in report.items():
+        seq_now = {rel for s in current["statements"] for rel in s["seq_scans"]}
+        base = baseline.get(name) if baseline is not None else None
+        if base is None:
+            if args.strict and seq_now:
+                failures.append(f"{name}: seq scan on {', '.join(sorted(seq_now))}")
+            continue
+        seq_before = {rel for s in base["statements"] for rel in s["seq_scans"]}
+        new_seq = seq_now - seq_before
+        if new_seq:
+            failures.append(f"{name}: new seq scan on {', '.join(sorted(new_seq))}")
+        limit = base["p95"] * (1 + args.tolerance)
+        if current["p95"] > limit and current["p95"] - base["p95"] > args.min_delta_ms:
+            failures.append(f"{name}: p95 {current['p95']:.1f}ms > baseline {base['p95']:.1f}ms (+{args.tolerance:.0%})")
+    return failures
+
+
+def strip_plans(report):
+    return {
+        name: dict(r, statements=[{k: v for k, v in s.items() if k != "plan"} for s in r["statements"]])
+        for name, r in report.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE + latency regression check for api_server SQL")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per scenario")
+    parser.add_argument("--only", help="Comma-separated scenario names")
+    parser.add_argument("--seq-scan-rows", type=int, default=10000,
+                        help="Seq scans on relations smaller than this are ignored")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative p95 growth")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore p95 growth below this")
+    parser.add_argument("--strict", action="store_true", help="Without a baseline, fail on any large seq scan")
+    parser.add_argument("--plans-dir", help="Write the full JSON plan of every statement here")
+    args = parser.parse_args()
+
+    only = set(args.only.split(",")) if args.only else None
+    sample = pick_sample()
+    relations = relation_map()
+    print(f"📊 Sample: result {sample['result_id']}, device {sample['device_name']}, program {sample['program_id']}")
+
+    report = {}
+    for name, fn in SCENARIOS:
+        if only and name not in only:
+            continue
+        r = run_scenario(name, fn, sample, args, relations)
+        report[name] = r
+        seq = sorted({rel for s in r["statements"] for rel in s["seq_scans"]})
+        db_ms = sum(s["execution_ms"] for s in r["statements"])
+        flag = f"  ⚠️ seq scan: {', '.join(seq)}" if seq else ""
+        print(f"{name:<24} p50 {r['p50']:8.1f}ms  p95 {r['p95']:8.1f}ms  p99 {r['p99']:8.1f}ms  "
+              f"db {db_ms:8.1f}ms  stmts {len(r['statements'])}{flag}")
+
+    if args.plans_dir:
+        os.makedirs(args.plans_dir, exist_ok=True)
+        for name, r in report.items():
+            with open(os.path.join(args.plans_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+                json.dump([s["plan"] for s in r["statements"]], f, indent=2)
+
+    report = strip_plans(report)
+    if args.update_baseline:
+        if not args.baseline:
+            parser.error("--update-baseline needs --baseline")
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✅ Baseline written to {args.baseline}")
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    failures = compare(report, baseline, args)
+    if failures:
+        print(f"❌ {len(failures)} regression(s):")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("✅ No plan or latency regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Synthetic origin.* source tables for ETL benchmarks.
+
+FDS: bs_fds_results + bs_fds_curveresults joined by the bs_fds_v_fds_curves
+view (as in production), with curve blobs made of a 7816-byte header and
+40-byte '<hhffffffffi' frames, plus bs_fds_progtable / bs_fds_singleresult.
+SPR: bs_spr_detail_v2 with one row per parameter type and bs_spr_graph_v2
+holding gzip-compressed little-endian float32 graphs.
+
+Blobs are built from a few templates so millions of rows load quickly while
+every record still decodes to the same amount of work as a real one.
+"""
+import gzip
+import math
+import random
+import struct
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+FDS_HEADER_SIZE = 7816
+FDS_FRAME = struct.Struct('<hhffffffffi')
+TEMPLATES = 16
+CHUNK = 500
+
+SPR_PARAMETER_TYPES = ['Final Force', 'Final Stroke']
+SPR_GRAPH_TYPES = ['Force/Time', 'Stroke/Time']
+
+SOURCE_DDL = [
+    'CREATE SCHEMA IF NOT EXISTS "origin"',
+    """
+    CREATE TABLE origin.bs_fds_results (
+        autoindex int8 PRIMARY KEY,
+        actualprogramid int4,
+        systemid char(32),
+        startselection char(16),
+        ok_nok_code int4,
+        lastexecutedstep int4,
+        starttime timestamp,
+        cyclenumber int4,
+        duration numeric(10,3),
+        bsn char(32),
+        progselection char(16)
+    )
+    """,
+    """
+    CREATE TABLE origin.bs_fds_curveresults (
+        resultid int8 PRIMARY KEY,
+        curve bytea
+    )
+    """,
+    """
+    CREATE VIEW origin.bs_fds_v_fds_curves AS
+    SELECT r.*, c.curve
+    FROM origin.bs_fds_results r
+    JOIN origin.bs_fds_curveresults c ON c.resultid = r.autoindex
+    """,
+    """
+    CREATE TABLE origin.bs_fds_progtable (
+        autoprogindex int4 PRIMARY KEY,
+        name char(64),
+        lastchangedatetime timestamp,
+        startstring char(32)
+    )
+    """,
+    """
+    CREATE TABLE origin.bs_fds_singleresult (
+        resultlistid int8,
+        type int4,
+        step int4,
+        value numeric(12,4),
+        resultindex int4
+    )
+    """,
+    "CREATE INDEX idx_bs_fds_singleresult_rid ON origin.bs_fds_singleresult (resultlistid)",
+    """
+    CREATE TABLE origin.bs_spr_detail_v2 (
+        sid bigserial PRIMARY KEY,
+        id int8,
+        device_name varchar(64),
+        result_sequence_number int4,
+        result_date_time timestamp,
+        program_id int4,
+        p_name varchar(64),
+        program_identifier varchar(64),
+        program_version int4,
+        final_force numeric(10,3),
+        final_stroke numeric(10,3),
+        start_distance numeric(10,3),
+        end_distance numeric(10,3),
+        velocity numeric(10,3),
+        cycle_time numeric(10,3),
+        limit_high numeric(10,3),
+        limit_low numeric(10,3),
+        parameter_type varchar(64),
+        short_description varchar(64),
+        bsn varchar(64)
+    )
+    """,
+    "CREATE INDEX idx_bs_spr_detail_v2_id ON origin.bs_spr_detail_v2 (id)",
+    """
+    CREATE TABLE origin.bs_spr_graph_v2 (
+        id int8,
+        graph_type varchar(64),
+        graph_values bytea
+    )
+    """,
+    "CREATE INDEX idx_bs_spr_graph_v2_id ON origin.bs_spr_graph_v2 (id)",
+]
+
+
+def fds_blob(frames, steps, seed):
+    """Header + `frames` 40-byte frames spread over `steps` steps"""
+    rnd = random.Random(seed)
+    parts = [bytes(FDS_HEADER_SIZE)]
+    per_step = max(1, frames // steps)
+    for i in range(frames):
+        step = min(i // per_step + 1, steps)
+        phase = i / frames
+        torque = 30 * phase + rnd.uniform(-0.5, 0.5)
+        parts.append(FDS_FRAME.pack(
+            1200, 1180 + rnd.randint(-20, 20),
+            torque, torque * 0.98, 0.3 + rnd.random() * 0.1,
+            12 * phase, 0.01, 720 * phase,
+            4.5, 4.5 + rnd.uniform(-0.1, 0.1),
+            step
+        ))
+    return b"".join(parts)
+
+
+def spr_graph(points, kind, seed):
+    """gzip of `points` little-endian float32 values"""
+    rnd = random.Random(seed)
+    if kind == 'Force/Time':
+        values = [40 * math.sin(math.pi * i / points) + rnd.uniform(-0.2, 0.2) for i in range(points)]
+    else:
+        values = [8 * i / points + rnd.uniform(-0.01, 0.01) for i in range(points)]
+    return gzip.compress(struct.pack(f'<{points}f', *values))
+
+
+def create_source_schema(conn):
+    conn.execute(text('DROP SCHEMA IF EXISTS "origin" CASCADE'))
+    for stmt in SOURCE_DDL:
+        conn.execute(text(stmt))
+
+
+def load_fds(engine, records, frames, steps, programs=20, devices=20, nok_rate=0.03):
+    """records FDS results with one curve blob each"""
+    blobs = [fds_blob(frames, steps, seed) for seed in range(TEMPLATES)]
+    t0 = datetime.now() - timedelta(seconds=records * 5)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO origin.bs_fds_progtable (autoprogindex, name, lastchangedatetime, startstring)
+            SELECT p, 'PROG' || p, TIMESTAMP '2024-01-01' + p * INTERVAL '1 day', 'S' || p
+            FROM generate_series(1, :programs) p
+        """), {"programs": programs})
+
+    insert_result = text("""
+        INSERT INTO origin.bs_fds_results (autoindex, actualprogramid, systemid, startselection, ok_nok_code,
+                                           lastexecutedstep, starttime, cyclenumber, duration, bsn, progselection)
+        VALUES (:idx, :prog, :sys, 'SEL1', :code, :last_step, :start, :cycle, :duration, :bsn, 'PS1')
+    """)
+    insert_curve = text("INSERT INTO origin.bs_fds_curveresults (resultid, curve) VALUES (:idx, :curve)")
+    insert_kpi = text("""
+        INSERT INTO origin.bs_fds_singleresult (resultlistid, type, step, value, resultindex)
+        VALUES (:rid, :type, :step, :value, :ridx)
+    """)
+    rnd = random.Random(0)
+    for lo in range(1, records + 1, CHUNK):
+        hi = min(lo + CHUNK, records + 1)
+        results, curves, kpis = [], [], []
+        for i in range(lo, hi):
+            nok = rnd.random() < nok_rate
+            results.append({
+                "idx": i, "prog": 1 + i % programs, "sys": f"FDS{i % devices:03d}",
+                "code": 11 if nok else 1, "last_step": steps, "start": t0 + timedelta(seconds=i * 5),
+                "cycle": i, "duration": 2.5, "bsn": f"BSN{i}",
+            })
+            curves.append({"idx": i, "curve": blobs[i % TEMPLATES]})
+            for step in range(1, steps + 1):
+                for ridx, kpi_type in enumerate((1, 2, 3)):
+                    kpis.append({"rid": i, "type": kpi_type, "step": step,
+                                 "value": round(rnd.uniform(10, 40), 4), "ridx": ridx})
+        with engine.begin() as conn:
+            conn.execute(insert_result, results)
+            conn.execute(insert_curve, curves)
+            conn.execute(insert_kpi, kpis)
+
+
+def load_spr(engine, records, points, devices=20, nok_rate=0.03):
+    """records SPR results: one detail row per parameter type, one gzip graph per graph type"""
+    graphs = {kind: [spr_graph(points, kind, seed) for seed in range(TEMPLATES)] for kind in SPR_GRAPH_TYPES}
+    t0 = datetime.now() - timedelta(seconds=records * 5)
+    insert_detail = text("""
+        INSERT INTO origin.bs_spr_detail_v2 (
+            id, device_name, result_sequence_number, result_date_time, program_id, p_name,
+            program_identifier, program_version, final_force, final_stroke, start_distance, end_distance,
+            velocity, cycle_time, limit_high, limit_low, parameter_type, short_description, bsn
+        ) VALUES (
+            :id, :dev, :seq, :time, :pid, :pname, :pident, 1, :force, :stroke, 0.5, 8.0,
+            120.0, 1.8, :high, :low, :ptype, :desc, :bsn
+        )
+    """)
+    insert_graph = text("INSERT INTO origin.bs_spr_graph_v2 (id, graph_type, graph_values) VALUES (:id, :gtype, :values)")
+    rnd = random.Random(1)
+    for lo in range(1, records + 1, CHUNK):
+        hi = min(lo + CHUNK, records + 1)
+        details, graph_rows = [], []
+        for i in range(lo, hi):
+            nok = rnd.random() < nok_rate
+            force = round(rnd.uniform(35, 45), 3)
+            stroke = round(rnd.uniform(7.5, 8.5), 3)
+            for ptype, high, low in (('Final Force', 50, 30), ('Final Stroke', 9, 7)):
+                details.append({
+                    "id": i, "dev": f"SPR{i % devices:03d}", "seq": i, "time": t0 + timedelta(seconds=i * 5),
+                    "pid": 1 + i % 10, "pname": f"SPR_PROG{i % 10}", "pident": f"SP{i % 10}",
+                    "force": force, "stroke": stroke, "high": high, "low": low, "ptype": ptype,
+                    "desc": "NOK" if nok else "OK", "bsn": f"BSN{i}",
+                })
+            for kind in SPR_GRAPH_TYPES:
+                graph_rows.append({"id": i, "gtype": kind, "values": graphs[kind][i % TEMPLATES]})
+        with engine.begin() as conn:
+            conn.execute(insert_detail, details)
+            conn.execute(insert_graph, graph_rows)
+
+
+def load_sources(engine, fds_records, spr_records, fds_frames=600, fds_steps=4, spr_points=1000):
+    started = time.time()
+    with engine.begin() as conn:
+        create_source_schema(conn)
+    if fds_records:
+        load_fds(engine, fds_records, fds_frames, fds_steps)
+        print(f"   FDS: {fds_records} records x {fds_frames} frames ({FDS_HEADER_SIZE + fds_frames * FDS_FRAME.size} byte blobs)")
+    if spr_records:
+        load_spr(engine, spr_records, spr_points)
+        print(f"   SPR: {spr_records} records x {len(SPR_GRAPH_TYPES)} graphs of {spr_points} points")
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+    print(f"   Sources loaded in {time.time() - started:.1f}s")
@@ -0,0 +1,279 @@
+"""
+Synthetic biz.* dataset for benchmarks.
+
+Builds the biz schema from init_db.sql (plus the hierarchy / device_uri /
+alarm-parent tables added by the migration scripts), creates monthly
+partitions for biz.result and bulk-loads generated rows with
+generate_series, so millions of results load in minutes.
+
+The target database comes from ETL_DB_* (see etl_core/common/config.py).
+The biz schema is DROPPED first, so non-local hosts are refused unless
+--allow-remote is given.
+
+    ETL_DB_HOST=127.0.0.1 ETL_DB_PORT=5432 ETL_DB_NAME=etl_bench \
+        python -m benchmarks.synthetic --results 2000000 --curves-per-result 6
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from etl_core.common.config import DB_CONFIG
+from etl_core.common.db import create_db_engine
+from etl_core.common.indexes import apply_indexes
+
+INIT_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "init_db.sql")
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# Tables created by apply_hierarchy_migration.py / apply_alarm_migration.py and
+# the device URI registry, which init_db.sql does not define
+EXTRA_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS "biz"."structure" (
+        "id" bigserial PRIMARY KEY,
+        "name" varchar(128) NOT NULL,
+        "level_type" varchar(32) NOT NULL,
+        "parent_id" int8,
+        "path" varchar(255) NOT NULL,
+        "device_name" varchar(64),
+        "attributes" jsonb,
+        "create_time" timestamp(6) DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS idx_structure_parent ON "biz"."structure" ("parent_id")',
+    'CREATE INDEX IF NOT EXISTS idx_structure_path ON "biz"."structure" ("path" varchar_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS idx_structure_device ON "biz"."structure" ("device_name")',
+    """
+    CREATE TABLE IF NOT EXISTS "biz"."point" (
+        "id" bigserial PRIMARY KEY,
+        "structure_id" int8 REFERENCES "biz"."structure"("id"),
+        "device_id" varchar(64),
+        "point_name" varchar(128),
+        "point_uri" varchar(255),
+        "group_path" varchar(255),
+        "data_type" varchar(32),
+        "is_ts" bool DEFAULT true
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS idx_point_structure ON "biz"."point" ("structure_id")',
+    """
+    CREATE TABLE IF NOT EXISTS "biz"."device_uri" (
+        "id" bigserial PRIMARY KEY,
+        "device_id" varchar(64),
+        "uri" varchar(255),
+        "name" varchar(128),
+        "level" int4,
+        "display_type" varchar(32)
+    )
+    """,
+    'ALTER TABLE "biz"."alarm" ADD COLUMN IF NOT EXISTS "parent_alarm_id" int8',
+    'CREATE INDEX IF NOT EXISTS idx_alarm_parent_id ON "biz"."alarm" ("parent_alarm_id")',
+]
+
+CURVE_TYPES = ["TORQUE", "SPEED", "ANGLE", "DEPTH", "PRESSURE", "TORQUE_ANGLE", "FORCE", "STROKE"]
+CHUNK = 50000
+
+
+def check_target(allow_remote):
+    if DB_CONFIG["host"] not in LOCAL_HOSTS and not allow_remote:
+        print(f"❌ Refusing to rebuild biz on {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']} "
+              f"(set ETL_DB_HOST to a local Postgres or pass --allow-remote)")
+        sys.exit(2)
+
+
+def init_schema(conn):
+    """Recreate the biz schema from init_db.sql + EXTRA_DDL"""
+    conn.execute(text('DROP SCHEMA IF EXISTS "biz" CASCADE'))
+    with open(INIT_SQL, "r", encoding="utf-8") as f:
+        lines = [l for l in f.read().splitlines() if not l.strip().startswith("--")]
+    for stmt in "\n".join(lines).split(";"):
+        if stmt.strip():
+            conn.execute(text(stmt))
+    for stmt in EXTRA_DDL:
+        conn.execute(text(stmt))
+
+
+def create_partitions(conn, start, end):
+    """Monthly biz.result partitions covering [start, end]"""
+    month = datetime(start.year, start.month, 1)
+    while month <= end:
+        nxt = datetime(month.year + (month.month == 12), month.month % 12 + 1, 1)
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS biz.result_{month:%Y_%m} PARTITION OF biz.result
+            FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{nxt:%Y-%m-%d}')
+        """))
+        month = nxt
+
+
+def load_hierarchy(conn, devices, uris_per_device, points_per_device):
+    """Factory -> workshop -> line -> station -> device tree, device URIs and points"""
+    lines = max(1, devices // 10)
+    conn.execute(text("""
+        INSERT INTO biz.structure (id, name, level_type, parent_id, path) VALUES
+            (1, 'FACTORY', 'FACTORY', NULL, '/1/'),
+            (2, 'WORKSHOP', 'WORKSHOP', 1, '/1/2/')
+    """))
+    # Lines 100+, PLCs 200+ (one per line), stations 1000+, devices 10000+
+    conn.execute(text("""
+        INSERT INTO biz.structure (id, name, level_type, parent_id, path)
+        SELECT 100 + l, 'LINE' || l, 'LINE', 2, '/1/2/' || (100 + l) || '/'
+        FROM generate_series(0, :lines - 1) l
+    """), {"lines": lines})
+    conn.execute(text("""
+        INSERT INTO biz.structure (id, name, level_type, parent_id, path, device_name)
+        SELECT 200 + l, 'PLC' || l, 'PLC', 100 + l, '/1/2/' || (100 + l) || '/' || (200 + l) || '/', 'PLC' || l
+        FROM generate_series(0, :lines - 1) l
+    """), {"lines": lines})
+    conn.execute(text("""
+        INSERT INTO biz.structure (id, name, level_type, parent_id, path)
+        SELECT 1000 + d, 'STATION' || d, 'STATION', 100 + mod(d, :lines),
+               '/1/2/' || (100 + mod(d, :lines)) || '/' || (1000 + d) || '/'
+        FROM generate_series(0, :devices - 1) d
+    """), {"lines": lines, "devices": devices})
+    conn.execute(text("""
+        INSERT INTO biz.structure (id, name, level_type, parent_id, path, device_name, attributes)
+        SELECT 10000 + d, 'DEV' || lpad(d::text, 4, '0'), 'DEVICE', 1000 + d,
+               '/1/2/' || (100 + mod(d, :lines)) || '/' || (1000 + d) || '/' || (10000 + d) || '/',
+               'DEV' || lpad(d::text, 4, '0'), jsonb_build_object('plc_id', 200 + mod(d, :lines))
+        FROM generate_series(0, :devices - 1) d
+    """), {"lines": lines, "devices": devices})
+    conn.execute(text("SELECT setval('biz.structure_id_seq', (SELECT MAX(id) FROM biz.structure))"))
+
+    conn.execute(text("""
+        INSERT INTO biz.device_uri (device_id, uri, name, level, display_type)
+        SELECT 'DEV' || lpad(d::text, 4, '0'), 'opcua://dev' || d || '/p' || u, 'P' || u, mod(u, 3),
+               CASE WHEN mod(u, 5) = 0 THEN 'chart' ELSE 'card' END
+        FROM generate_series(0, :devices - 1) d, generate_series(1, :uris) u
+    """), {"devices": devices, "uris": uris_per_device})
+    conn.execute(text("""
+        INSERT INTO biz.point (structure_id, device_id, point_name, point_uri, group_path, data_type)
+        SELECT 10000 + d, 'DEV' || lpad(d::text, 4, '0'), 'POINT' || p, 'opcua://dev' || d || '/io/' || p,
+               'IO/' || mod(p, 4), 'float'
+        FROM generate_series(0, :devices - 1) d, generate_series(1, :points) p
+    """), {"devices": devices, "points": points_per_device})
+
+
+def load_programs(conn, programs):
+    conn.execute(text("""
+        INSERT INTO biz.program (program_id, version, program_name, craft_type, parameter_type,
+                                 target_value, upper_limit, lower_limit)
+        SELECT 'P' || p, 'v1', 'Program ' || p, CASE WHEN mod(p, 2) = 0 THEN 'SPR' ELSE 'FDS' END, 'DEFAULT',
+               50, 60, 40
+        FROM generate_series(0, :programs - 1) p
+    """), {"programs": programs})
+
+
+def load_results(conn, lo, hi, args, t_end, span_s):
+    """Results [lo, hi) with their steps, curves, alarms and extension rows"""
+    params = {
+        "lo": lo, "hi": hi - 1, "n": args.results, "devices": args.devices, "programs": args.programs,
+        "t_end": t_end, "span": span_s, "nok_per_mille": int(args.nok_rate * 1000), "curves": args.curves_per_result,
+        "steps": args.steps_per_result, "ctypes": CURVE_TYPES, "points": args.points,
+    }
+    # Newest result has the highest id, like the ETL produces them
+    conn.execute(text("""
+        INSERT INTO biz.result (id, source_id, cyclenumber, device_name, craft_type, system_id, bsn, vin,
+                                program_id, result_status, start_time, end_time, cycle_time, key_value)
+        SELECT i, i, 'C' || i, 'DEV' || lpad(mod(i, :devices)::text, 4, '0'),
+               CASE WHEN mod(mod(i, :devices), 2) = 0 THEN 'SPR' ELSE 'FDS' END, 'SYS',
+               'BSN' || i, 'VIN' || (i / 20), 'P' || mod(i, :programs),
+               CASE WHEN mod(abs(hashint4(i::int)), 1000) < :nok_per_mille THEN 0 ELSE 1 END,
+               ts, ts + interval '3 seconds', 3.0, 40 + mod(i, 200) / 10.0
+        FROM (
+            SELECT i, CAST(:t_end AS timestamp) - make_interval(secs => (CAST(:n AS float8) - i) * :span / :n) AS ts
+            FROM generate_series(CAST(:lo AS int8), CAST(:hi AS int8)) i
+        ) g
+    """), params)
+    conn.execute(text("""
+        INSERT INTO biz.step (result_id, step_index, step_name, step_result, step_value, target_value, start_time, end_time)
+        SELECT r.id, s, 'STEP' || s, r.result_status, r.key_value, 50, r.start_time, r.end_time
+        FROM biz.result r, generate_series(1, :steps) s
+        WHERE r.id BETWEEN :lo AND :hi
+    """), params)
+    # A handful of template payloads, picked per row, keeps the load fast
+    conn.execute(text("""
+        INSERT INTO biz.curve (result_id, step, curve_type, start_time, end_time, data_points)
+        SELECT r.id, 1 + mod(c, :steps), (CAST(:ctypes AS varchar[]))[1 + mod(c, 8)], r.start_time, r.end_time, t.payload
+        FROM biz.result r
+        CROSS JOIN generate_series(0, :curves - 1) c
+        JOIN (
+            SELECT k, jsonb_build_object(
+                       'x', jsonb_agg(round((p * 0.01)::numeric, 2) ORDER BY p),
+                       'y', jsonb_agg(round((k + 40 * sin(p / 50.0))::numeric, 3) ORDER BY p)) AS payload
+            FROM generate_series(0, 7) k, generate_series(0, :points - 1) p
+            GROUP BY k
+        ) t ON t.k = mod(r.id + c, 8)
+        WHERE r.id BETWEEN :lo AND :hi
+    """), params)
+    conn.execute(text("""
+        INSERT INTO biz.alarm (result_id, alarm_code, alarm_level, alarm_msg, device_id, create_time)
+        SELECT id, 'E' || mod(id, 50), 'ERROR', 'Synthetic NOK', device_name, start_time
+        FROM biz.result WHERE id BETWEEN :lo AND :hi AND result_status = 0
+    """), params)
+    conn.execute(text("""
+        INSERT INTO biz.extension (result_id, extra_data)
+        SELECT id, jsonb_build_object('max_force', key_value + 5, 'min_force', key_value - 5, 'station', device_name)
+        FROM biz.result WHERE id BETWEEN :lo AND :hi
+    """), params)
+
+
+def fix_sequences(conn):
+    for table in ("result", "step", "curve", "alarm", "program", "device_uri", "point"):
+        conn.execute(text(f"""
+            SELECT setval(pg_get_serial_sequence('biz.{table}', 'id'), COALESCE((SELECT MAX(id) FROM biz.{table}), 1))
+        """))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a synthetic biz.* dataset into a local Postgres")
+    parser.add_argument("--results", type=int, default=100000)
+    parser.add_argument("--curves-per-result", type=int, default=6)
+    parser.add_argument("--steps-per-result", type=int, default=2)
+    parser.add_argument("--points", type=int, default=200, help="Points per curve")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--programs", type=int, default=40)
+    parser.add_argument("--uris-per-device", type=int, default=20)
+    parser.add_argument("--points-per-device", type=int, default=10)
+    parser.add_argument("--days", type=int, default=180, help="Time span covered by the results")
+    parser.add_argument("--nok-rate", type=float, default=0.03)
+    parser.add_argument("--allow-remote", action="store_true")
+    args = parser.parse_args()
+
+    check_target(args.allow_remote)
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    t_end = datetime.now().replace(microsecond=0)
+    t_start = t_end - timedelta(days=args.days)
+
+    started = time.time()
+    with engine.begin() as conn:
+        print("1. Creating schema...")
+        init_schema(conn)
+        create_partitions(conn, t_start, t_end + timedelta(days=31))
+        print("2. Loading hierarchy, device URIs, points, programs...")
+        load_hierarchy(conn, args.devices, args.uris_per_device, args.points_per_device)
+        load_programs(conn, args.programs)
+
+    print(f"3. Loading {args.results} results x {args.curves_per_result} curves ({args.points} points)...")
+    for lo in range(1, args.results + 1, CHUNK):
+        hi = min(lo + CHUNK, args.results + 1)
+        with engine.begin() as conn:
+            load_results(conn, lo, hi, args, t_end, args.days * 86400)
+        rate = (hi - 1) / (time.time() - started)
+        print(f"   {hi - 1}/{args.results} results ({rate:.0f} rec/s)")
+
+    with engine.begin() as conn:
+        fix_sequences(conn)
+
+    print("4. Applying indexes...")
+    apply_indexes(engine)
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("VACUUM ANALYZE"))
+    print(f"✅ Synthetic dataset ready in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
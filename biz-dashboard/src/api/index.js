@@ -31,10 +31,68 @@ export const getResults = (params) => api.get('/results', { params })
 
 export const getResultDetail = (id) => api.get(`/results/${id}`)
 
-export const getResultCurves = (id) => api.get(`/results/${id}/curves`)
+// params: { width, method: 'lttb' | 'minmax', curve_types: 'TORQUE,ANGLE', steps: '1,2' }
+export const getResultCurves = (id, params) => api.get(`/results/${id}/curves`, { params })
+
+// Binary float32 curve frames: uint32 header_len | header JSON | float32[n] x | float32[n] y
+const decodeCurveFrames = (buffer) => {
+    const view = new DataView(buffer)
+    const decoder = new TextDecoder()
+    const curves = []
+    let offset = 0
+    while (offset < buffer.byteLength) {
+        const headerLen = view.getUint32(offset, true)
+        offset += 4
+        const header = JSON.parse(decoder.decode(new Uint8Array(buffer, offset, headerLen)))
+        offset += headerLen
+        const x = new Float32Array(buffer.slice(offset, offset + header.n * 4))
+        offset += header.n * 4
+        const y = new Float32Array(buffer.slice(offset, offset + header.n * 4))
+        offset += header.n * 4
+        curves.push({ ...header, data_points: { x: Array.from(x), y: Array.from(y) } })
+    }
+    return curves
+}
+
+export const getResultCurvesBinary = async (id, params) => {
+    const buffer = await api.get(`/results/${id}/curves/raw`, {
+        params: { ...params, format: 'f32' },
+        responseType: 'arraybuffer'
+    })
+    return decodeCurveFrames(buffer)
+}
 
 export const getResultSteps = (id) => api.get(`/results/${id}/steps`)
 
+// params: { curve_type, result_ids: '1,2,3' | program_id, device_name, start_time, end_time, step, width, limit }
+// returns { curve_type, steps: [{ step, grid, results, stats }] }, each step aligned on its own grid
+export const compareCurves = (params) => api.get('/curves/compare', { params })
+
+// Push channel for newly committed results/alarms.
+// params: { device_name, craft_type, structure_id, status }; returns a close() function
+export const subscribeResults = (params, onEvent) => {
+    const query = new URLSearchParams(
+        Object.entries(params || {}).filter(([, v]) => v !== undefined && v !== null && v !== '')
+    ).toString()
+    let socket = null
+    let closed = false
+    const open = () => {
+        socket = new WebSocket(`ws://localhost:8000/ws/results${query ? `?${query}` : ''}`)
+        socket.onmessage = (msg) => {
+            const event = JSON.parse(msg.data)
+            if (event.type === 'result') onEvent(event)
+        }
+        socket.onclose = () => {
+            if (!closed) setTimeout(open, 5000)
+        }
+    }
+    open()
+    return () => {
+        closed = true
+        socket?.close()
+    }
+}
+
 // ========== Alarms API ==========
 export const getAlarms = (params) => api.get('/alarms', { params })
 
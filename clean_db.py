@@ -16,7 +16,10 @@ TABLES_TO_TRUNCATE = [
     "biz.alarm",
     "biz.curve",
     "biz.step",
+    "biz.step_kpi",
     "biz.extension",
+    "biz.result_kpi",
+    "biz.spc_bucket",
     "biz.result",
     # "biz.program" # Optional: keep programs for now to avoid re-inserting if unnecessary
 ]
@@ -8,7 +8,7 @@ def cleanup():
         conn.execute(text("DROP TABLE IF EXISTS biz.curve CASCADE"))
         # Also clean other tables to allow fresh migration
         print("Truncating other tables...")
-        conn.execute(text("TRUNCATE TABLE biz.step, biz.alarm, biz.extension, biz.result, biz.program CASCADE"))
+        conn.execute(text("TRUNCATE TABLE biz.step, biz.step_kpi, biz.alarm, biz.extension, biz.result_kpi, biz.spc_bucket, biz.result, biz.program CASCADE"))
         conn.commit()
     print("Cleanup complete.")
 
@@ -7,7 +7,7 @@ def clear_fds_data():
     engine = create_engine(conn_str)
     
     print("WARNING: This will delete ALL FDS data (craft_type='FDS_DEFAULT') from biz schema.")
-    print("Tables: biz.alarm, biz.curve, biz.step, biz.extension, biz.result")
+    print("Tables: biz.alarm, biz.curve, biz.step, biz.step_kpi, biz.extension, biz.spc_bucket, biz.result")
     
     with engine.begin() as conn:
         # 1. Identify Result IDs to delete
@@ -28,9 +28,15 @@ def clear_fds_data():
         print("Deleting Steps...")
         conn.execute(text("DELETE FROM biz.step WHERE result_id IN (SELECT id FROM biz.result WHERE craft_type = 'FDS_DEFAULT')"))
         
+        print("Deleting Step KPIs...")
+        conn.execute(text("DELETE FROM biz.step_kpi WHERE result_id IN (SELECT id FROM biz.result WHERE craft_type = 'FDS_DEFAULT')"))
+        
         print("Deleting Extensions...")
         conn.execute(text("DELETE FROM biz.extension WHERE result_id IN (SELECT id FROM biz.result WHERE craft_type = 'FDS_DEFAULT')"))
         
+        print("Deleting SPC buckets...")
+        conn.execute(text("DELETE FROM biz.spc_bucket WHERE craft_type = 'FDS_DEFAULT'"))
+        
         print("Deleting Results...")
         result = conn.execute(text("DELETE FROM biz.result WHERE craft_type = 'FDS_DEFAULT'"))
         
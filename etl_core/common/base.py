@@ -3,10 +3,18 @@ import abc
 import json
 import os
 import time
+import threading
 import concurrent.futures
 from datetime import datetime
-from sqlalchemy import text
+from sqlalchemy import event, text
 from .db import create_db_engine
+from . import metrics
+from .tracing import TRACER
+from .profiler import install_profiler
+
+# Which items publish a dashboard event (pg_notify) in their write transaction
+PUBLISH_MODES = ("all", "head", "off")
+
 
 class BaseEtlPipeline(abc.ABC):
     def __init__(self, name, checkpoint_file, batch_size=200, workers=10, limit=None):
@@ -17,6 +25,258 @@ class BaseEtlPipeline(abc.ABC):
         self.limit = limit
         self.engine = create_db_engine(pool_size=workers+5)
         self.stop_event = False
+        self.heartbeat = None  # shared mp.Value('d') set by the scheduler to detect hangs
+        self.backlog = None  # shared mp.Value('q') read by the scheduler's connection budget
+        self.pool_quota = None  # pool size assigned by the connection budget, None = unmanaged
+        self._pool_target = None
+        self._pool_rebuild = None  # unmanaged pool size requested by set_workers()
+        self.db_overrides = {}
+        self.dual_cursor = None  # options of the head/tail mode, see enable_dual_cursor()
+        self.head_cursor = None  # {"start": offset, "last": offset} while the head cursor is split off
+        self.throttle = None  # common.throttle.Throttle: rate limits and time windows
+        self.streaming = None  # options of the server-side cursor mode, see enable_streaming()
+        self._stream = None  # (connection, partitions) of the open stream
+        self.publish = "head"  # dashboard events, see set_event_publishing()
+        self._tls = threading.local()
+        self._source_time = None  # newest source timestamp processed
+        self._source_time_lock = threading.Lock()
+        self._instrument_engine()
+        metrics.REGISTRY.add_collector(self._collect_pool)
+
+    def _collect_pool(self):
+        metrics.POOL_CHECKED_OUT.set(self.engine.pool.checkedout(), pipeline=self.name)
+        metrics.POOL_SIZE.set(self.engine.pool.size(), pipeline=self.name)
+
+    def _instrument_engine(self):
+        """Count statements and time pool checkouts of the worker threads"""
+        name = self.name
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            metrics.STATEMENTS.inc(pipeline=name)
+            self._tls.stmt_started = time.perf_counter()
+
+        def after_execute(conn, cursor, statement, parameters, context, executemany):
+            # Per-thread DB time of the current item, charged to the throttle's DB bucket
+            started = getattr(self._tls, "stmt_started", None)
+            if started is not None:
+                self._tls.db_time = getattr(self._tls, "db_time", 0.0) + time.perf_counter() - started
+
+        def on_checkout(dbapi_conn, record, proxy):
+            # process_item opens its transaction first, so the wait starts when the item does
+            started = getattr(self._tls, "item_started", None)
+            if started is not None:
+                metrics.POOL_CHECKOUT.observe(time.perf_counter() - started, pipeline=name)
+                self._tls.item_started = None
+
+        event.listen(self.engine, "before_cursor_execute", on_execute)
+        event.listen(self.engine, "after_cursor_execute", after_execute)
+        event.listen(self.engine, "checkout", on_checkout)
+
+    def resize_pool(self, quota):
+        """Request a new pool size (connection budget); applied between batches"""
+        self._pool_target = quota
+
+    def set_workers(self, workers):
+        """Live worker count; without a connection budget the default pool (workers + 5) follows between batches"""
+        self.workers = workers
+        if self.pool_quota is None and self._pool_target is None:
+            self._pool_rebuild = workers + 5
+
+    def _replace_engine(self, engine):
+        old = self.engine
+        self.engine = engine
+        self._instrument_engine()
+        old.dispose()
+
+    def _apply_pool_target(self):
+        quota = self._pool_target
+        if quota is None:
+            size, self._pool_rebuild = self._pool_rebuild, None
+            if size is not None and size != self.engine.pool.size():
+                print(f"[{self.name}] 🔌 Pool size: {self.engine.pool.size()} -> {size}")
+                self._replace_engine(create_db_engine(pool_size=size, **self.db_overrides))
+            return
+        if quota == self.pool_quota:
+            return
+        self._replace_engine(create_db_engine(pool_size=quota, max_overflow=0, **self.db_overrides))
+        print(f"[{self.name}] 🔌 Pool quota: {self.pool_quota} -> {quota}")
+        self.pool_quota = quota
+
+    def observe_stage(self, stage, started):
+        """Record time.perf_counter() - started for a stage (fetch, read, parse, write, checkpoint)"""
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, pipeline=self.name, stage=stage)
+
+    def trace(self, name, started, **attrs):
+        """Add a span from `started` (time.perf_counter()) to now to the current record's trace"""
+        TRACER.trace(name, started, **attrs)
+
+    def annotate(self, **attrs):
+        """Attach attributes (blob size, step count, ...) to the current record's trace"""
+        TRACER.annotate(**attrs)
+
+    def record_error(self, stage, exc):
+        metrics.ERRORS.inc(pipeline=self.name, stage=stage, type=type(exc).__name__)
+        TRACER.set_error(exc)
+
+    def stop(self):
+        """Ask run() to exit after the in-flight batch has finished and been checkpointed"""
+        self.stop_event = True
+
+    def beat(self):
+        """Report liveness to the supervising scheduler"""
+        if self.heartbeat is not None:
+            self.heartbeat.value = time.time()
+
+    def _sleep(self, seconds):
+        """time.sleep that wakes up on stop() and keeps the heartbeat going"""
+        deadline = time.time() + seconds
+        while not self.stop_event and time.time() < deadline:
+            self.beat()
+            time.sleep(min(1.0, max(deadline - time.time(), 0)))
+
+    def enable_profiler(self, output_dir="profiles", control_dir=None, seconds=30, interval_ms=10):
+        """Arm SIGUSR1 / control-file triggers for the stack sampler (see common/profiler.py)"""
+        self.profiler = install_profiler(self.name, output_dir, control_dir, seconds, interval_ms)
+        return self.profiler
+
+    def enable_dual_cursor(self, lag_threshold=10000, head_window=None, min_tail_share=0.1):
+        """
+        Head/tail mode: once the source is more than lag_threshold records ahead,
+        a head cursor jumps to (source head - head_window) and processes new
+        records first, while the tail cursor backfills (last_autoindex, head start]
+        with the rest of each batch (at least min_tail_share of it). The tail
+        never passes the head's start, so the ranges meet without gaps or
+        duplicates; then the cursors merge back into one.
+        """
+        self.dual_cursor = {
+            "lag_threshold": lag_threshold,
+            "head_window": head_window,  # None: the current batch_size
+            "min_tail_share": min_tail_share,
+        }
+
+    def enable_streaming(self, chunk_size=None):
+        """
+        Streaming mode for full-history scans: one server-side cursor
+        (stream_results + yield_per) walks the source in offset order and each
+        batch is the next chunk_size rows, instead of a new ORDER BY ... LIMIT
+        query per batch. The stream keeps one connection and its snapshot open
+        until it is exhausted; rows added meanwhile are read by the next stream.
+        Not combined with the dual-cursor mode, which needs bounded queries.
+        ValueError if the pipeline has no stream_query().
+        """
+        if self.stream_query(0) is None:
+            raise ValueError(f"{self.name}: {type(self).__name__} does not support streaming")
+        self.streaming = {"chunk_size": chunk_size}  # None: the batch_size when the stream opens
+
+    def set_event_publishing(self, mode):
+        """
+        Choose which items publish a dashboard NOTIFY on commit:
+          all   every item
+          head  live items only: none while streaming, and only head-cursor
+                items while the dual-cursor mode is split (default)
+          off   none
+        NOTIFY takes a database-wide lock at commit and fails once the
+        listener's queue is full, so backfills should not publish.
+        """
+        if mode not in PUBLISH_MODES:
+            raise ValueError(f"{self.name}: unknown publish mode '{mode}' (available: {', '.join(PUBLISH_MODES)})")
+        self.publish = mode
+
+    def _publishes(self, item):
+        if self.publish == "all":
+            return True
+        if self.publish == "off" or self.streaming:
+            return False
+        if self.head_cursor:
+            return self.get_item_offset(item) > self.head_cursor["start"]
+        return True
+
+    def publishing(self):
+        """Whether the item running on this thread publishes its dashboard event"""
+        return getattr(self._tls, "publish", True)
+
+    def stream_query(self, last_autoindex):
+        """
+        (text(), params) selecting the items after last_autoindex in offset order.
+        One-column rows are handed out as scalars, wider rows as items.
+        None (default) when the pipeline cannot stream; override in subclass
+        to support enable_streaming().
+        """
+        return None
+
+    def _next_chunk(self, last_autoindex):
+        """Next chunk of the open stream (opened from last_autoindex if needed); [] once exhausted"""
+        if self._stream is None:
+            query, params = self.stream_query(last_autoindex)
+            conn = self.engine.connect()
+            try:
+                result = conn.execution_options(stream_results=True).execute(query, params)
+            except Exception:
+                conn.close()
+                raise
+            chunk_size = self.streaming["chunk_size"] or self.batch_size
+            self._stream = (conn, result.yield_per(chunk_size).partitions())
+            print(f"[{self.name}] 🌊 Streaming from {last_autoindex} in chunks of {chunk_size}")
+        chunk = next(self._stream[1], None)
+        if chunk is None:
+            self._close_stream()
+            return []
+        return [row[0] if len(row) == 1 else row for row in chunk]
+
+    def _close_stream(self):
+        if self._stream is not None:
+            conn, _ = self._stream
+            self._stream = None
+            try:
+                conn.close()
+            except Exception as e:
+                self.record_error("fetch", e)
+
+    def enable_throttle(self, throttle):
+        """Apply a common.throttle.Throttle (records/s, DB time share, max workers, windows)"""
+        self.throttle = throttle
+
+    def _refresh_throttle(self):
+        if self.throttle is None:
+            return
+        window = self.throttle.refresh()
+        if window:
+            limits = ", ".join(f"{k}={v}" for k, v in self.throttle.limits.items())
+            print(f"[{self.name}] 🚦 Window {window}: {limits}")
+
+    def _split_cursor(self, last_autoindex):
+        """Start a head cursor if the backlog exceeds the threshold"""
+        try:
+            source_head = self.get_source_head()
+        except Exception as e:
+            self.record_error("lag", e)
+            return
+        if source_head is None or source_head - last_autoindex <= self.dual_cursor["lag_threshold"]:
+            return
+        start = max(source_head - (self.dual_cursor["head_window"] or self.batch_size), last_autoindex)
+        self.head_cursor = {"start": start, "last": start}
+        print(f"[{self.name}] 🔀 {source_head - last_autoindex} behind: head cursor from {start}, tail backfills ({last_autoindex}, {start}]")
+
+    def _fetch_dual(self, last_autoindex):
+        """
+        Head items first (newest data), then tail items with the spare batch capacity.
+        Tail items are None while a throttle window pauses backfill.
+        """
+        head_items = self.get_next_batch(self.head_cursor["last"], self.batch_size)
+        if self.throttle and not self.throttle.limits["backfill"]:
+            return head_items, None
+        min_tail = max(int(self.batch_size * self.dual_cursor["min_tail_share"]), 1)
+        tail_size = max(self.batch_size - len(head_items), min_tail)
+        tail_items = self.get_next_batch(last_autoindex, tail_size, upper_bound=self.head_cursor["start"])
+        return head_items, tail_items
+
+    def mark_source_time(self, ts):
+        """Report the source timestamp of a processed record (drives etl_lag_seconds)"""
+        if ts is None:
+            return
+        with self._source_time_lock:
+            if self._source_time is None or ts > self._source_time:
+                self._source_time = ts
 
     def load_checkpoint(self):
         """Load checkpoint from file"""
@@ -38,14 +298,17 @@ class BaseEtlPipeline(abc.ABC):
             "success_count": success_count,
             "fail_count": fail_count
         }
+        if self.head_cursor:
+            # Dual-cursor mode: last_autoindex is the tail, everything above head.start up to head.last is done too
+            data["head"] = dict(self.head_cursor)
         with open(self.checkpoint_file, 'w') as f:
             json.dump(data, f, indent=2)
         print(f"[{self.name}] 💾 Saved Checkpoint: autoindex={autoindex}")
 
     @abc.abstractmethod
-    def get_next_batch(self, last_autoindex, batch_size):
+    def get_next_batch(self, last_autoindex, batch_size, upper_bound=None):
         """
-        Return list of IDs to process.
+        Return list of IDs to process: offsets > last_autoindex (and <= upper_bound if set), ascending.
         Must be implemented by subclass.
         """
         pass
@@ -59,6 +322,60 @@ class BaseEtlPipeline(abc.ABC):
         """
         pass
 
+    def prefetch(self, items):
+        """
+        Called with each batch before its items are processed, e.g. to load
+        per-item detail rows for the whole batch in one query.
+        Override in subclass; process_item must still work without it.
+        """
+        pass
+
+    def get_source_head(self):
+        """
+        Highest offset currently available in the source, None if unknown.
+        Override in subclass to report etl_lag_records.
+        """
+        return None
+
+    def update_lag(self, last_autoindex):
+        try:
+            head = self.get_source_head()
+        except Exception as e:
+            self.record_error("lag", e)
+            head = None
+        backfill = 0
+        if self.head_cursor:
+            # Live lag is measured at the head cursor; the tail's range is backfill
+            backfill = max(self.head_cursor["start"] - last_autoindex, 0)
+            last_autoindex = self.head_cursor["last"]
+        metrics.BACKFILL_RECORDS.set(backfill, pipeline=self.name)
+        if head is not None:
+            metrics.LAG_RECORDS.set(max(head - last_autoindex, 0), pipeline=self.name)
+            if self.backlog is not None:
+                self.backlog.value = max(head - last_autoindex, 0) + backfill
+        if self._source_time is not None:
+            metrics.LAG_SECONDS.set((datetime.now() - self._source_time).total_seconds(), pipeline=self.name)
+
+    def _process(self, item):
+        if self.throttle:
+            wait = self.throttle.before_item()
+            if wait > 0:
+                metrics.THROTTLE_WAIT.inc(wait, pipeline=self.name)
+                time.sleep(wait)
+        self._tls.db_time = 0.0
+        self._tls.publish = self._publishes(item)
+        started = self._tls.item_started = time.perf_counter()
+        TRACER.start_record("process_item", pipeline=self.name, item=str(self.get_item_offset(item)))
+        try:
+            return self.process_item(item, self.engine)
+        finally:
+            self._tls.item_started = None
+            if self.throttle:
+                self.throttle.after_item(self._tls.db_time)
+            TRACER.end_record()
+            self.observe_stage("item", started)
+            metrics.BATCH_PENDING.dec(pipeline=self.name)
+
     def get_item_offset(self, item):
         """
         Extract the offset/ID from the item.
@@ -82,13 +399,31 @@ class BaseEtlPipeline(abc.ABC):
         elif start_autoindex is not None:
              last_autoindex = start_autoindex
 
+        self.head_cursor = None
+        head = checkpoint.get("head") if resume else None
+        if head and self.dual_cursor:
+            self.head_cursor = dict(head)
+        elif head:
+            # Mode switched off since the checkpoint: resume from the tail; (start, last] is reprocessed
+            # and deduplicated by BizWriter (ON CONFLICT on uq_result_source)
+            print(f"[{self.name}] ⚠️ Dual-cursor mode is off: dropping the head cursor, "
+                  f"({head['start']}, {head['last']}] will be reprocessed from the tail at {last_autoindex}")
+
         success = checkpoint.get("success_count", 0) if resume else 0
         failed = checkpoint.get("fail_count", 0) if resume else 0
         total_processed_session = 0
         
+        if self.streaming and self.dual_cursor:
+            print(f"[{self.name}] ⚠️ Streaming is not used in dual-cursor mode")
+            self.streaming = None
+
         print(f"[{self.name}] 🚀 Starting Pipeline. Start Index: {last_autoindex}, Workers: {self.workers}, Loop: {loop_interval}s")
 
         while not self.stop_event:
+            self.beat()
+            self._apply_pool_target()
+            self._refresh_throttle()
+
             # Check limit
             if self.limit and total_processed_session >= self.limit:
                 print(f"[{self.name}] 🛑 Reached session limit ({self.limit}). Stopping.")
@@ -96,34 +431,70 @@ class BaseEtlPipeline(abc.ABC):
 
             # 1. Get Batch
             try:
-                batch_ids = self.get_next_batch(last_autoindex, self.batch_size)
+                fetch_started = time.perf_counter()
+                if self.dual_cursor and self.head_cursor is None:
+                    self._split_cursor(last_autoindex)
+                if self.head_cursor:
+                    head_items, tail_items = self._fetch_dual(last_autoindex)
+                    if tail_items is not None and not tail_items:
+                        # Tail reached the head's start: one cursor again
+                        print(f"[{self.name}] 🔗 Backfill complete, cursors merged at {self.head_cursor['last']}")
+                        last_autoindex = self.head_cursor["last"]
+                        self.head_cursor = None
+                    batch_ids = head_items + (tail_items or [])
+                elif self.streaming:
+                    batch_ids = self._next_chunk(last_autoindex)
+                else:
+                    batch_ids = self.get_next_batch(last_autoindex, self.batch_size)
+                self.observe_stage("fetch", fetch_started)
             except Exception as e:
                  print(f"[{self.name}] 💥 Error fetching batch: {e}")
-                 time.sleep(5)
+                 self.record_error("fetch", e)
+                 self._close_stream()
+                 self._sleep(5)
                  continue
 
             if not batch_ids:
                 if loop_interval:
                     print(f"[{self.name}] 💤 No new data. Sleeping {loop_interval}s...")
-                    time.sleep(loop_interval)
+                    metrics.IDLE.set(1, pipeline=self.name)
+                    self.update_lag(last_autoindex)
+                    self._sleep(loop_interval)
                     continue
                 else:
                     print(f"[{self.name}] ✅ No more data. Finished.")
                     break
             
             # print(f"[{self.name}] 📥 Batch: {len(batch_ids)} items ({batch_ids[0]} -> {batch_ids[-1]})")
+
+            try:
+                self.prefetch(batch_ids)
+            except Exception as e:
+                print(f"[{self.name}] ⚠️ Prefetch failed, items load their own data: {e}")
+                self.record_error("fetch", e)
             
             # 2. Process Batch Parallel
             batch_success = 0
             batch_failed = 0
             max_id_in_batch = last_autoindex
+            max_head_in_batch = self.head_cursor["last"] if self.head_cursor else None
             
             start_time = time.time()
+            metrics.IDLE.set(0, pipeline=self.name)
+            metrics.BATCH_PENDING.set(len(batch_ids), pipeline=self.name)
             
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
-                future_to_id = {executor.submit(self.process_item, idx, self.engine): idx for idx in batch_ids}
+            # One connection per in-flight item: never run more threads than the pool quota
+            workers = min(self.workers, self.pool_quota) if self.pool_quota else self.workers
+            if self._stream is not None and self.pool_quota:
+                # The open stream holds one of the quota's connections
+                workers = max(min(workers, self.pool_quota - 1), 1)
+            if self.throttle and self.throttle.limits["max_workers"]:
+                workers = min(workers, self.throttle.limits["max_workers"])
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                future_to_id = {executor.submit(self._process, idx): idx for idx in batch_ids}
                 
                 for future in concurrent.futures.as_completed(future_to_id):
+                    self.beat()
                     idx = future_to_id[future]
                     offset_val = self.get_item_offset(idx)
                     try:
@@ -133,10 +504,13 @@ class BaseEtlPipeline(abc.ABC):
                         else:
                             batch_failed += 1
                     except Exception as exc:
-                        print(f"[{self.name}] 💥 Item {idx} execution failed: {exc}")
+                        print(f"[{self.name}] 💥 Item {offset_val} execution failed: {exc}")
+                        self.record_error("item", exc)
                         batch_failed += 1
                     
-                    if offset_val > max_id_in_batch:
+                    if self.head_cursor and offset_val > self.head_cursor["start"]:
+                        max_head_in_batch = max(max_head_in_batch, offset_val)
+                    elif offset_val > max_id_in_batch:
                         max_id_in_batch = offset_val
             
             end_time = time.time()
@@ -148,8 +522,20 @@ class BaseEtlPipeline(abc.ABC):
             failed += batch_failed
             total_processed_session += len(batch_ids)
             last_autoindex = max_id_in_batch
+            if self.head_cursor:
+                self.head_cursor["last"] = max_head_in_batch
+            
+            metrics.RECORDS.inc(batch_success, pipeline=self.name, result="success")
+            metrics.RECORDS.inc(batch_failed, pipeline=self.name, result="failed")
             
             # 4. Save Checkpoint
+            checkpoint_started = time.perf_counter()
             self.save_checkpoint(last_autoindex, success, failed)
+            self.observe_stage("checkpoint", checkpoint_started)
+            metrics.LAST_PROGRESS.set(time.time(), pipeline=self.name)
+            self.update_lag(last_autoindex)
             print(f"[{self.name}] ⏱️ Batch Done. Time: {duration:.2f}s, Speed: {speed:.1f} rec/s. Total Success: {success}")
 
+        self._close_stream()
+        if self.stop_event:
+            print(f"[{self.name}] 🛑 Stopped. Last checkpoint: {last_autoindex}")
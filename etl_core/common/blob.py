@@ -0,0 +1,82 @@
+"""
+Zero-copy access to curve blobs as returned by the DB driver.
+
+bytea comes back as bytes (pg8000) or memoryview (psycopg2); some FDS
+sources store the curve as base64 text instead. Decoders take a
+memoryview and slice it without copying:
+
+    column = BlobColumn("curve")        # one per source column
+    view = column.view(row.curve)       # bytes/memoryview: no copy, str: one b64 decode
+    for frame in fds_frames(view):      # struct.iter_unpack over the view
+        ...
+    view.release()
+
+BlobColumn decides between raw bytes and base64 text on the first non-NULL
+value and only re-checks if the driver hands over something else.
+"""
+import base64
+import struct
+import threading
+import zlib
+
+FDS_HEADER_SIZE = 7816
+FDS_FRAME = struct.Struct('<hhffffffffi')
+
+
+class BlobColumn:
+    RAW = "raw"
+    BASE64 = "base64"
+
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self._lock = threading.Lock()
+
+    def _detect(self, value):
+        kind = self.BASE64 if isinstance(value, str) else self.RAW
+        with self._lock:
+            if self.kind != kind:
+                print(f"🔎 Blob column {self.name}: {kind}")
+                self.kind = kind
+        return kind
+
+    def view(self, value):
+        """memoryview over the blob bytes; None for NULL"""
+        if value is None:
+            return None
+        if self.kind == self.RAW:
+            try:
+                return memoryview(value)
+            except TypeError:
+                pass
+        elif self.kind == self.BASE64 and isinstance(value, str):
+            return memoryview(base64.b64decode(value))
+        if self._detect(value) == self.BASE64:
+            return memoryview(base64.b64decode(value))
+        return memoryview(value)
+
+
+def fds_frames(view, start_offset=FDS_HEADER_SIZE):
+    """Iterate the 40-byte frames after the header as tuples (no per-frame slices)"""
+    if view is None or len(view) <= start_offset:
+        return iter(())
+    num_rows = (len(view) - start_offset) // FDS_FRAME.size
+    return FDS_FRAME.iter_unpack(view[start_offset:start_offset + num_rows * FDS_FRAME.size])
+
+
+def gunzip(view):
+    """gzip.decompress for a buffer without copying it into BytesIO first"""
+    out = []
+    while view:
+        d = zlib.decompressobj(wbits=31)
+        out.append(d.decompress(view))
+        if not d.eof:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        view = d.unused_data.lstrip(b"\x00")
+    return out[0] if len(out) == 1 else b"".join(out)
+
+
+def float32_values(data):
+    """Little-endian float32 values of a buffer, ignoring a trailing partial value"""
+    count = len(data) // 4
+    return struct.unpack_from(f'<{count}f', data)
@@ -0,0 +1,86 @@
+"""
+Global DB connection budget for the scheduler-managed pipelines.
+
+Without it every pipeline opens pool_size=workers+5 plus max_overflow=20
+connections. With a "connection_budget" block in scheduler_config.json the
+scheduler splits max_connections into per-pipeline pool quotas
+(pool_size=quota, max_overflow=0, worker threads capped at the quota) and
+moves connections every rebalance_interval towards the pipelines with the
+largest backlog (etl_lag_records). Quotas shrink before they grow, so the
+sum never exceeds the budget while pipelines resize between batches.
+
+    "connection_budget": {
+        "max_connections": 40,
+        "min_per_pipeline": 2,
+        "rebalance_interval": 60,
+        "pgbouncer": {"host": "127.0.0.1", "port": 6432}
+    }
+
+pgbouncer (optional) routes the pipeline pools through a local
+PgBouncer-style multiplexer in transaction mode; set its default_pool_size
+to max_connections so the server side stays within the budget too. The API
+server has its own bounded pool (ETL_API_POOL_SIZE / ETL_API_MAX_OVERFLOW).
+"""
+
+BUDGET_DEFAULTS = {
+    "max_connections": 40,
+    "min_per_pipeline": 2,
+    "rebalance_interval": 60,
+    "pgbouncer": None,
+}
+
+
+def allocate(limit, demands, minimum=2):
+    """
+    Split `limit` connections over {name: {"workers": int, "backlog": int or None}}.
+    Everyone gets `minimum` (capped at workers); the rest goes by backlog share,
+    never above a pipeline's worker count. Returns {name: quota}.
+    """
+    if not demands:
+        return {}
+    caps = {name: max(d["workers"], 1) for name, d in demands.items()}
+    quotas = {name: min(minimum, caps[name]) for name in demands}
+    if sum(quotas.values()) > limit:
+        print(f"[Budget] ⚠️ max_connections={limit} is below the minimum of {sum(quotas.values())}, using the minimum")
+        return quotas
+
+    remaining = limit - sum(quotas.values())
+    while remaining > 0:
+        open_names = [n for n in demands if quotas[n] < caps[n]]
+        if not open_names:
+            break
+        weights = {n: max(demands[n].get("backlog") or 0, 0) + 1 for n in open_names}
+        total_weight = sum(weights.values())
+        shares = {n: remaining * weights[n] / total_weight for n in open_names}
+        granted = 0
+        for n in open_names:
+            add = min(int(shares[n]), caps[n] - quotas[n])
+            quotas[n] += add
+            granted += add
+        if granted == 0:
+            # Hand out the rounding remainder one by one, largest share first
+            for n in sorted(open_names, key=lambda n: shares[n], reverse=True):
+                if remaining - granted == 0:
+                    break
+                quotas[n] += 1
+                granted += 1
+        remaining -= granted
+    return quotas
+
+
+def grant(limit, targets, committed):
+    """
+    Quota each pipeline may switch to now. Shrinking is always allowed;
+    growing only into connections the others have already released
+    (committed = max(applied, target) per pipeline).
+    """
+    grants = {}
+    for name, target in targets.items():
+        current = committed.get(name, 0)
+        if target <= current:
+            grants[name] = target
+            continue
+        others = sum(c for n, c in committed.items() if n != name)
+        grants[name] = max(min(target, limit - others), current)
+        committed[name] = grants[name]
+    return grants
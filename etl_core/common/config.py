@@ -1,9 +1,21 @@
+import os
 
+# Defaults point at the production database; ETL_DB_* environment variables
+# override them (e.g. a local Postgres for benchmarks).
 DB_CONFIG = {
-    'host': '10.18.120.240',
-    'port': 35432,
-    'database': 'equipment_mechanism',
-    'user': 'postgres',
-    'password': '6edef2d746f2274cab951a452d5fc13d',
-    'driver': 'pg8000'
+    'host': os.environ.get('ETL_DB_HOST', '10.18.120.240'),
+    'port': int(os.environ.get('ETL_DB_PORT', 35432)),
+    'database': os.environ.get('ETL_DB_NAME', 'equipment_mechanism'),
+    'user': os.environ.get('ETL_DB_USER', 'postgres'),
+    'password': os.environ.get('ETL_DB_PASSWORD', '6edef2d746f2274cab951a452d5fc13d'),
+    'driver': os.environ.get('ETL_DB_DRIVER', 'pg8000')
+}
+
+# api_server.py pool, bounded so the API stays within its share of the
+# connection budget (the ETL share is scheduler_config.json "connection_budget").
+# The realtime LISTEN connection comes on top of pool_size + max_overflow.
+API_POOL = {
+    'pool_size': int(os.environ.get('ETL_API_POOL_SIZE', 10)),
+    'max_overflow': int(os.environ.get('ETL_API_MAX_OVERFLOW', 5)),
+    'pool_timeout': int(os.environ.get('ETL_API_POOL_TIMEOUT', 30)),
 }
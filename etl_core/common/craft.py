@@ -0,0 +1,171 @@
+"""
+Declarative base for craft pipelines (FDS, SPR, welding, gluing, ...).
+
+A craft only describes its source and how a source record maps to the biz
+model; batching, cursors, metrics and the biz.* writes are shared:
+
+    class GluePipeline(CraftPipeline):
+        CRAFT_TYPE = "GLUE"
+        SOURCE_TABLE = "origin.bs_glue_results"   # offsets for get_next_batch
+        OFFSET_COLUMN = "id"
+        SOURCE_COLUMNS = None                      # streamed with each item (see below)
+
+        def fetch(self, conn, item): ...           # source queries -> dict or None
+        def decode(self, source): ...              # curve decoder
+        def transform(self, source, decoded): ...  # -> record for BizWriter (see common/sink.py)
+
+A craft may also offer alternative source adapters in SOURCES (name ->
+class); use_source() swaps one in for batch, head and stream queries. An
+adapter implements next_batch(engine, last, batch_size, upper_bound),
+head(engine) and stream_query(last), hands out offsets or Rows and sets
+DUAL_CURSOR to whether it can serve the bounded tail queries. An adapter
+with a check(engine) method has it run once by use_source(), to refuse a
+source whose assumptions do not hold for the database.
+
+Offsets are handed out once each (DISTINCT) even when SOURCE_TABLE holds
+several rows per offset; BizWriter additionally skips a record whose
+(source_id, craft_type, start_time) is already in biz.result. run() checks
+the biz schema BizWriter needs first and raises ValueError when a migration
+is missing.
+
+In streaming mode (enable_streaming) the items come from one server-side
+cursor over SOURCE_TABLE. With SOURCE_COLUMNS set the whole source row,
+blobs included, is streamed and fetch() receives that Row instead of an
+offset; otherwise only the offsets are streamed.
+"""
+import abc
+import time
+from sqlalchemy import Row, text
+from .base import BaseEtlPipeline
+from .sink import BizWriter
+
+
+class CraftPipeline(BaseEtlPipeline):
+    CRAFT_TYPE = None
+    SOURCE_TABLE = None
+    OFFSET_COLUMN = None
+    SOURCE_COLUMNS = None
+    SOURCES = {}
+
+    def __init__(self, name, checkpoint_file, batch_size=200, workers=10, limit=None):
+        super().__init__(name, checkpoint_file, batch_size, workers, limit)
+        self.writer = BizWriter()
+        self.source = None  # source adapter from SOURCES, None = SOURCE_TABLE
+
+    def use_source(self, type, **options):
+        """Read through the SOURCES adapter `type` instead of SOURCE_TABLE"""
+        if type not in self.SOURCES:
+            raise ValueError(f"{self.name}: unknown source '{type}' (available: {', '.join(self.SOURCES) or 'none'})")
+        source = self.SOURCES[type](**options)
+        if hasattr(source, "check"):
+            source.check(self.engine)
+        self.source = source
+        print(f"[{self.name}] 🔌 Source: {type}")
+        if self.dual_cursor and not self.source.DUAL_CURSOR:
+            print(f"[{self.name}] ⚠️ Source '{type}' does not support the dual-cursor mode, disabled")
+            self.dual_cursor = None
+
+    def run(self, *args, **kwargs):
+        """Refuse to start on an unmigrated biz schema (BizWriter.check), where every item would fail"""
+        self.writer.check(self.engine)
+        return super().run(*args, **kwargs)
+
+    def enable_dual_cursor(self, *args, **kwargs):
+        if self.source and not self.source.DUAL_CURSOR:
+            print(f"[{self.name}] ⚠️ Current source does not support the dual-cursor mode, not enabled")
+            return
+        super().enable_dual_cursor(*args, **kwargs)
+
+    def get_next_batch(self, last_autoindex, batch_size, upper_bound=None):
+        if self.source:
+            return self.source.next_batch(self.engine, last_autoindex, batch_size, upper_bound)
+        params = {"last_idx": last_autoindex, "batch": batch_size}
+        upper_sql = ""
+        if upper_bound is not None:
+            upper_sql = f"AND {self.OFFSET_COLUMN} <= :upper_idx"
+            params["upper_idx"] = upper_bound
+        with self.engine.connect() as conn:
+            query = text(f"""
+                SELECT DISTINCT {self.OFFSET_COLUMN}
+                FROM {self.SOURCE_TABLE}
+                WHERE {self.OFFSET_COLUMN} > :last_idx {upper_sql}
+                ORDER BY {self.OFFSET_COLUMN}
+                LIMIT :batch
+            """)
+            return [row[0] for row in conn.execute(query, params).fetchall()]
+
+    def get_source_head(self):
+        if self.source:
+            return self.source.head(self.engine)
+        with self.engine.connect() as conn:
+            return conn.execute(text(f"""
+                SELECT {self.OFFSET_COLUMN} FROM {self.SOURCE_TABLE}
+                ORDER BY {self.OFFSET_COLUMN} DESC LIMIT 1
+            """)).scalar()
+
+    def stream_query(self, last_autoindex):
+        if self.source:
+            return self.source.stream_query(last_autoindex)
+        if self.SOURCE_COLUMNS:
+            columns = f"DISTINCT ON ({self.OFFSET_COLUMN}) {self.SOURCE_COLUMNS}"
+        else:
+            columns = f"DISTINCT {self.OFFSET_COLUMN}"
+        return text(f"""
+            SELECT {columns}
+            FROM {self.SOURCE_TABLE}
+            WHERE {self.OFFSET_COLUMN} > :last_idx
+            ORDER BY {self.OFFSET_COLUMN}
+        """), {"last_idx": last_autoindex}
+
+    def get_item_offset(self, item):
+        if isinstance(item, Row):
+            return item._mapping[self.OFFSET_COLUMN]
+        return item
+
+    def already_loaded(self, conn, item):
+        """Return True to skip an item whose result is already in biz before fetching its source"""
+        return False
+
+    @abc.abstractmethod
+    def fetch(self, conn, item):
+        """Run the source queries for one item (offset or streamed Row); None if the source record is gone"""
+
+    @abc.abstractmethod
+    def decode(self, source):
+        """Decode the curve blobs of a fetched record"""
+
+    @abc.abstractmethod
+    def transform(self, source, decoded):
+        """Map a fetched record and its decoded curves to a BizWriter record"""
+
+    def process_item(self, item, engine):
+        try:
+            with engine.begin() as conn:
+                read_started = time.perf_counter()
+                if self.already_loaded(conn, item):
+                    return True
+                source = self.fetch(conn, item)
+                if not source:
+                    return False
+                self.observe_stage("read", read_started)
+
+                parse_started = time.perf_counter()
+                decoded = self.decode(source)
+                self.observe_stage("parse", parse_started)
+                self.trace("parse", parse_started)
+
+                record = self.transform(source, decoded)
+                write_started = time.perf_counter()
+                _, new_programs = self.writer.write(conn, record, self.trace, publish=self.publishing())
+                t = time.perf_counter()
+
+            self.trace("commit", t)
+            self.observe_stage("write", write_started)
+            self.writer.remember_programs(new_programs)
+            self.mark_source_time(record["result"]["start_time"])
+            return True
+
+        except Exception as e:
+            print(f"[{self.name}] ❌ Error processing {self.get_item_offset(item)}: {e}")
+            self.record_error("item", e)
+            return False
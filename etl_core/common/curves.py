@@ -0,0 +1,188 @@
+"""
+Curve helpers shared by the API server and the pipelines.
+Curves are stored in biz.curve.data_points as {"x": [...], "y": [...]}.
+"""
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Keeps the first and last point and, per bucket, the point forming the
+    largest triangle with the previous pick and the next bucket's average.
+    Returns (x, y) lists with at most `threshold` points.
+    """
+    n = min(len(x), len(y))
+    if threshold >= n or threshold < 3:
+        return list(x[:n]), list(y[:n])
+
+    out_x = [x[0]]
+    out_y = [y[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket (the "third" point of the triangle)
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_len = avg_end - avg_start
+        avg_x = sum(x[avg_start:avg_end]) / avg_len
+        avg_y = sum(y[avg_start:avg_end]) / avg_len
+
+        # Current bucket
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+
+        ax = x[a]
+        ay = y[a]
+        max_area = -1.0
+        next_a = range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+
+        out_x.append(x[next_a])
+        out_y.append(y[next_a])
+        a = next_a
+
+    out_x.append(x[n - 1])
+    out_y.append(y[n - 1])
+    return out_x, out_y
+
+
+def min_max(x, y, threshold):
+    """
+    Min/max-per-bucket downsampling.
+    Splits the series into threshold // 2 buckets and keeps the minimum and
+    maximum point of each one in their original order, so spikes survive.
+    """
+    n = min(len(x), len(y))
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return list(x[:n]), list(y[:n])
+
+    out_x = []
+    out_y = []
+    size = n / buckets
+    for b in range(buckets):
+        start = int(b * size)
+        end = min(int((b + 1) * size), n)
+        if start >= end:
+            continue
+        lo = hi = start
+        for j in range(start + 1, end):
+            if y[j] < y[lo]:
+                lo = j
+            elif y[j] > y[hi]:
+                hi = j
+        for j in sorted({lo, hi}):
+            out_x.append(x[j])
+            out_y.append(y[j])
+
+    # Always keep the true end of the curve
+    if out_x and out_x[-1] != x[n - 1]:
+        out_x.append(x[n - 1])
+        out_y.append(y[n - 1])
+    return out_x, out_y
+
+
+def downsample(data_points, width, method='lttb'):
+    """
+    Downsample a {"x", "y"} payload to roughly `width` points.
+    Payloads without x/y arrays are returned unchanged.
+    """
+    if not data_points or not width:
+        return data_points
+    x = data_points.get('x')
+    y = data_points.get('y')
+    if not x or not y:
+        return data_points
+
+    if method == 'minmax':
+        ds_x, ds_y = min_max(x, y, width)
+    elif method == 'lttb':
+        ds_x, ds_y = lttb(x, y, width)
+    else:
+        raise ValueError(f"Unknown downsample method: {method}")
+    return {"x": ds_x, "y": ds_y}
+
+
+def resample_linear(x, y, grid):
+    """
+    Linearly interpolate one step's curve onto a sorted grid.
+    Points are sorted by x when x is not monotonic, so never pass several
+    steps concatenated (their x, e.g. an angle, restarts every step).
+    Grid points outside the curve's x range are None.
+    """
+    n = min(len(x), len(y))
+    if n == 0:
+        return [None] * len(grid)
+    pairs = list(zip(x[:n], y[:n]))
+    if any(pairs[i][0] > pairs[i + 1][0] for i in range(n - 1)):
+        pairs.sort(key=lambda p: p[0])
+
+    out = []
+    j = 0
+    x_first = pairs[0][0]
+    x_last = pairs[-1][0]
+    for g in grid:
+        if g < x_first or g > x_last:
+            out.append(None)
+            continue
+        while j < n - 2 and pairs[j + 1][0] < g:
+            j += 1
+        if n == 1:
+            out.append(pairs[0][1])
+            continue
+        x0, y0 = pairs[j]
+        x1, y1 = pairs[j + 1]
+        if x1 == x0:
+            out.append(y1)
+        else:
+            out.append(y0 + (y1 - y0) * (g - x0) / (x1 - x0))
+    return out
+
+
+def make_grid(x_min, x_max, width):
+    """Evenly spaced grid of `width` points over [x_min, x_max]"""
+    if width < 2 or x_max <= x_min:
+        return [x_min]
+    step = (x_max - x_min) / (width - 1)
+    return [x_min + i * step for i in range(width)]
+
+
+def _percentile(sorted_vals, q):
+    pos = (len(sorted_vals) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (pos - lo)
+
+
+def band_stats(aligned, percentiles=(0.1, 0.5, 0.9)):
+    """
+    Column-wise statistics over curves aligned to the same grid.
+    Returns {"count", "min", "max", "mean", "p10", "p50", ...} lists with
+    None where no curve covers a grid point.
+    """
+    stats = {"count": [], "min": [], "max": [], "mean": []}
+    p_keys = [f"p{int(round(q * 100))}" for q in percentiles]
+    for key in p_keys:
+        stats[key] = []
+
+    for column in zip(*aligned):
+        vals = sorted(v for v in column if v is not None)
+        stats["count"].append(len(vals))
+        if not vals:
+            for key in stats:
+                if key != "count":
+                    stats[key].append(None)
+            continue
+        stats["min"].append(vals[0])
+        stats["max"].append(vals[-1])
+        stats["mean"].append(sum(vals) / len(vals))
+        for key, q in zip(p_keys, percentiles):
+            stats[key].append(_percentile(vals, q))
+    return stats
@@ -1,7 +1,8 @@
-
 from sqlalchemy import create_engine
 from .config import DB_CONFIG
 
-def create_db_engine(pool_size=10, max_overflow=20):
-    conn_str = f"postgresql+{DB_CONFIG['driver']}://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+def create_db_engine(pool_size=10, max_overflow=20, **overrides):
+    """overrides replace DB_CONFIG entries, e.g. host/port of a local PgBouncer"""
+    cfg = {**DB_CONFIG, **overrides}
+    conn_str = f"postgresql+{cfg['driver']}://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['database']}"
     return create_engine(conn_str, echo=False, pool_size=pool_size, max_overflow=max_overflow)
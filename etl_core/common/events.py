@@ -0,0 +1,41 @@
+import json
+from sqlalchemy import text
+
+# Postgres NOTIFY channel carrying compact summaries of newly committed results.
+# NOTIFY is transactional: listeners only see the event once the ETL transaction commits.
+EVENT_CHANNEL = "biz_events"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+_notify = text("SELECT pg_notify(:channel, :payload)")
+
+
+def result_event(result_id, device_name, craft_type, result_status, start_time,
+                 program_id=None, key_value=None, alarms=None, cyclenumber=None,
+                 bsn=None, cycle_time=None):
+    """Build the summary published for one biz.result row (and its alarms)"""
+    return {
+        "type": "result",
+        "id": result_id,
+        "device_name": device_name,
+        "craft_type": craft_type,
+        "result_status": result_status,
+        "start_time": start_time.isoformat() if start_time else None,
+        "program_id": program_id,
+        "cyclenumber": cyclenumber,
+        "bsn": bsn,
+        "cycle_time": cycle_time,
+        "key_value": key_value,
+        "alarms": alarms or []
+    }
+
+
+def publish_event(conn, event):
+    """Queue an event on the current transaction; it is delivered on commit"""
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES and event.get("alarms"):
+        # Keep the summary, drop the alarm detail
+        event = dict(event, alarms=[], alarm_count=len(event["alarms"]))
+        payload = json.dumps(event, ensure_ascii=False, default=str)
+    conn.execute(_notify, {"channel": EVENT_CHANNEL, "payload": payload})
@@ -0,0 +1,220 @@
+"""
+Index set required by the API server and the pipelines.
+Each entry names the queries it serves, so an index can be dropped together
+with the last query that needs it.
+
+Indexes are built with CREATE INDEX CONCURRENTLY so they can be applied to
+a live database. Partitioned tables (biz.result) do not support CONCURRENTLY
+directly: the parent index is created ON ONLY the parent, each partition is
+indexed concurrently and then attached.
+"""
+from sqlalchemy import text
+
+INDEXES = [
+    # --- biz.result ---
+    {
+        "name": "idx_result_device_time",
+        "table": "biz.result",
+        "columns": "device_name, start_time DESC",
+        "serves": "GET /api/devices/{name}, /api/devices/{name}/results, /api/devices stats, /api/curves/compare?device_name",
+    },
+    {
+        "name": "idx_result_start_time",
+        "table": "biz.result",
+        "columns": "start_time DESC",
+        "serves": "GET /api/results (ORDER BY start_time DESC LIMIT), /api/stats 7-day trend",
+    },
+    {
+        "name": "idx_result_nok_time",
+        "table": "biz.result",
+        "columns": "start_time DESC",
+        "where": "result_status = 0",
+        "serves": "GET /api/results?status=0, /api/stats nok_count",
+    },
+    {
+        # Unique indexes on a partitioned table must include the partition key
+        "name": "uq_result_source",
+        "table": "biz.result",
+        "columns": "source_id, craft_type, start_time",
+        "unique": True,
+        "serves": "BizWriter INSERT ... ON CONFLICT (source_id, craft_type, start_time), SprPipeline existence check",
+    },
+    {
+        "name": "idx_result_program_time",
+        "table": "biz.result",
+        "columns": "program_id, start_time DESC",
+        "serves": "GET /api/curves/compare?program_id",
+    },
+    # --- biz.curve ---
+    {
+        "name": "idx_curve_result_step",
+        "table": "biz.curve",
+        "columns": "result_id, step, curve_type",
+        "serves": "GET /api/results/{id}/curves[/raw] (WHERE result_id ORDER BY step, curve_type), /api/curves/compare join",
+    },
+    # --- biz.alarm ---
+    {
+        "name": "idx_alarm_device_time",
+        "table": "biz.alarm",
+        "columns": "device_id, create_time DESC",
+        "serves": "GET /api/devices alarm stats, /api/devices/{name}/alarms",
+    },
+    {
+        "name": "idx_alarm_create_time",
+        "table": "biz.alarm",
+        "columns": "create_time DESC",
+        "serves": "GET /api/alarms (ORDER BY create_time DESC LIMIT)",
+    },
+    # --- biz.step_kpi ---
+    {
+        "name": "idx_step_kpi_result",
+        "table": "biz.step_kpi",
+        "columns": "result_id, step_index",
+        "serves": "KPIs of one result / step (joins from biz.result and biz.step)",
+    },
+    {
+        "name": "idx_step_kpi_type_value",
+        "table": "biz.step_kpi",
+        "columns": "kpi_type, step_index, value",
+        "serves": "GET /api/results?kpi_type&kpi_step&min_kpi/max_kpi",
+    },
+    # --- biz.result_kpi ---
+    {
+        "name": "idx_result_kpi_force",
+        "table": "biz.result_kpi",
+        "columns": "final_force",
+        "serves": "GET /api/results?min_force/max_force",
+    },
+    {
+        "name": "idx_result_kpi_stroke",
+        "table": "biz.result_kpi",
+        "columns": "final_stroke",
+        "serves": "GET /api/results?min_stroke/max_stroke",
+    },
+    {
+        "name": "idx_result_kpi_velocity",
+        "table": "biz.result_kpi",
+        "columns": "velocity",
+        "serves": "GET /api/results?min_velocity/max_velocity",
+    },
+    # --- biz.spc_bucket ---
+    {
+        "name": "idx_spc_bucket_time",
+        "table": "biz.spc_bucket",
+        "columns": "bucket_start",
+        "serves": "GET /api/spc/series (series active in a time window)",
+    },
+    # --- biz.device_uri ---
+    {
+        "name": "idx_device_uri_device",
+        "table": "biz.device_uri",
+        "columns": "device_id, level, id",
+        "serves": "WS /ws/device/{id}, realtime poller, GET /api/devices/{name}/uris",
+    },
+]
+
+
+def index_sql(index, concurrently=True, only=False, table=None, name=None):
+    """CREATE INDEX statement for one entry of INDEXES"""
+    where = f" WHERE {index['where']}" if index.get("where") else ""
+    return (
+        f"CREATE {'UNIQUE ' if index.get('unique') else ''}INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name or index['name']} "
+        f"ON {'ONLY ' if only else ''}{table or index['table']} ({index['columns']}){where}"
+    )
+
+
+def _split(table):
+    schema, _, rel = table.partition(".")
+    return schema, rel
+
+
+def _table_kind(conn, table):
+    schema, rel = _split(table)
+    return conn.execute(text("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :rel
+    """), {"schema": schema, "rel": rel}).scalar()
+
+
+def _partitions(conn, table):
+    schema, rel = _split(table)
+    rows = conn.execute(text("""
+        SELECT cn.nspname, c.relname
+        FROM pg_inherits i
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace pn ON pn.oid = p.relnamespace
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace cn ON cn.oid = c.relnamespace
+        WHERE pn.nspname = :schema AND p.relname = :rel
+        ORDER BY c.relname
+    """), {"schema": schema, "rel": rel}).fetchall()
+    return [f"{r[0]}.{r[1]}" for r in rows]
+
+
+def _index_valid(conn, schema, name):
+    """True/False for an existing index, None if it does not exist"""
+    return conn.execute(text("""
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :name
+    """), {"schema": schema, "name": name}).scalar()
+
+
+def _drop_if_invalid(conn, schema, name, dry_run):
+    """A failed CONCURRENTLY build leaves an INVALID index behind that IF NOT EXISTS would keep"""
+    if _index_valid(conn, schema, name) is False:
+        _run(conn, f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{name}", dry_run)
+
+
+def _is_attached(conn, schema, parent_index, child_index):
+    return conn.execute(text("""
+        SELECT 1 FROM pg_inherits i
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = :schema AND p.relname = :parent AND c.relname = :child
+    """), {"schema": schema, "parent": parent_index, "child": child_index}).scalar() is not None
+
+
+def _run(conn, sql, dry_run):
+    print(f"  {sql};")
+    if not dry_run:
+        conn.execute(text(sql))
+
+
+def apply_indexes(engine, indexes=INDEXES, dry_run=False):
+    """Create every missing index without blocking writes"""
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index in indexes:
+            kind = _table_kind(conn, index["table"])
+            print(f"[{index['name']}] {index['table']} ({index['columns']}) <- {index['serves']}")
+            if kind is None:
+                print(f"  ⚠️ {index['table']} does not exist, skipped")
+                continue
+
+            schema, _ = _split(index["table"])
+            if kind != "p":
+                _drop_if_invalid(conn, schema, index["name"], dry_run)
+                _run(conn, index_sql(index), dry_run)
+                continue
+
+            # Partitioned: parent ON ONLY (stays invalid until every partition is attached)
+            if _index_valid(conn, schema, index["name"]):
+                print("  ✓ exists")
+                continue
+            _run(conn, index_sql(index, concurrently=False, only=True), dry_run)
+            for partition in _partitions(conn, index["table"]):
+                part_schema, part_rel = _split(partition)
+                child_name = f"{index['name']}_{part_rel}"[:63]
+                _drop_if_invalid(conn, part_schema, child_name, dry_run)
+                _run(conn, index_sql(index, table=partition, name=child_name), dry_run)
+                if dry_run or not _is_attached(conn, schema, index["name"], child_name):
+                    _run(conn, f"ALTER INDEX {schema}.{index['name']} ATTACH PARTITION {part_schema}.{child_name}", dry_run)
+
+        if not dry_run:
+            # Refresh planner statistics for the tables we touched
+            for table in sorted({i["table"] for i in indexes}):
+                if _table_kind(conn, table):
+                    conn.execute(text(f"ANALYZE {table}"))
@@ -0,0 +1,223 @@
+"""
+In-process metrics registry with a Prometheus text endpoint.
+
+Each pipeline process owns one REGISTRY; BaseEtlPipeline records into it and
+the scheduler exposes it with start_metrics_server(port) (metrics_port in
+scheduler_config.json). No client library is needed: the exposition format
+is plain text.
+
+    etl_stage_seconds{pipeline,stage}        histogram: fetch, read, parse, write, checkpoint, item
+    etl_records_total{pipeline,result}       success / failed
+    etl_statements_total{pipeline}           SQL statements sent (statements/record = / records)
+    etl_errors_total{pipeline,stage,type}    exceptions by stage and class
+    etl_batch_pending{pipeline}              items of the current batch not finished yet
+    etl_lag_records{pipeline}                source head - checkpoint (head cursor in dual-cursor mode)
+    etl_backfill_records{pipeline}           records left for the tail cursor to backfill
+    etl_lag_seconds{pipeline}                now - newest source timestamp processed
+    etl_last_progress_timestamp{pipeline}    unix time of the last completed batch
+    etl_idle{pipeline}                       1 while sleeping because the source is drained
+    etl_throttle_wait_seconds_total{pipeline} time items waited for the rate limits
+    etl_pool_checkout_seconds{pipeline}      histogram: wait for a pooled connection
+    etl_pool_checked_out{pipeline}           connections in use
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_one(key, value))
+        return lines
+
+    def _render_one(self, key, value):
+        return [f"{self.name}{_label_str(self.label_names, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                entry[0][i] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _render_one(self, key, value):
+        counts, total, total_sum = value
+        names = self.label_names + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_label_str(names, key + (repr(bound),))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_label_str(names, key + ('+Inf',))} {total}")
+        lines.append(f"{self.name}_sum{_label_str(self.label_names, key)} {total_sum}")
+        lines.append(f"{self.name}_count{_label_str(self.label_names, key)} {total}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def add_collector(self, fn):
+        """fn() is called before every render, e.g. to refresh pool gauges"""
+        self._collectors.append(fn)
+
+    def render(self):
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception as e:
+                print(f"[Metrics] ⚠️ Collector failed: {e}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Pipeline metrics ---
+STAGE_SECONDS = REGISTRY.histogram("etl_stage_seconds", "Time spent per pipeline stage", ("pipeline", "stage"))
+RECORDS = REGISTRY.counter("etl_records_total", "Records processed", ("pipeline", "result"))
+STATEMENTS = REGISTRY.counter("etl_statements_total", "SQL statements executed", ("pipeline",))
+ERRORS = REGISTRY.counter("etl_errors_total", "Errors by stage and exception type", ("pipeline", "stage", "type"))
+BATCH_PENDING = REGISTRY.gauge("etl_batch_pending", "Items of the current batch not finished yet", ("pipeline",))
+LAG_RECORDS = REGISTRY.gauge("etl_lag_records", "Source head minus checkpoint", ("pipeline",))
+BACKFILL_RECORDS = REGISTRY.gauge("etl_backfill_records", "Records left for the tail cursor", ("pipeline",))
+LAG_SECONDS = REGISTRY.gauge("etl_lag_seconds", "Seconds behind the newest source timestamp processed", ("pipeline",))
+LAST_PROGRESS = REGISTRY.gauge("etl_last_progress_timestamp", "Unix time of the last completed batch", ("pipeline",))
+IDLE = REGISTRY.gauge("etl_idle", "1 while waiting for new source data", ("pipeline",))
+THROTTLE_WAIT = REGISTRY.counter("etl_throttle_wait_seconds_total", "Seconds items waited for rate limits", ("pipeline",))
+POOL_CHECKOUT = REGISTRY.histogram("etl_pool_checkout_seconds", "Wait for a pooled DB connection", ("pipeline",))
+POOL_CHECKED_OUT = REGISTRY.gauge("etl_pool_checked_out", "Pooled DB connections in use", ("pipeline",))
+POOL_SIZE = REGISTRY.gauge("etl_pool_size", "Configured pool size", ("pipeline",))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0", registry=REGISTRY):
+    """Serve GET /metrics from a daemon thread; returns the server"""
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[Metrics] 📈 Serving http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,124 @@
+"""
+Low-overhead sampling profiler, toggled at runtime.
+
+A daemon thread samples sys._current_frames() every interval_ms for N
+seconds (no sys.setprofile, so the sampled threads run at full speed) and
+writes a flamegraph-ready collapsed-stack file:
+
+    {output_dir}/{name}_{YYYYmmdd_HHMMSS}.collapsed
+    thread;outer_fn (file.py:12);inner_fn (file.py:34) 57
+
+Render with flamegraph.pl or speedscope. Triggers:
+- SIGUSR1 to the process (POSIX): profile for the configured seconds
+- control file {control_dir}/profile_{name}: profile for the seconds
+  written in the file (or the default); the file is removed once read
+"""
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+_THREAD_SUFFIX = re.compile(r"[-_]\d+")
+
+
+class StackSampler:
+    def __init__(self, name, output_dir="profiles", interval_ms=10):
+        self.name = name
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000.0
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self, seconds):
+        """Start a sampling run in the background; ignored if one is running"""
+        with self._lock:
+            if self._running:
+                print(f"[Profiler] ⚠️ {self.name}: already profiling")
+                return False
+            self._running = True
+        threading.Thread(target=self._run, args=(seconds,), name="stack-sampler", daemon=True).start()
+        return True
+
+    def _run(self, seconds):
+        try:
+            print(f"[Profiler] 🔬 {self.name}: sampling for {seconds}s")
+            stacks, samples = self.sample(seconds)
+            path = self.write(stacks)
+            print(f"[Profiler] 💾 {self.name}: {samples} samples -> {path}")
+        except Exception as e:
+            print(f"[Profiler] ❌ {self.name}: {e}")
+        finally:
+            with self._lock:
+                self._running = False
+
+    def sample(self, seconds):
+        me = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {t.ident: _THREAD_SUFFIX.sub("", t.name) for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+    def write(self, stacks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.name}_{datetime.now():%Y%m%d_%H%M%S}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _watch_control_file(sampler, path, default_seconds, poll_interval):
+    while True:
+        time.sleep(poll_interval)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r") as f:
+                content = f.read().strip()
+            os.remove(path)
+            seconds = float(content) if content else default_seconds
+        except (OSError, ValueError) as e:
+            print(f"[Profiler] ⚠️ Bad control file {path}: {e}")
+            seconds = default_seconds
+        sampler.start(seconds)
+
+
+def install_profiler(name, output_dir="profiles", control_dir=None, seconds=30, interval_ms=10, poll_interval=2.0):
+    """
+    Arm the triggers for this process. Call from the main thread
+    (signal handlers can only be installed there).
+    """
+    sampler = StackSampler(name, output_dir, interval_ms)
+
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: sampler.start(seconds))
+
+    if control_dir:
+        os.makedirs(control_dir, exist_ok=True)
+        path = os.path.join(control_dir, f"profile_{name}")
+        threading.Thread(
+            target=_watch_control_file, args=(sampler, path, seconds, poll_interval),
+            name="profile-control", daemon=True
+        ).start()
+    return sampler
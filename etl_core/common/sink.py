@@ -0,0 +1,278 @@
+"""
+Shared writer for the biz.* target tables.
+
+Every craft pipeline turns one source record into the same model and hands
+it to BizWriter.write(), so write-path optimizations live here once:
+
+    {
+        "programs": [{"program_id", "version", "program_name", "device_type",
+                      "craft_type", "parameter_type", "target_value",
+                      "upper_limit", "lower_limit"}, ...],
+        "program_key": parameter_type of the program biz.result links to
+                       (default: the first one),
+        "result": {"source_id", "cyclenumber", "device_name", "system_id", "bsn",
+                   "vin", "program_id", "result_status", "start_time", "end_time",
+                   "cycle_time", "craft_type", "key_value"},
+        "extension": {"extra_data": dict, "operator_id", "fixture_id"},
+        "kpi": {typed result-level KPIs, see RESULT_KPI_COLUMNS} or None,
+        "steps": [{"step_index", "step_name", "step_result", "step_value",
+                   "target_value", "start_time", "end_time",
+                   "curves": [(curve_type, data_points_json)],
+                   "kpis": [(kpi_type, value, result_index)],
+                   "alarm": {"code", "level", "msg", "device_id"} or None}, ...],
+    }
+
+A record whose (source_id, craft_type, start_time) is already in biz.result
+(uq_result_source) is skipped as a whole: write() returns result_id None.
+
+Writes per record: program ids are cached per process (after commit), and
+steps, curves, step KPIs (biz.step_kpi) and alarms go out as one multi-row
+INSERT each instead of one statement per row. "kpi" is a typed projection of
+the commonly filtered extra_data values into biz.result_kpi. key_value and
+step values are merged into the SPC buckets (biz.spc_bucket, see common/spc.py)
+with one upsert. The dashboard NOTIFY is published on the same transaction
+unless the pipeline turned it off for this item (set_event_publishing()).
+
+check() verifies the objects added by the migrations (REQUIRED_SCHEMA) are in
+place; CraftPipeline.run() refuses to start otherwise instead of failing
+every item.
+"""
+import json
+import threading
+import time
+from sqlalchemy import text
+from .events import publish_event, result_event
+from .spc import SPC_COLUMNS, MERGE_SQL, record_rows
+
+RESULT_COLUMNS = ("source_id", "cyclenumber", "device_name", "system_id", "bsn", "vin",
+                  "program_id", "program_ver_id", "result_status", "start_time", "end_time",
+                  "cycle_time", "craft_type", "key_value")
+PROGRAM_COLUMNS = ("program_id", "version", "program_name", "device_type", "craft_type",
+                   "parameter_type", "target_value", "upper_limit", "lower_limit")
+STEP_COLUMNS = ("result_id", "step_index", "step_name", "step_result", "step_value",
+                "target_value", "start_time", "end_time")
+CURVE_COLUMNS = ("result_id", "step", "start_time", "end_time", "curve_type", "data_points")
+RESULT_KPI_COLUMNS = ("result_id", "start_time", "craft_type", "final_force", "final_stroke",
+                      "start_distance", "end_distance", "velocity",
+                      "force_limit_high", "force_limit_low", "stroke_limit_high", "stroke_limit_low")
+STEP_KPI_COLUMNS = ("result_id", "step_index", "kpi_type", "value", "result_index", "start_time")
+ALARM_COLUMNS = ("result_id", "step_id", "alarm_code", "alarm_level", "alarm_msg", "device_id")
+
+_insert_program = text(f"""
+    INSERT INTO biz.program ({", ".join(PROGRAM_COLUMNS)})
+    VALUES ({", ".join(":" + c for c in PROGRAM_COLUMNS)})
+    ON CONFLICT (program_id, version, parameter_type) DO NOTHING
+    RETURNING id
+""")
+_fetch_program = text("SELECT id FROM biz.program WHERE program_id = :program_id AND version = :version AND parameter_type = :parameter_type")
+_insert_result = text(f"""
+    INSERT INTO biz.result ({", ".join(RESULT_COLUMNS)})
+    VALUES ({", ".join(":" + c for c in RESULT_COLUMNS)})
+    ON CONFLICT (source_id, craft_type, start_time) DO NOTHING
+    RETURNING id
+""")
+_insert_extension = text("""
+    INSERT INTO biz.extension (result_id, extra_data, operator_id, fixture_id)
+    VALUES (:result_id, CAST(:extra_data AS jsonb), :operator_id, :fixture_id)
+""")
+
+_insert_result_kpi = text(f"""
+    INSERT INTO biz.result_kpi ({", ".join(RESULT_KPI_COLUMNS)})
+    VALUES ({", ".join(":" + c for c in RESULT_KPI_COLUMNS)})
+""")
+
+# Relation (to_regclass) -> migration that creates it; indexes must also be valid
+# (a failed or unfinished CONCURRENTLY build cannot serve ON CONFLICT)
+REQUIRED_SCHEMA = {
+    "biz.step_kpi": "apply_step_kpi_migration.py",
+    "biz.result_kpi": "apply_result_kpi_migration.py",
+    "biz.spc_bucket": "apply_spc_migration.py",
+    "biz.uq_result_source": "apply_result_source_key_migration.py --dedup",
+}
+_missing_schema = text("""
+    SELECT name FROM unnest(CAST(:names AS text[])) AS name
+    LEFT JOIN pg_index i ON i.indexrelid = to_regclass(name)
+    WHERE to_regclass(name) IS NULL OR i.indisvalid IS FALSE
+""")
+
+_multi_cache = {}
+_multi_lock = threading.Lock()
+
+
+def _multi_insert(table, columns, n, returning=None, casts=None, on_conflict=None):
+    """text() for INSERT ... VALUES (...), (...) with n rows; params are <column>_<row>"""
+    key = (table, columns, n, returning, on_conflict)
+    stmt = _multi_cache.get(key)
+    if stmt is None:
+        casts = casts or {}
+        rows = []
+        for i in range(n):
+            values = [f"CAST(:{c}_{i} AS {casts[c]})" if c in casts else f":{c}_{i}" for c in columns]
+            rows.append(f"({', '.join(values)})")
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(rows)}"
+        if on_conflict:
+            sql += on_conflict
+        if returning:
+            sql += f" RETURNING {returning}"
+        stmt = text(sql)
+        with _multi_lock:
+            _multi_cache[key] = stmt
+    return stmt
+
+
+def _multi_params(columns, rows):
+    params = {}
+    for i, row in enumerate(rows):
+        for c in columns:
+            params[f"{c}_{i}"] = row.get(c)
+    return params
+
+
+class BizWriter:
+    def __init__(self):
+        self._programs = {}  # (program_id, version, parameter_type) -> biz.program.id, committed rows only
+        self._lock = threading.Lock()
+
+    def check(self, engine):
+        """ValueError listing the REQUIRED_SCHEMA relations missing from the database"""
+        with engine.connect() as conn:
+            missing = [r[0] for r in conn.execute(_missing_schema, {"names": list(REQUIRED_SCHEMA)})]
+        if missing:
+            raise ValueError("biz schema is not migrated, missing or invalid: " +
+                             "; ".join(f"{name} (run {REQUIRED_SCHEMA[name]})" for name in missing))
+
+    def remember_programs(self, programs):
+        """Cache program ids once the transaction that read/created them has committed"""
+        with self._lock:
+            self._programs.update(programs)
+
+    def forget_programs(self):
+        with self._lock:
+            self._programs.clear()
+
+    def _program_ids(self, conn, programs):
+        ids = {}
+        new_programs = {}
+        for prog in programs:
+            key = (prog["program_id"], prog["version"], prog["parameter_type"])
+            if prog["parameter_type"] in ids:
+                continue
+            with self._lock:
+                db_id = self._programs.get(key)
+            if db_id is None:
+                row = conn.execute(_insert_program, {c: prog.get(c) for c in PROGRAM_COLUMNS}).fetchone()
+                db_id = row[0] if row else conn.execute(_fetch_program, {
+                    "program_id": key[0], "version": key[1], "parameter_type": key[2]
+                }).scalar()
+                new_programs[key] = db_id
+            ids[prog["parameter_type"]] = db_id
+        return ids, new_programs
+
+    def write(self, conn, record, trace=None, publish=True):
+        """
+        Insert one record on conn (inside the caller's transaction).
+        Returns (result_id, programs to pass to remember_programs() after commit);
+        result_id is None when the record was already loaded.
+        """
+        trace = trace or (lambda name, started, **attrs: None)
+        t = time.perf_counter()
+        program_ids, new_programs = self._program_ids(conn, record.get("programs", []))
+        program_key = record.get("program_key")
+        program_db_id = program_ids.get(program_key) or (next(iter(program_ids.values())) if program_ids else None)
+        trace("insert_program", t)
+
+        t = time.perf_counter()
+        result = record["result"]
+        params = {c: result.get(c) for c in RESULT_COLUMNS}
+        params["program_ver_id"] = program_db_id
+        row = conn.execute(_insert_result, params).fetchone()
+        trace("insert_result", t)
+        if row is None:
+            return None, new_programs
+        result_id = row[0]
+
+        t = time.perf_counter()
+        ext = record.get("extension") or {}
+        conn.execute(_insert_extension, {
+            "result_id": result_id,
+            "extra_data": json.dumps(ext.get("extra_data")),
+            "operator_id": ext.get("operator_id"),
+            "fixture_id": ext.get("fixture_id"),
+        })
+        trace("insert_extension", t)
+
+        kpi = record.get("kpi")
+        if kpi:
+            t = time.perf_counter()
+            params = {c: kpi.get(c) for c in RESULT_KPI_COLUMNS}
+            params.update(result_id=result_id, start_time=result["start_time"], craft_type=result["craft_type"])
+            conn.execute(_insert_result_kpi, params)
+            trace("insert_result_kpi", t)
+
+        steps = record.get("steps", [])
+        step_ids = {}
+        if steps:
+            t = time.perf_counter()
+            rows = [dict(s, result_id=result_id) for s in steps]
+            stmt = _multi_insert("biz.step", STEP_COLUMNS, len(rows), returning="id, step_index")
+            step_ids = {idx: sid for sid, idx in conn.execute(stmt, _multi_params(STEP_COLUMNS, rows)).fetchall()}
+            trace("insert_steps", t, steps=len(rows))
+
+        curves = [
+            {"result_id": result_id, "step": s["step_index"], "start_time": s["start_time"],
+             "end_time": s["end_time"], "curve_type": c_type, "data_points": data}
+            for s in steps for c_type, data in s.get("curves", [])
+        ]
+        if curves:
+            t = time.perf_counter()
+            stmt = _multi_insert("biz.curve", CURVE_COLUMNS, len(curves), casts={"data_points": "jsonb"})
+            conn.execute(stmt, _multi_params(CURVE_COLUMNS, curves))
+            trace("insert_curves", t, curves=len(curves))
+
+        kpis = [
+            {"result_id": result_id, "step_index": s["step_index"], "kpi_type": k_type,
+             "value": value, "result_index": r_idx, "start_time": result["start_time"]}
+            for s in steps for k_type, value, r_idx in s.get("kpis", [])
+        ]
+        if kpis:
+            t = time.perf_counter()
+            stmt = _multi_insert("biz.step_kpi", STEP_KPI_COLUMNS, len(kpis))
+            conn.execute(stmt, _multi_params(STEP_KPI_COLUMNS, kpis))
+            trace("insert_kpis", t, kpis=len(kpis))
+
+        alarms = []
+        alarm_summaries = []
+        for s in steps:
+            alarm = s.get("alarm")
+            if alarm:
+                alarms.append({"result_id": result_id, "step_id": step_ids.get(s["step_index"]),
+                               "alarm_code": alarm["code"], "alarm_level": alarm["level"],
+                               "alarm_msg": alarm["msg"], "device_id": alarm["device_id"]})
+                alarm_summaries.append({"step": s["step_index"], "code": alarm["code"], "msg": alarm["msg"]})
+        if alarms:
+            t = time.perf_counter()
+            stmt = _multi_insert("biz.alarm", ALARM_COLUMNS, len(alarms))
+            conn.execute(stmt, _multi_params(ALARM_COLUMNS, alarms))
+            trace("insert_alarms", t, alarms=len(alarms))
+
+        # Only reached after a real first insert of biz.result (see above and common/spc.py): the merge is additive.
+        # Last before commit: buckets are shared by concurrent writers and stay locked until then
+        spc_rows = record_rows(record)
+        if spc_rows:
+            t = time.perf_counter()
+            stmt = _multi_insert("biz.spc_bucket AS s", SPC_COLUMNS, len(spc_rows), on_conflict=MERGE_SQL)
+            conn.execute(stmt, _multi_params(SPC_COLUMNS, spc_rows))
+            trace("upsert_spc", t, series=len(spc_rows))
+
+        if not publish:
+            return result_id, new_programs
+
+        # Notify dashboard listeners (delivered on commit)
+        t = time.perf_counter()
+        publish_event(conn, result_event(
+            result_id, result["device_name"], result["craft_type"], result["result_status"], result["start_time"],
+            program_id=result["program_id"], key_value=result.get("key_value"), alarms=alarm_summaries,
+            cyclenumber=result["cyclenumber"], bsn=result["bsn"], cycle_time=result["cycle_time"]
+        ))
+        trace("notify", t)
+        return result_id, new_programs
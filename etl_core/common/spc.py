@@ -0,0 +1,252 @@
+"""
+SPC (statistical process control) aggregates shared by the pipelines and the API server.
+
+The ETL keeps Welford moments (n, mean, M2) per series and hour in
+biz.spc_bucket, where a series is (program_id, parameter_type, step_index,
+device_name). step_index RESULT_STEP (-1) is biz.result.key_value, any other
+index is biz.step.step_value. Each record is merged into its buckets with
+Chan's parallel formula inside the ETL transaction, so /api/spc reads a few
+hundred bucket rows instead of scanning biz.result.
+
+The merge is additive and cannot be undone, so it must run at most once per
+source record. BizWriter only merges after its biz.result INSERT actually
+created the row (ON CONFLICT on uq_result_source returned an id): duplicate
+batch items, concurrent workers and batches replayed after a crash between
+commit and checkpoint are all skipped before reaching the buckets.
+apply_spc_migration.py --backfill --rebuild is the only repair for buckets
+written without that guard.
+
+biz.program stores a missing SPR limit as a 0.0 placeholder; spec limits of 0
+are read as "no limit" everywhere (spec_limit, NULLIF in SQL) so they do not
+turn into Cp = 0 and a hugely negative Cpk.
+
+Capability indices use the pooled within-bucket sigma (Cp/Cpk) and the
+overall sigma (Pp/Ppk). The X-bar chart is drawn per bucket with limits
+center +- 3 sigma_within / sqrt(n) and checked against Nelson rules 1-3.
+"""
+import math
+
+RESULT_STEP = -1  # step_index of the result.key_value series
+
+SPC_COLUMNS = ("program_id", "parameter_type", "step_index", "device_name", "bucket_start",
+               "craft_type", "n", "mean", "m2", "min_value", "max_value", "nok_count",
+               "target_value", "upper_limit", "lower_limit")
+
+# ON CONFLICT clause merging EXCLUDED (one record's moments) into the stored bucket "s"
+MERGE_SQL = """
+    ON CONFLICT (program_id, parameter_type, step_index, device_name, bucket_start) DO UPDATE SET
+        n = s.n + EXCLUDED.n,
+        mean = s.mean + (EXCLUDED.mean - s.mean) * EXCLUDED.n / (s.n + EXCLUDED.n),
+        m2 = s.m2 + EXCLUDED.m2 + (EXCLUDED.mean - s.mean) ^ 2 * s.n * EXCLUDED.n / (s.n + EXCLUDED.n),
+        min_value = LEAST(s.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(s.max_value, EXCLUDED.max_value),
+        nok_count = s.nok_count + EXCLUDED.nok_count,
+        target_value = COALESCE(EXCLUDED.target_value, s.target_value),
+        upper_limit = COALESCE(EXCLUDED.upper_limit, s.upper_limit),
+        lower_limit = COALESCE(EXCLUDED.lower_limit, s.lower_limit),
+        update_time = CURRENT_TIMESTAMP
+"""
+
+NELSON_RUN = 9    # rule 2: points in a row on one side of the center line
+NELSON_TREND = 6  # rule 3: points in a row steadily increasing or decreasing
+
+
+class Moments:
+    """Running count, mean, M2 (sum of squared deviations), min, max and NOK count"""
+    __slots__ = ("n", "mean", "m2", "min", "max", "nok")
+
+    def __init__(self, n=0, mean=0.0, m2=0.0, min_value=None, max_value=None, nok=0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.min = min_value
+        self.max = max_value
+        self.nok = nok
+
+    def add(self, x, nok=False):
+        """Welford update with one observation"""
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        self.nok += 1 if nok else 0
+
+    def merge(self, other):
+        """Chan's parallel combination, same formula as MERGE_SQL"""
+        if not other.n:
+            return self
+        if not self.n:
+            self.n, self.mean, self.m2 = other.n, other.mean, other.m2
+            self.min, self.max, self.nok = other.min, other.max, other.nok
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.nok += other.nok
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance (n - 1), None below two observations"""
+        return self.m2 / (self.n - 1) if self.n > 1 else None
+
+    @property
+    def std(self):
+        var = self.variance
+        return math.sqrt(max(var, 0.0)) if var is not None else None
+
+
+def spec_limit(value):
+    """Spec limit or None; 0 is the placeholder of a missing limit"""
+    return float(value) if value else None
+
+
+def bucket_start(ts):
+    """Buckets are one hour wide (date_trunc('hour', start_time))"""
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def record_rows(record):
+    """
+    biz.spc_bucket rows (one per series) for one BizWriter record, in key order
+    so concurrent writers lock shared buckets in the same order.
+    """
+    result = record["result"]
+    programs = record.get("programs", [])
+    program_key = record.get("program_key")
+    program = next((p for p in programs if p["parameter_type"] == program_key), programs[0] if programs else {})
+    base = {
+        "program_id": result.get("program_id") or "",
+        "parameter_type": program.get("parameter_type") or "DEFAULT",
+        "device_name": result.get("device_name") or "",
+        "bucket_start": bucket_start(result["start_time"]),
+        "craft_type": result.get("craft_type"),
+    }
+
+    rows = []
+
+    def add(step_index, value, nok, target, upper, lower):
+        if value is None:
+            return
+        m = Moments()
+        m.add(float(value), nok)
+        rows.append(dict(base, step_index=step_index, n=m.n, mean=m.mean, m2=m.m2,
+                         min_value=m.min, max_value=m.max, nok_count=m.nok,
+                         target_value=target, upper_limit=upper, lower_limit=lower))
+
+    add(RESULT_STEP, result.get("key_value"), result.get("result_status") == 0,
+        program.get("target_value"), spec_limit(program.get("upper_limit")), spec_limit(program.get("lower_limit")))
+    for s in record.get("steps", []):
+        # FDS steps without single results carry a 0.0 placeholder step_value
+        if "kpis" in s and not s["kpis"]:
+            continue
+        add(s["step_index"], s.get("step_value"), s.get("step_result") == 0,
+            s.get("target_value"), None, None)
+    rows.sort(key=lambda r: r["step_index"])
+    return rows
+
+
+def pooled_sigma(buckets):
+    """Within-bucket sigma: sqrt(sum M2 / sum (n - 1)) over buckets with n > 1"""
+    m2 = sum(b.m2 for b in buckets if b.n > 1)
+    dof = sum(b.n - 1 for b in buckets if b.n > 1)
+    return math.sqrt(max(m2, 0.0) / dof) if dof else None
+
+
+def _index(spread, sigma):
+    return round(spread / (3 * sigma), 4) if sigma else None
+
+
+def capability(overall, sigma_within, usl=None, lsl=None):
+    """Cp/Cpk from the within sigma, Pp/Ppk from the overall sigma; one-sided limits give Cpk/Ppk only"""
+    out = {"cp": None, "cpk": None, "pp": None, "ppk": None}
+    if not overall.n:
+        return out
+    for prefix, sigma in (("c", sigma_within), ("p", overall.std)):
+        if not sigma:
+            continue
+        sides = []
+        if usl is not None:
+            sides.append(usl - overall.mean)
+        if lsl is not None:
+            sides.append(overall.mean - lsl)
+        if usl is not None and lsl is not None:
+            out[f"{prefix}p"] = round((usl - lsl) / (6 * sigma), 4)
+        if sides:
+            out[f"{prefix}pk"] = _index(min(sides), sigma)
+    return out
+
+
+def nelson_rules(z):
+    """
+    Indices of the points flagged by Nelson rules on standardized means z:
+    rule 1 (beyond 3 sigma), rule 2 (NELSON_RUN on one side), rule 3 (NELSON_TREND trending).
+    Returns {"1": [...], "2": [...], "3": [...]}, each point reported once per rule.
+    """
+    flags = {"1": [], "2": [], "3": []}
+    run_side, run_len = 0, 0
+    trend_dir, trend_len = 0, 1
+    for i, v in enumerate(z):
+        if abs(v) > 3:
+            flags["1"].append(i)
+
+        side = (v > 0) - (v < 0)
+        run_len = run_len + 1 if side and side == run_side else (1 if side else 0)
+        run_side = side
+        if run_len >= NELSON_RUN:
+            flags["2"].append(i)
+
+        if i:
+            direction = (v > z[i - 1]) - (v < z[i - 1])
+            trend_len = trend_len + 1 if direction and direction == trend_dir else (2 if direction else 1)
+            trend_dir = direction
+            if trend_len >= NELSON_TREND:
+                flags["3"].append(i)
+    return flags
+
+
+def control_chart(buckets):
+    """
+    X-bar chart over [(bucket_start, Moments)] in time order.
+    Limits vary per point with its bucket size; points of single-value buckets
+    are plotted against the same sigma (individuals).
+    """
+    overall = Moments()
+    for _, m in buckets:
+        overall.merge(m)
+    sigma = pooled_sigma([m for _, m in buckets]) or overall.std
+
+    points = []
+    z = []
+    for ts, m in buckets:
+        half = 3 * sigma / math.sqrt(m.n) if sigma else None
+        points.append({
+            "bucket_start": ts.isoformat(),
+            "n": m.n,
+            "mean": m.mean,
+            "std": m.std,
+            "min": m.min,
+            "max": m.max,
+            "nok_count": m.nok,
+            "ucl": overall.mean + half if half is not None else None,
+            "lcl": overall.mean - half if half is not None else None,
+        })
+        z.append((m.mean - overall.mean) / (sigma / math.sqrt(m.n)) if sigma else 0.0)
+
+    flags = nelson_rules(z)
+    for rule, idx in flags.items():
+        for i in idx:
+            points[i].setdefault("rules", []).append(int(rule))
+    return {
+        "center": overall.mean if overall.n else None,
+        "sigma_within": sigma,
+        "points": points,
+        "violations": {rule: [points[i]["bucket_start"] for i in idx] for rule, idx in flags.items()},
+        "drift": bool(flags["2"] or flags["3"]),
+    }
@@ -0,0 +1,175 @@
+"""
+Rate limits and time windows for BaseEtlPipeline.run.
+
+Limits per pipeline ("throttle" in scheduler_config.json), all optional:
+
+    records_per_second     token bucket taken by every item before it starts
+    db_seconds_per_second  statement time the pipeline may spend in Postgres
+                           per wall-clock second (a proxy for its DB CPU
+                           share); items wait while the bucket is in debt
+    max_workers            cap on concurrent items = connections in use
+    backfill               false pauses the tail cursor (dual-cursor mode)
+
+Named windows ("windows" at the top level) override the base limits while
+they are active, e.g. a day shift with a low ceiling and no backfill:
+
+    "windows": {"day_shift": {"days": "mon-sat", "start": "07:30", "end": "20:00"}}
+    "throttle": {"records_per_second": 200,
+                 "windows": {"day_shift": {"records_per_second": 30, "max_workers": 4, "backfill": false}}}
+
+A window whose end is before its start runs over midnight; days name the
+day it starts on. The first active window wins.
+"""
+import threading
+import time
+from datetime import datetime
+
+DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+LIMIT_KEYS = ("records_per_second", "db_seconds_per_second", "max_workers", "backfill")
+
+
+def parse_days(spec):
+    """'mon-fri', 'sat,sun', [0, 1, 2] or None (every day) -> set of weekday numbers"""
+    if spec is None:
+        return set(range(7))
+    if isinstance(spec, list):
+        return {DAY_NAMES.index(d) if isinstance(d, str) else int(d) for d in spec}
+    days = set()
+    for part in spec.lower().split(","):
+        if "-" in part:
+            first, last = (DAY_NAMES.index(p.strip()) for p in part.split("-"))
+            days.update(range(first, last + 1) if first <= last else list(range(first, 7)) + list(range(0, last + 1)))
+        else:
+            days.add(DAY_NAMES.index(part.strip()))
+    return days
+
+
+def parse_time(text):
+    hours, minutes = text.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class TimeWindow:
+    def __init__(self, name, days=None, start="00:00", end="24:00"):
+        self.name = name
+        self.days = parse_days(days)
+        self.start = parse_time(start)
+        self.end = parse_time(end)
+
+    def active(self, now):
+        minute = now.hour * 60 + now.minute
+        weekday = now.weekday()
+        if self.start <= self.end:
+            return weekday in self.days and self.start <= minute < self.end
+        # Over midnight: the evening part today or the morning part of yesterday's window
+        return (weekday in self.days and minute >= self.start) or \
+            ((weekday - 1) % 7 in self.days and minute < self.end)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() may go into debt and returns the wait"""
+    def __init__(self, rate, burst=None):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.burst = burst if burst is not None else max(rate, 1)
+            self.tokens = min(self.tokens, self.burst)
+
+    def reserve(self, amount=1):
+        """Take `amount` now; returns the seconds to wait before using it"""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return max(-self.tokens / self.rate, 0)
+
+    def debt_wait(self):
+        """Seconds until the bucket is out of debt (used for costs known only afterwards)"""
+        with self._lock:
+            self._refill()
+            return max(-self.tokens / self.rate, 0)
+
+
+class Throttle:
+    def __init__(self, records_per_second=None, db_seconds_per_second=None, max_workers=None,
+                 backfill=True, windows=None):
+        """windows: [(TimeWindow, {limit overrides})], first active one wins"""
+        self.base = {
+            "records_per_second": records_per_second,
+            "db_seconds_per_second": db_seconds_per_second,
+            "max_workers": max_workers,
+            "backfill": backfill,
+        }
+        self.windows = windows or []
+        self.window = None
+        self.limits = dict(self.base)
+        self.records = None
+        self.db_time = None
+        self._apply(self.base)
+
+    @classmethod
+    def from_config(cls, throttle, window_defs):
+        """Build from the pipeline "throttle" block and the top-level "windows" definitions"""
+        windows = []
+        for name, overrides in (throttle.get("windows") or {}).items():
+            if name not in window_defs:
+                raise ValueError(f"Unknown window '{name}' in throttle config")
+            windows.append((TimeWindow(name, **window_defs[name]), overrides))
+        return cls(**{k: throttle[k] for k in LIMIT_KEYS if k in throttle}, windows=windows)
+
+    def _apply(self, limits):
+        rate = limits["records_per_second"]
+        if rate:
+            if self.records is None:
+                self.records = TokenBucket(rate)
+            else:
+                self.records.set_rate(rate)
+        else:
+            self.records = None
+        db_rate = limits["db_seconds_per_second"]
+        if db_rate:
+            if self.db_time is None:
+                self.db_time = TokenBucket(db_rate)
+            else:
+                self.db_time.set_rate(db_rate)
+        else:
+            self.db_time = None
+        self.limits = limits
+
+    def refresh(self, now=None):
+        """Switch limits when a window opens or closes; returns the active window name on change"""
+        now = now or datetime.now()
+        window, overrides = None, {}
+        for w, o in self.windows:
+            if w.active(now):
+                window, overrides = w.name, o
+                break
+        if window == self.window:
+            return None
+        self.window = window
+        self._apply({**self.base, **{k: v for k, v in overrides.items() if k in LIMIT_KEYS}})
+        return window or "off-window"
+
+    def before_item(self):
+        """Seconds a worker should wait before starting the next item"""
+        wait = 0
+        if self.records is not None:
+            wait = self.records.reserve(1)
+        if self.db_time is not None:
+            wait = max(wait, self.db_time.debt_wait())
+        return wait
+
+    def after_item(self, db_seconds):
+        if self.db_time is not None and db_seconds:
+            self.db_time.reserve(db_seconds)
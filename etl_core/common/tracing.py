@@ -0,0 +1,210 @@
+"""
+Opt-in per-record tracing and slow-record capture.
+
+BaseEtlPipeline opens one trace per processed item; pipelines add child
+spans with trace(name, started) at the points they already time (source
+fetch, program lookup, parse, insert groups). Spans are OpenTelemetry
+compatible (OTLP/JSON field names, 128-bit trace ids, 64-bit span ids):
+
+- file:     one ExportTraceServiceRequest JSON per line, readable by the
+            collector's otlpjsonfile receiver
+- endpoint: OTLP/HTTP JSON collector, e.g. http://localhost:4318/v1/traces
+
+Independently of export, records slower than slow_ms are appended to
+slow_file with their duration, per-span breakdown and the attributes the
+pipeline annotated (blob size, frames, steps, ...).
+
+Configured per pipeline process via the "tracing" block in
+scheduler_config.json.
+"""
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attrs):
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items() if v is not None]
+
+
+class _RecordTrace:
+    """Spans of one processed item; child spans are closed intervals"""
+    def __init__(self, name, attrs):
+        self.trace_id = secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.name = name
+        self.attrs = dict(attrs)
+        self.unix0 = time.time_ns()
+        self.perf0 = time.perf_counter()
+        self.children = []  # (name, start_perf, end_perf, attrs)
+        self.error = None
+
+    def to_ns(self, perf):
+        return self.unix0 + int((perf - self.perf0) * 1e9)
+
+    def otlp_spans(self, end_perf):
+        status = {"code": 2, "message": self.error} if self.error else {"code": 1}
+        spans = [{
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.unix0),
+            "endTimeUnixNano": str(self.to_ns(end_perf)),
+            "attributes": _otlp_attributes(self.attrs),
+            "status": status,
+        }]
+        for name, start, end, attrs in self.children:
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": secrets.token_hex(8),
+                "parentSpanId": self.span_id,
+                "name": name,
+                "kind": 1,
+                "startTimeUnixNano": str(self.to_ns(start)),
+                "endTimeUnixNano": str(self.to_ns(end)),
+                "attributes": _otlp_attributes(attrs),
+            })
+        return spans
+
+
+class _FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def export(self, request):
+        line = json.dumps(request, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class _OtlpHttpExporter:
+    """Batches spans and POSTs them from a background thread so workers never block on the collector"""
+    def __init__(self, endpoint, flush_interval=2.0, max_queue=10000):
+        self.endpoint = endpoint
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        threading.Thread(target=self._run, name="otlp-export", daemon=True).start()
+
+    def export(self, request):
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            pass  # drop rather than stall the pipeline
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            requests = []
+            while not self._queue.empty() and len(requests) < 500:
+                requests.append(self._queue.get_nowait())
+            if not requests:
+                continue
+            # Merge into one request: same resource, concatenated spans
+            merged = requests[0]
+            spans = merged["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            for r in requests[1:]:
+                spans.extend(r["resourceSpans"][0]["scopeSpans"][0]["spans"])
+            body = json.dumps(merged).encode("utf-8")
+            req = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(req, timeout=5).read()
+            except Exception as e:
+                print(f"[Tracing] ⚠️ Export to {self.endpoint} failed: {e}")
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.slow_ms = None
+        self.service_name = "etl"
+        self._exporters = []
+        self._slow = None
+        self._tls = threading.local()
+
+    def configure(self, service_name="etl", enabled=False, file=None, endpoint=None, slow_ms=None, slow_file=None):
+        self.service_name = service_name
+        self._exporters = []
+        if enabled and file:
+            self._exporters.append(_FileExporter(file))
+        if enabled and endpoint:
+            self._exporters.append(_OtlpHttpExporter(endpoint))
+        self.enabled = bool(self._exporters)
+        self.slow_ms = slow_ms
+        self._slow = _FileExporter(slow_file) if slow_ms and slow_file else None
+        if self.enabled or self._slow:
+            print(f"[Tracing] 🔎 {service_name}: export={'on' if self.enabled else 'off'}, slow_ms={slow_ms}")
+
+    @property
+    def active(self):
+        return self.enabled or self._slow is not None
+
+    def start_record(self, name, **attrs):
+        self._tls.record = _RecordTrace(name, attrs) if self.active else None
+
+    def trace(self, name, started, **attrs):
+        """Add a child span from `started` (time.perf_counter()) to now"""
+        record = getattr(self._tls, "record", None)
+        if record is not None:
+            record.children.append((name, started, time.perf_counter(), attrs))
+
+    def annotate(self, **attrs):
+        record = getattr(self._tls, "record", None)
+        if record is not None:
+            record.attrs.update(attrs)
+
+    def set_error(self, exc):
+        record = getattr(self._tls, "record", None)
+        if record is not None:
+            record.error = f"{type(exc).__name__}: {exc}"
+
+    def end_record(self):
+        record = getattr(self._tls, "record", None)
+        if record is None:
+            return
+        self._tls.record = None
+        end = time.perf_counter()
+        duration_ms = (end - record.perf0) * 1000
+
+        if self.enabled:
+            request = {"resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{"scope": {"name": "etl_core"}, "spans": record.otlp_spans(end)}],
+            }]}
+            for exporter in self._exporters:
+                exporter.export(request)
+
+        if self._slow and duration_ms >= self.slow_ms:
+            spans = {}
+            for name, start, stop, _ in record.children:
+                spans[name] = round(spans.get(name, 0) + (stop - start) * 1000, 3)
+            self._slow.export({
+                "time": datetime.now().isoformat(),
+                "service": self.service_name,
+                "trace_id": record.trace_id,
+                "duration_ms": round(duration_ms, 3),
+                "error": record.error,
+                **record.attrs,
+                "spans_ms": spans,
+            })
+
+
+TRACER = Tracer()
@@ -0,0 +1,215 @@
+"""
+FDS source adapters that bypass the origin.bs_fds_v_fds_curves view.
+
+ASSUMPTION: both adapters assume the view is
+
+    SELECT r.<VIEW_COLUMNS>, c.curve
+    FROM bs_fds_results r JOIN bs_fds_curveresults c ON c.resultid = r.autoindex
+
+Nothing in this repo defines origin.bs_fds_v_fds_curves (debug_fds_parsing.py
+only guesses the join), and the synthetic view in benchmarks/sources.py is
+built from this same join, so benchmark runs cannot confirm it. Until the
+join is checked against pg_get_viewdef('origin.bs_fds_v_fds_curves') on the
+production database, use_source() runs check(): it prints the view
+definition and compares the newest CHECK_SAMPLE view rows with BASE_JOIN
+for the same keys, refusing the adapter on any difference. Pass
+"verify": false only once the definition has been checked by hand.
+
+Reading the view per record means planning its join once for the batch
+ids and once per record. The adapters here fetch a whole batch as Rows
+carrying the view's columns, which FdsPipeline.fetch() uses directly:
+
+    base   one PK range scan on bs_fds_results for the batch keys, then one
+           keyed join of both base tables restricted to [first, last] key
+    local  a local copy of the view (origin.bs_fds_curves_local by default),
+           appended incrementally from the base tables whenever the pipeline
+           catches up with it; batches are plain PK range reads. The copy
+           only grows upwards from the pipeline's cursor, so it does not
+           work with the dual-cursor mode (which is switched off)
+
+    "source": {"type": "local", "table": "origin.bs_fds_curves_local", "refresh_chunk": 5000, "verify": true}
+"""
+import time
+from sqlalchemy import text
+
+VIEW_COLUMNS = ("autoindex", "actualprogramid", "systemid", "startselection", "ok_nok_code",
+                "lastexecutedstep", "starttime", "cyclenumber", "duration", "bsn", "progselection", "curve")
+BASE_COLUMNS = ", ".join(["c.curve" if col == "curve" else f"r.{col}" for col in VIEW_COLUMNS])
+BASE_JOIN = "origin.bs_fds_results r JOIN origin.bs_fds_curveresults c ON c.resultid = r.autoindex"  # assumed, see check()
+VIEW = "origin.bs_fds_v_fds_curves"
+CHECK_SAMPLE = 200
+
+_base_keys = {
+    False: text("""
+        SELECT autoindex FROM origin.bs_fds_results
+        WHERE autoindex > :last_idx
+        ORDER BY autoindex LIMIT :batch
+    """),
+    True: text("""
+        SELECT autoindex FROM origin.bs_fds_results
+        WHERE autoindex > :last_idx AND autoindex <= :upper_idx
+        ORDER BY autoindex LIMIT :batch
+    """),
+}
+# Both sides bounded by the key range, so each is an index range scan
+_base_rows = text(f"""
+    SELECT {BASE_COLUMNS}
+    FROM {BASE_JOIN}
+    WHERE r.autoindex BETWEEN :first_idx AND :last_idx
+      AND c.resultid BETWEEN :first_idx AND :last_idx
+    ORDER BY r.autoindex
+""")
+_base_head = text("SELECT max(autoindex) FROM origin.bs_fds_results")
+_view_def = text(f"SELECT pg_get_viewdef('{VIEW}'::regclass, true)")
+# Rows only in the view / only in the base join, over the newest :n view keys
+_view_diff = text(f"""
+    WITH v AS (
+        SELECT {", ".join(VIEW_COLUMNS)} FROM {VIEW} ORDER BY autoindex DESC LIMIT :n
+    ), b AS (
+        SELECT {BASE_COLUMNS} FROM {BASE_JOIN}
+        WHERE r.autoindex BETWEEN (SELECT min(autoindex) FROM v) AND (SELECT max(autoindex) FROM v)
+    )
+    SELECT (SELECT count(*) FROM (SELECT * FROM v EXCEPT ALL SELECT * FROM b) only_view),
+           (SELECT count(*) FROM (SELECT * FROM b EXCEPT ALL SELECT * FROM v) only_base)
+""")
+
+
+class BaseTableSource:
+    DUAL_CURSOR = True
+
+    def __init__(self, verify=True):
+        self.verify = verify
+
+    def check(self, engine):
+        """Compare the view with BASE_JOIN on a sample (see module docstring); ValueError on a difference"""
+        if not self.verify:
+            print(f"⚠️ {VIEW}: join assumed, not verified (verify=false)")
+            return
+        with engine.connect() as conn:
+            definition = conn.execute(_view_def).scalar()
+            only_view, only_base = conn.execute(_view_diff, {"n": CHECK_SAMPLE}).fetchone()
+        print(f"🔎 {VIEW} definition:\n{definition}")
+        if only_view or only_base:
+            raise ValueError(f"{VIEW} does not match the assumed join ({BASE_JOIN}): "
+                             f"{only_view} rows only in the view, {only_base} only in the base tables "
+                             f"over its newest {CHECK_SAMPLE} keys")
+        print(f"✅ {VIEW} matches the assumed base-table join on its newest {CHECK_SAMPLE} keys")
+
+    def _key_range(self, conn, last_autoindex, batch_size, upper_bound=None):
+        """(first, last) of the next batch_size result keys, None when there are none"""
+        params = {"last_idx": last_autoindex, "batch": batch_size}
+        if upper_bound is not None:
+            params["upper_idx"] = upper_bound
+        keys = conn.execute(_base_keys[upper_bound is not None], params).fetchall()
+        return (keys[0][0], keys[-1][0]) if keys else None
+
+    def next_batch(self, engine, last_autoindex, batch_size, upper_bound=None):
+        with engine.connect() as conn:
+            while True:
+                key_range = self._key_range(conn, last_autoindex, batch_size, upper_bound)
+                if key_range is None:
+                    return []
+                rows = conn.execute(_base_rows, {"first_idx": key_range[0], "last_idx": key_range[1]}).fetchall()
+                if rows:
+                    return rows
+                # Only results without a curve in this range (not in the view either): skip it
+                last_autoindex = key_range[1]
+
+    def head(self, engine):
+        with engine.connect() as conn:
+            return conn.execute(_base_head).scalar()
+
+    def stream_query(self, last_autoindex):
+        return text(f"""
+            SELECT {BASE_COLUMNS}
+            FROM {BASE_JOIN}
+            WHERE r.autoindex > :last_idx AND c.resultid > :last_idx
+            ORDER BY r.autoindex
+        """), {"last_idx": last_autoindex}
+
+
+class LocalSource(BaseTableSource):
+    DUAL_CURSOR = False
+
+    def __init__(self, table="origin.bs_fds_curves_local", refresh_chunk=5000, verify=True):
+        super().__init__(verify)
+        self.table = table
+        self.refresh_chunk = refresh_chunk
+        self._ready = False
+        self._batch = {
+            False: text(f"""
+                SELECT {", ".join(VIEW_COLUMNS)} FROM {table}
+                WHERE autoindex > :last_idx
+                ORDER BY autoindex LIMIT :batch
+            """),
+            True: text(f"""
+                SELECT {", ".join(VIEW_COLUMNS)} FROM {table}
+                WHERE autoindex > :last_idx AND autoindex <= :upper_idx
+                ORDER BY autoindex LIMIT :batch
+            """),
+        }
+        self._copy = text(f"""
+            INSERT INTO {table} ({", ".join(VIEW_COLUMNS)})
+            SELECT {BASE_COLUMNS}
+            FROM {BASE_JOIN}
+            WHERE r.autoindex BETWEEN :first_idx AND :last_idx
+              AND c.resultid BETWEEN :first_idx AND :last_idx
+            ON CONFLICT (autoindex) DO NOTHING
+        """)
+
+    def ensure(self, engine):
+        """Create the local table (same columns as the view) on first use"""
+        if self._ready:
+            return
+        index_name = self.table.split(".")[-1] + "_pkey"
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {self.table} AS SELECT {BASE_COLUMNS} FROM {BASE_JOIN} WITH NO DATA"))
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {self.table} (autoindex)"))
+        self._ready = True
+
+    def refresh(self, engine, after=0):
+        """
+        Copy the next refresh_chunk source keys above the local maximum (or
+        above `after`, the pipeline's cursor, if that is higher); returns the rows added
+        """
+        self.ensure(engine)
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            last = max(conn.execute(text(f"SELECT max(autoindex) FROM {self.table}")).scalar() or 0, after)
+            while True:
+                key_range = self._key_range(conn, last, self.refresh_chunk)
+                if key_range is None:
+                    return 0
+                added = conn.execute(self._copy, {"first_idx": key_range[0], "last_idx": key_range[1]}).rowcount
+                last = key_range[1]
+                if added:
+                    break
+        print(f"🗄️ {self.table}: +{added} rows up to {last} ({time.perf_counter() - started:.2f}s)")
+        return added
+
+    def next_batch(self, engine, last_autoindex, batch_size, upper_bound=None):
+        self.ensure(engine)
+        params = {"last_idx": last_autoindex, "batch": batch_size}
+        if upper_bound is not None:
+            params["upper_idx"] = upper_bound
+        query = self._batch[upper_bound is not None]
+        with engine.connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        # Caught up with the local copy: pull in new source rows and read again
+        while len(rows) < batch_size and self.refresh(engine, last_autoindex):
+            with engine.connect() as conn:
+                rows = conn.execute(query, params).fetchall()
+        return rows
+
+    def stream_query(self, last_autoindex):
+        return text(f"""
+            SELECT {", ".join(VIEW_COLUMNS)} FROM {self.table}
+            WHERE autoindex > :last_idx
+            ORDER BY autoindex
+        """), {"last_idx": last_autoindex}
+
+
+SOURCES = {
+    "base": BaseTableSource,
+    "local": LocalSource,
+}
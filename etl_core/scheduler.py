@@ -1,10 +1,11 @@
-
 import json
 import time
 import importlib
 import multiprocessing
 import os
+import signal
 import sys
+import threading
 
 # Ensure parent directory is in sys.path so 'etl_core' can be imported
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,11 +13,53 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
+from etl_core.common.budget import BUDGET_DEFAULTS, allocate, grant
+
 CONFIG_FILE = os.path.join(current_dir, "scheduler_config.json")
 
-def run_pipeline(pipeline_config):
+# Overridable with a "supervisor" block in scheduler_config.json
+SUPERVISOR_DEFAULTS = {
+    "backoff_initial": 5,        # seconds before the first restart
+    "backoff_max": 300,          # cap of the exponential backoff
+    "stable_seconds": 300,       # a run this long resets the backoff
+    "heartbeat_timeout": 600,    # no heartbeat for this long = hung, kill and restart
+    "stop_timeout": 180,         # graceful stop budget before terminate()
+    "reload_interval": 5,        # seconds between config file checks
+}
+
+# Applied to a running pipeline from the next batch on (an open stream keeps its
+# chunk size until it is reopened); any other change restarts it
+LIVE_KEYS = ("batch_size", "workers")
+
+
+def _watch_control(pipeline, control):
+    """Child side: forward stop requests and live settings from the supervisor"""
+    applied = {key: getattr(pipeline, key) for key in LIVE_KEYS}
+    requested_quota = control['pool_size'].value
+    while True:
+        time.sleep(1)
+        if control['stop'].value:
+            pipeline.stop()
+            return
+        if control['pool_size'].value != requested_quota:
+            requested_quota = control['pool_size'].value
+            pipeline.resize_pool(requested_quota)
+        control['pool_active'].value = pipeline.pool_quota or 0
+        for key in LIVE_KEYS:
+            value = control[key].value
+            if value != applied[key]:
+                print(f"[{pipeline.name}] 🔧 {key}: {applied[key]} -> {value}")
+                if key == "workers":
+                    pipeline.set_workers(value)
+                else:
+                    setattr(pipeline, key, value)
+                applied[key] = value
+
+
+def run_pipeline(pipeline_config, profiling=None, control=None, db_overrides=None, windows=None):
     """
     Worker process function to run a single pipeline.
+    Exceptions propagate (non-zero exit code) so the supervisor restarts it.
     """
     name = pipeline_config['name']
     module_name = pipeline_config['module']
@@ -24,29 +67,275 @@ def run_pipeline(pipeline_config):
     interval = pipeline_config.get('interval_seconds', 60)
     batch_size = pipeline_config.get('batch_size', 200)
     workers = pipeline_config.get('workers', 10)
-    checkpoint_file = pipeline_config.get('checkpoint_file') 
+    checkpoint_file = pipeline_config.get('checkpoint_file')
     start_autoindex = pipeline_config.get('start_autoindex')
-    
+    metrics_port = pipeline_config.get('metrics_port')
+
     print(f"[Scheduler] 🚀 Starting {name} process...")
-    
+
+    if control:
+        # Ctrl+C reaches the whole process group; the supervisor decides how we stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
     try:
+        if metrics_port:
+            # Each pipeline process serves its own registry
+            from etl_core.common.metrics import start_metrics_server
+            start_metrics_server(metrics_port)
+
+        tracing = pipeline_config.get('tracing')
+        if tracing:
+            from etl_core.common.tracing import TRACER
+            TRACER.configure(service_name=f"etl-{name}", **tracing)
+
         # Dynamically import module and class
         module = importlib.import_module(module_name)
         PipelineClass = getattr(module, class_name)
-        
+
         # Instantiate
         # Note: We assume the pipeline class __init__ accepts checkpoint_file if provided
         if checkpoint_file:
             pipeline = PipelineClass(batch_size=batch_size, workers=workers, checkpoint_file=checkpoint_file)
         else:
              pipeline = PipelineClass(batch_size=batch_size, workers=workers)
-        
+
+        dual_cursor = pipeline_config.get('dual_cursor')
+        if dual_cursor and dual_cursor.get('enabled'):
+            pipeline.enable_dual_cursor(**{k: v for k, v in dual_cursor.items() if k != 'enabled'})
+
+        source = pipeline_config.get('source')
+        if source:
+            pipeline.use_source(**source)
+
+        publish_events = pipeline_config.get('publish_events')
+        if publish_events:
+            pipeline.set_event_publishing(publish_events)
+
+        streaming = pipeline_config.get('streaming')
+        if streaming and streaming.get('enabled'):
+            pipeline.enable_streaming(**{k: v for k, v in streaming.items() if k != 'enabled'})
+
+        throttle = pipeline_config.get('throttle')
+        if throttle:
+            from etl_core.common.throttle import Throttle
+            pipeline.enable_throttle(Throttle.from_config(throttle, windows or {}))
+
+        if profiling:
+            # kill -USR1 <pid> or touch {control_dir}/profile_<name>
+            pipeline.enable_profiler(**profiling)
+
+        if control:
+            pipeline.heartbeat = control['heartbeat']
+            pipeline.backlog = control['backlog']
+            pipeline.beat()
+            if control['pool_size'].value:
+                # Connection budget: replace the default pool before the first batch
+                pipeline.db_overrides = db_overrides or {}
+                pipeline.resize_pool(control['pool_size'].value)
+            signal.signal(signal.SIGTERM, lambda signum, frame: pipeline.stop())
+            threading.Thread(target=_watch_control, args=(pipeline, control), name="supervisor-control", daemon=True).start()
+
         # Run loop
         pipeline.run(resume=True, loop_interval=interval, start_autoindex=start_autoindex)
-        
+
     except Exception as e:
         print(f"[Scheduler] 💥 {name} process crashed: {e}")
-        time.sleep(10) # Prevent tight crash loop
+        raise
+
+
+class ManagedPipeline:
+    """Supervisor side of one pipeline process: restarts, backoff, heartbeat, live settings"""
+    def __init__(self, config, profiling, options, db_overrides=None, windows=None):
+        self.config = config
+        self.name = config['name']
+        self.profiling = profiling
+        self.options = options
+        self.db_overrides = db_overrides
+        self.windows = windows
+        self.quota = 0  # granted pool size, 0 = no connection budget
+        self.target = None
+        self.process = None
+        self.started_at = None
+        self.failures = 0
+        self.next_start = 0
+        self.restart_requested = False
+        self.retired = False
+        self.control = None
+
+    def new_control(self):
+        """
+        Fresh shared values per process, without locks: a child killed with
+        SIGKILL while holding a multiprocessing lock/Event would deadlock the
+        supervisor and every later child. Each field has a single writer.
+        """
+        return {
+            "stop": multiprocessing.Value('b', 0, lock=False),
+            "heartbeat": multiprocessing.Value('d', time.time(), lock=False),
+            "batch_size": multiprocessing.Value('i', self.config.get('batch_size', 200), lock=False),
+            "workers": multiprocessing.Value('i', self.config.get('workers', 10), lock=False),
+            "backlog": multiprocessing.Value('q', -1, lock=False),
+            "pool_size": multiprocessing.Value('i', self.quota, lock=False),
+            "pool_active": multiprocessing.Value('i', 0, lock=False),
+        }
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        self.control = self.new_control()
+        self.process = multiprocessing.Process(
+            target=run_pipeline, args=(self.config, self.profiling, self.control, self.db_overrides, self.windows),
+            name=f"etl-{self.name}"
+        )
+        self.process.start()
+        self.started_at = time.time()
+        self.restart_requested = False
+        print(f"[Scheduler] Launched {self.name} (PID: {self.process.pid})")
+
+    @property
+    def backlog(self):
+        if self.control is None or self.control['backlog'].value < 0:
+            return None
+        return self.control['backlog'].value
+
+    @property
+    def committed(self):
+        """Connections this pipeline may hold right now (old pool until the child has resized)"""
+        if self.alive:
+            return max(self.control['pool_active'].value, self.quota)
+        return 0 if self.retired else self.quota
+
+    def set_quota(self, quota):
+        if quota == self.quota:
+            return
+        print(f"[Scheduler] 🔌 {self.name}: pool quota {self.quota} -> {quota} (backlog {self.backlog})")
+        self.quota = quota
+        if self.control is not None:
+            self.control['pool_size'].value = quota
+
+    def request_stop(self):
+        if self.alive:
+            self.control['stop'].value = 1
+
+    def update(self, config):
+        """Apply a reloaded config entry; restarts only when a non-live key changed"""
+        changed = {k for k in set(config) | set(self.config) if config.get(k) != self.config.get(k)}
+        if not changed:
+            return
+        self.config = config
+        for key in LIVE_KEYS:
+            if key in changed and config.get(key) is not None and self.control:
+                self.control[key].value = config[key]
+        restart_keys = changed - set(LIVE_KEYS)
+        if restart_keys:
+            self.restart(f"{', '.join(sorted(restart_keys))} changed")
+        else:
+            print(f"[Scheduler] 🔧 {self.name}: {', '.join(sorted(changed))} applied live")
+
+    def restart(self, reason):
+        """Graceful restart with the current config (no backoff)"""
+        print(f"[Scheduler] 🔄 {self.name}: {reason}, restarting gracefully")
+        self.restart_requested = True
+        self.request_stop()
+
+    def schedule_restart(self, reason):
+        if self.started_at and time.time() - self.started_at >= self.options['stable_seconds']:
+            self.failures = 0
+        self.failures += 1
+        delay = min(self.options['backoff_initial'] * 2 ** (self.failures - 1), self.options['backoff_max'])
+        self.next_start = time.time() + delay
+        print(f"[Scheduler] ⚠️ {self.name} {reason}. Restart #{self.failures} in {delay:.0f}s")
+
+    def check(self):
+        """Called by the supervisor loop; returns False once a retired pipeline has exited"""
+        now = time.time()
+        if self.process is None:
+            if not self.retired and now >= self.next_start:
+                self.start()
+            return not self.retired
+
+        if not self.process.is_alive():
+            exitcode = self.process.exitcode
+            self.process.join()
+            self.process = None
+            if self.retired:
+                print(f"[Scheduler] ⏹️ {self.name} stopped (exit code {exitcode})")
+                return False
+            if self.restart_requested:
+                self.start()
+            else:
+                self.schedule_restart(f"exited with code {exitcode}")
+            return True
+
+        silence = now - self.control['heartbeat'].value
+        if silence > self.options['heartbeat_timeout']:
+            print(f"[Scheduler] 🧊 {self.name} (PID {self.process.pid}) no heartbeat for {silence:.0f}s, killing")
+            self.process.kill()
+            self.process.join()
+            self.process = None
+            if not self.retired:
+                self.schedule_restart("hung")
+        return True
+
+
+def rebalance(managed, budget, recompute):
+    """Recompute quota targets by backlog (every rebalance_interval) and grant what fits now"""
+    active = {name: m for name, m in managed.items() if not m.retired}
+    if recompute:
+        demands = {name: {"workers": m.config.get('workers', 10), "backlog": m.backlog} for name, m in active.items()}
+        for name, quota in allocate(budget['max_connections'], demands, budget['min_per_pipeline']).items():
+            active[name].target = quota
+    committed = {name: m.committed for name, m in managed.items()}
+    targets = {name: m.target for name, m in active.items() if m.target}
+    for name, quota in grant(budget['max_connections'], targets, committed).items():
+        managed[name].set_quota(quota)
+
+
+def budget_options(config):
+    if 'connection_budget' not in config:
+        return None
+    return {**BUDGET_DEFAULTS, **config['connection_budget']}
+
+
+def load_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def supervisor_options(config):
+    return {**SUPERVISOR_DEFAULTS, **config.get('supervisor', {})}
+
+
+def apply_config(config, managed, options):
+    """Start, update or retire pipelines so the running set matches config"""
+    profiling = config.get('profiling')
+    budget = budget_options(config)
+    db_overrides = budget['pgbouncer'] if budget else None
+    windows = config.get('windows', {})
+    wanted = {p['name']: p for p in config.get('pipelines', []) if p.get('enabled', False)}
+
+    for name, m in managed.items():
+        if name not in wanted and not m.retired:
+            print(f"[Scheduler] ⏹️ {name} disabled, stopping gracefully")
+            m.retired = True
+            m.request_stop()
+
+    for name, p_conf in wanted.items():
+        m = managed.get(name)
+        if m is None or m.retired:
+            if m is not None and m.alive:
+                continue  # re-enabled while still draining; started once it has exited
+            managed[name] = ManagedPipeline(p_conf, profiling, options, db_overrides, windows)
+        else:
+            m.profiling = profiling
+            m.db_overrides = db_overrides
+            windows_changed = windows != m.windows
+            m.windows = windows
+            m.update(p_conf)
+            if windows_changed and p_conf.get('throttle') and not m.restart_requested:
+                m.restart("windows changed")
+
 
 def main():
     print(f"[Scheduler] Loading configuration from {CONFIG_FILE}...")
@@ -54,31 +343,81 @@ def main():
         print(f"[Scheduler] ❌ Config file {CONFIG_FILE} not found!")
         return
 
-    with open(CONFIG_FILE, 'r') as f:
-        config = json.load(f)
+    config = load_config()
+    config_mtime = os.path.getmtime(CONFIG_FILE)
+    options = supervisor_options(config)
 
-    processes = []
-    
-    for p_conf in config.get('pipelines', []):
-        if p_conf.get('enabled', False):
-            p = multiprocessing.Process(target=run_pipeline, args=(p_conf,))
-            p.start()
-            processes.append(p)
-            print(f"[Scheduler] Launched {p_conf['name']} (PID: {p.pid})")
+    profiling = config.get('profiling')
+    if profiling:
+        from etl_core.common.profiler import install_profiler
+        install_profiler("scheduler", **profiling)
 
-    try:
-        # Monitor processes
-        while True:
-            time.sleep(5)
-            for p in processes:
-                if not p.is_alive():
-                    print(f"[Scheduler] ⚠️ Process {p.pid} died. (Restart logic could be implemented here)")
-    except KeyboardInterrupt:
-        print("\n[Scheduler] 🛑 Stopping all processes...")
-        for p in processes:
-            p.terminate()
-            p.join()
-        print("[Scheduler] Bye.")
+    stopping = threading.Event()
+
+    def request_shutdown(signum, frame):
+        print(f"\n[Scheduler] 🛑 Signal {signum} received, stopping pipelines after their current batch...")
+        stopping.set()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+
+    managed = {}
+    apply_config(config, managed, options)
+    budget = budget_options(config)
+    if budget:
+        print(f"[Scheduler] 🔌 Connection budget: {budget['max_connections']} for the pipelines"
+              f"{' via ' + str(budget['pgbouncer']) if budget['pgbouncer'] else ''}")
+        rebalance(managed, budget, recompute=True)
+    last_reload_check = last_rebalance = time.time()
+
+    # Monitor processes
+    while not stopping.is_set():
+        retired = [name for name in list(managed) if not managed[name].check()]
+        for name in retired:
+            del managed[name]
+        if retired:
+            apply_config(config, managed, options)  # pick up pipelines re-enabled while draining
+
+        if budget:
+            recompute = bool(retired) or time.time() - last_rebalance >= budget['rebalance_interval']
+            if recompute:
+                last_rebalance = time.time()
+            rebalance(managed, budget, recompute)
+
+        if time.time() - last_reload_check >= options['reload_interval']:
+            last_reload_check = time.time()
+            try:
+                mtime = os.path.getmtime(CONFIG_FILE)
+                if mtime != config_mtime:
+                    config = load_config()
+                    config_mtime = mtime
+                    options.clear()
+                    options.update(supervisor_options(config))
+                    print(f"[Scheduler] 🔁 Reloaded {CONFIG_FILE}")
+                    apply_config(config, managed, options)
+                    budget = budget_options(config)
+                    if budget:
+                        # New pipelines get their quota before check() starts them
+                        rebalance(managed, budget, recompute=True)
+                        last_rebalance = time.time()
+            except (OSError, ValueError) as e:
+                # Keep running on the previous config (e.g. file saved half-way)
+                print(f"[Scheduler] ⚠️ Config reload failed, keeping current config: {e}")
+
+        stopping.wait(1)
+
+    for m in managed.values():
+        m.request_stop()
+    deadline = time.time() + options['stop_timeout']
+    for m in managed.values():
+        if m.process is None:
+            continue
+        m.process.join(max(deadline - time.time(), 0))
+        if m.process.is_alive():
+            print(f"[Scheduler] ⚠️ {m.name} did not stop within {options['stop_timeout']}s, terminating")
+            m.process.terminate()
+            m.process.join()
+    print("[Scheduler] Bye.")
 
 if __name__ == "__main__":
     main()
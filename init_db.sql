@@ -32,6 +32,7 @@ COMMENT ON COLUMN "biz"."program"."craft_type" IS '工艺类型 (如 拧紧)';
 -- 存储单个操作周期的顶层结果
 CREATE TABLE IF NOT EXISTS "biz"."result" (
   "id" bigserial,
+  "source_id" int8,                     -- 源数据主键 (FDS autoindex / SPR id), 用于去重
   "cyclenumber" varchar(64),            -- 设备生成的唯一周期号
   "device_name" varchar(64),
   "craft_type" varchar(64),             -- 冗余字段，便于不关联查询直接统计
@@ -57,6 +58,14 @@ CREATE TABLE IF NOT EXISTS "biz"."result_default" PARTITION OF "biz"."result" DE
 CREATE INDEX IF NOT EXISTS idx_result_bsn ON "biz"."result" ("bsn", "start_time");
 CREATE INDEX IF NOT EXISTS idx_result_vin ON "biz"."result" ("vin", "start_time");
 CREATE INDEX IF NOT EXISTS idx_result_craft_time ON "biz"."result" ("craft_type", "start_time");
+-- 以下索引与 etl_core/common/indexes.py 保持一致 (已有库请运行 apply_index_migration.py)
+CREATE INDEX IF NOT EXISTS idx_result_device_time ON "biz"."result" ("device_name", "start_time" DESC);
+CREATE INDEX IF NOT EXISTS idx_result_start_time ON "biz"."result" ("start_time" DESC);
+CREATE INDEX IF NOT EXISTS idx_result_nok_time ON "biz"."result" ("start_time" DESC) WHERE "result_status" = 0;
+-- 源记录唯一键 (ETL 以 ON CONFLICT DO NOTHING 写入; 分区表的唯一索引须包含分区键 start_time)
+-- 已有库请运行 apply_result_source_key_migration.py (去重后建索引)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_result_source ON "biz"."result" ("source_id", "craft_type", "start_time");
+CREATE INDEX IF NOT EXISTS idx_result_program_time ON "biz"."result" ("program_id", "start_time" DESC);
 
 
 -- 3. 过程步骤表 (Step)
@@ -85,11 +94,14 @@ CREATE TABLE IF NOT EXISTS "biz"."alarm" (
   "alarm_code" varchar(64),
   "alarm_level" varchar(16),            -- INFO, WARN, ERROR
   "alarm_msg" text,
+  "device_id" varchar(64),              -- 报警设备 (冗余 result.device_name)
   "create_time" timestamp(6) DEFAULT CURRENT_TIMESTAMP
 );
 
 CREATE INDEX IF NOT EXISTS idx_alarm_result_id ON "biz"."alarm" ("result_id");
 CREATE INDEX IF NOT EXISTS idx_alarm_step_id ON "biz"."alarm" ("step_id");
+CREATE INDEX IF NOT EXISTS idx_alarm_create_time ON "biz"."alarm" ("create_time" DESC);
+CREATE INDEX IF NOT EXISTS idx_alarm_device_time ON "biz"."alarm" ("device_id", "create_time" DESC);
 
 
 -- 5. 曲线数据表 (Curve)
@@ -106,6 +118,8 @@ CREATE TABLE IF NOT EXISTS "biz"."curve" (
   "sample_rate" int4                    -- 采样率 (Hz)
 );
 
+CREATE INDEX IF NOT EXISTS idx_curve_result_step ON "biz"."curve" ("result_id", "step", "curve_type");
+
 
 -- 6. 扩展属性表 (Extension)
 -- 存储主表中无法容纳的特定工艺字段
@@ -118,3 +132,69 @@ CREATE TABLE IF NOT EXISTS "biz"."extension" (
 
 -- JSONB 索引 (例如: 查找所有高湿度的记录)
 CREATE INDEX IF NOT EXISTS idx_extension_data ON "biz"."extension" USING GIN (extra_data);
+
+
+-- 7. 步骤 KPI 表 (Step KPI)
+-- 每个步骤的单值结果 (FDS bs_fds_singleresult), 类型化存储以便按值范围过滤
+-- 已有库请运行 apply_step_kpi_migration.py (建表、索引及历史数据回填)
+CREATE TABLE IF NOT EXISTS "biz"."step_kpi" (
+  "result_id" int8 NOT NULL,            -- 关联 result.id
+  "step_index" int4 NOT NULL,           -- 关联 step.step_index
+  "kpi_type" int4 NOT NULL,             -- 源 KPI 类型 (bs_fds_singleresult.type)
+  "value" numeric(12,4) NOT NULL,
+  "result_index" int4,                  -- 同一步骤内的序号
+  "start_time" timestamp(6) NOT NULL    -- 冗余 result.start_time, 便于按时间范围过滤
+);
+
+CREATE INDEX IF NOT EXISTS idx_step_kpi_result ON "biz"."step_kpi" ("result_id", "step_index");
+CREATE INDEX IF NOT EXISTS idx_step_kpi_type_value ON "biz"."step_kpi" ("kpi_type", "step_index", "value");
+
+
+-- 8. 结果 KPI 表 (Result KPI)
+-- extension.extra_data 中常用过滤字段的类型化投影 (由 ETL 写入), B-tree 索引支持范围查询
+-- 已有库请运行 apply_result_kpi_migration.py (建表、索引及历史数据回填)
+CREATE TABLE IF NOT EXISTS "biz"."result_kpi" (
+  "result_id" int8 PRIMARY KEY,         -- 1:1 关联 result.id
+  "start_time" timestamp(6) NOT NULL,   -- 冗余 result.start_time (result 主键为 id + start_time)
+  "craft_type" varchar(64),
+  "final_force" numeric(10,3),          -- SPR 最终压力
+  "final_stroke" numeric(10,3),         -- SPR 最终行程
+  "start_distance" numeric(10,3),
+  "end_distance" numeric(10,3),
+  "velocity" numeric(10,3),
+  "force_limit_high" numeric(10,3),     -- parameter_limits['Final Force']
+  "force_limit_low" numeric(10,3),
+  "stroke_limit_high" numeric(10,3),    -- parameter_limits['Final Stroke']
+  "stroke_limit_low" numeric(10,3)
+);
+
+CREATE INDEX IF NOT EXISTS idx_result_kpi_force ON "biz"."result_kpi" ("final_force");
+CREATE INDEX IF NOT EXISTS idx_result_kpi_stroke ON "biz"."result_kpi" ("final_stroke");
+CREATE INDEX IF NOT EXISTS idx_result_kpi_velocity ON "biz"."result_kpi" ("velocity");
+
+
+-- 9. SPC 统计桶表 (SPC Bucket)
+-- 每个序列 (程序, 参数类型, 步骤, 设备) 每小时一行的 Welford 累计量 (n, mean, M2), 由 ETL 在写入结果时合并
+-- step_index = -1 为 result.key_value, 其余为 step.step_value; /api/spc 只读本表, 不扫描历史结果
+-- 已有库请运行 apply_spc_migration.py (建表、索引及历史数据回填)
+CREATE TABLE IF NOT EXISTS "biz"."spc_bucket" (
+  "program_id" varchar(64) NOT NULL,
+  "parameter_type" varchar(64) NOT NULL,  -- 结果关联的 program.parameter_type
+  "step_index" int4 NOT NULL,             -- -1: result.key_value
+  "device_name" varchar(64) NOT NULL,
+  "bucket_start" timestamp(6) NOT NULL,   -- date_trunc('hour', start_time)
+  "craft_type" varchar(64),
+  "n" int8 NOT NULL,
+  "mean" float8 NOT NULL,
+  "m2" float8 NOT NULL,                   -- 离差平方和, 方差 = m2 / (n - 1)
+  "min_value" float8,
+  "max_value" float8,
+  "nok_count" int8 NOT NULL DEFAULT 0,
+  "target_value" numeric(10,2),           -- 最近一次写入的 program / step 规格
+  "upper_limit" numeric(10,2),
+  "lower_limit" numeric(10,2),
+  "update_time" timestamp(6) DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY ("program_id", "parameter_type", "step_index", "device_name", "bucket_start")
+);
+
+CREATE INDEX IF NOT EXISTS idx_spc_bucket_time ON "biz"."spc_bucket" ("bucket_start");
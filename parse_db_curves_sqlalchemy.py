@@ -16,11 +16,12 @@ Table: origin.fds_curves
   pip install pg8000  # 纯Python，无需编译
 """
 
-import struct
-import base64
 import json
 from sqlalchemy import create_engine, text
 from datetime import datetime, timedelta
+from etl_core.common.blob import BlobColumn, fds_frames
+
+CURVE_COLUMN = BlobColumn("fds_curves.curve")
 
 
 def parse_fds_curve(curve_data, start_offset=7816):
@@ -28,7 +29,7 @@ def parse_fds_curve(curve_data, start_offset=7816):
     解析FDS曲线数据（支持bytes或Base64字符串）
     
     Args:
-        curve_data: 二进制数据(bytes) 或 Base64字符串(str)
+        curve_data: 二进制数据(bytes/memoryview) 或 Base64字符串(str)
         start_offset: 数据起始偏移量 (默认7816)
         
     Returns:
@@ -37,53 +38,32 @@ def parse_fds_curve(curve_data, start_offset=7816):
     if curve_data is None:
         return None
 
-    # 处理不同类型的输入
-    if isinstance(curve_data, bytes):
-        # 直接使用二进制数据（来自数据库bytea字段）
-        data = curve_data
-    elif isinstance(curve_data, str):
-        # Base64字符串（来自CSV文件）
-        try:
-            data = base64.b64decode(curve_data)
-        except Exception as e:
-            print(f"Base64解码错误: {e}")
-            return None
-    else:
-        print(f"不支持的数据类型: {type(curve_data)}")
+    # bytea 可能是 bytes (pg8000) 或 memoryview (psycopg2), CSV 导入的是 Base64 字符串;
+    # 类型按列判断一次, 原始二进制不复制
+    try:
+        view = CURVE_COLUMN.view(curve_data)
+    except Exception as e:
+        print(f"曲线数据解码错误: {e}")
         return None
 
-    frame_size = 40
-    if len(data) <= start_offset:
-        return []
-
-    num_rows = (len(data) - start_offset) // frame_size
-    
-    curve_records = []
-    for i in range(num_rows):
-        offset = start_offset + i * frame_size
-        chunk = data[offset : offset + frame_size]
-        
-        try:
-            # Variant B 结构: <hhffffffffi
-            values = struct.unpack('<hhffffffffi', chunk)
-            
-            record = {
-                '转速设定值': values[0],
-                '实际转速': values[1],
-                '扭矩': round(values[2], 4),
-                '过滤扭矩': round(values[3], 4),
-                '扭矩单位角度变化量': round(values[4], 4),
-                '深度': round(values[5], 4),
-                '深度单位时间变化量': round(values[6], 4),
-                '角度': round(values[7], 4),
-                '压力设定值': round(values[8], 4),
-                '实际压力': round(values[9], 4),
-                '步骤': values[10]
-            }
-            curve_records.append(record)
-        except Exception:
-            pass
-            
+    # Variant B 结构: <hhffffffffi, 逐帧解包 (不切片复制)
+    curve_records = [
+        {
+            '转速设定值': values[0],
+            '实际转速': values[1],
+            '扭矩': round(values[2], 4),
+            '过滤扭矩': round(values[3], 4),
+            '扭矩单位角度变化量': round(values[4], 4),
+            '深度': round(values[5], 4),
+            '深度单位时间变化量': round(values[6], 4),
+            '角度': round(values[7], 4),
+            '压力设定值': round(values[8], 4),
+            '实际压力': round(values[9], 4),
+            '步骤': values[10]
+        }
+        for values in fds_frames(view, start_offset)
+    ]
+    view.release()
     return curve_records
 
 
@@ -116,7 +96,27 @@ def create_db_engine(host, port, database, user, password, driver='psycopg2'):
         raise
 
 
-def process_curves(engine, batch_size=100, start_date='2024-12-01', min_autoindex=None):
+def _limit_batches(conn, select_query, params, batch_size):
+    """每批重新查询 - 已处理的记录 (curve_plain 已写入) 会从结果集中消失, 所以总是从头取"""
+    while True:
+        records = conn.execute(select_query, {**params, "batch_size": batch_size}).fetchall()
+        if not records:
+            return
+        yield records
+
+
+def _stream_batches(engine, select_query, params, batch_size):
+    """
+    服务端游标 (stream_results + yield_per) 按 autoindex 顺序扫描一次, 每次产出 batch_size 行,
+    内存只保留一批 (含曲线 blob). 读连接单独开, 写入仍在主连接上逐条提交.
+    """
+    with engine.connect() as read_conn:
+        result = read_conn.execution_options(stream_results=True).execute(select_query, params)
+        for records in result.yield_per(batch_size).partitions():
+            yield records
+
+
+def process_curves(engine, batch_size=100, start_date='2024-12-01', min_autoindex=None, stream=False):
     """
     处理曲线数据
     
@@ -125,6 +125,7 @@ def process_curves(engine, batch_size=100, start_date='2024-12-01', min_autoinde
         batch_size: 批处理大小
         start_date: 起始日期
         min_autoindex: 最小autoindex值 (可选，用于筛选 autoindex > min_autoindex)
+        stream: 流式模式 (全量历史重算), 服务端游标读取且不统计总数
     """
     with engine.connect() as conn:
         # 构建WHERE条件
@@ -137,50 +138,48 @@ def process_curves(engine, batch_size=100, start_date='2024-12-01', min_autoinde
         
         where_clause = " AND ".join(where_conditions)
         
-        # 统计待处理记录数
-        count_query = text(f"""
-            SELECT COUNT(*) as total 
+        select_sql = f"""
+            SELECT autoindex, curve, starttime, duration, actualprogramid, systemid, startselection, ok_nok_code, lastexecutedstep, cyclenumber, bsn, progselection, create_time, update_time
             FROM origin.fds_curves 
             WHERE {where_clause}
-        """)
-        
-        result = conn.execute(count_query, params)
-        total_count = result.scalar()
-        
-        print(f"\n📊 待处理记录总数: {total_count}")
+            ORDER BY autoindex
+        """
+
+        if stream:
+            # 全量历史重算: 一个服务端游标顺序读完, 不做 COUNT(*), 也不每批重新执行 ORDER BY ... LIMIT
+            total_count = None
+            print(f"\n🌊 流式读取模式 (每批 {batch_size} 条)")
+            batches = _stream_batches(engine, text(select_sql), params, batch_size)
+        else:
+            # 统计待处理记录数
+            count_query = text(f"""
+                SELECT COUNT(*) as total 
+                FROM origin.fds_curves 
+                WHERE {where_clause}
+            """)
+            
+            result = conn.execute(count_query, params)
+            total_count = result.scalar()
+            
+            print(f"\n📊 待处理记录总数: {total_count}")
+            if total_count == 0:
+                print("没有需要处理的记录")
+                return
+            batches = _limit_batches(conn, text(select_sql + "LIMIT :batch_size"), params, batch_size)
+
         if min_autoindex is not None:
             print(f"   筛选条件: autoindex > {min_autoindex}")
         
-        if total_count == 0:
-            print("没有需要处理的记录")
-            return
-        
         # 分批处理
-        offset = 0
         processed = 0
         success = 0
         failed = 0
         
-        while True:
-            # 查询一批数据 - Always fetch from start since we are removing items from the result set (by updating curve_plain)
-            select_query = text(f"""
-                SELECT autoindex, curve, starttime, duration, actualprogramid, systemid, startselection, ok_nok_code, lastexecutedstep, cyclenumber, bsn, progselection, create_time, update_time
-                FROM origin.fds_curves 
-                WHERE {where_clause}
-                ORDER BY autoindex
-                LIMIT :batch_size
-            """)
-            
-            query_params = params.copy()
-            query_params["batch_size"] = batch_size
-            
-            result = conn.execute(select_query, query_params)
-            records = result.fetchall()
-            
-            if not records:
-                break
-            
-            print(f"\n🔄 处理批次: {processed + 1} 到 {processed + len(records)} / {total_count} (剩余: {total_count - processed})")
+        for records in batches:
+            if total_count is None:
+                print(f"\n🔄 处理批次: {processed + 1} 到 {processed + len(records)}")
+            else:
+                print(f"\n🔄 处理批次: {processed + 1} 到 {processed + len(records)} / {total_count} (剩余: {total_count - processed})")
             
             # 处理每条记录
             for record in records:
@@ -334,6 +333,7 @@ def main():
     BATCH_SIZE = 100
     START_DATE = '2024-12-01'  # 只处理12月及以后的数据
     MIN_AUTOINDEX = 4486968    # 只处理 autoindex > 2955030 的记录
+    STREAM = False             # 全量历史重算时设为 True (服务端游标流式读取)
     
     print("="*60)
     print("FDS曲线数据库解析器 (SQLAlchemy)")
@@ -343,6 +343,7 @@ def main():
     print(f"起始日期: {START_DATE}")
     print(f"最小autoindex: {MIN_AUTOINDEX}")
     print(f"批处理大小: {BATCH_SIZE}")
+    print(f"流式读取: {STREAM}")
     print(f"数据库驱动: {DB_CONFIG['driver']}")
     print("="*60)
     
@@ -351,7 +352,7 @@ def main():
         engine = create_db_engine(**DB_CONFIG)
         
         # 处理曲线数据
-        process_curves(engine, batch_size=BATCH_SIZE, start_date=START_DATE, min_autoindex=MIN_AUTOINDEX)
+        process_curves(engine, batch_size=BATCH_SIZE, start_date=START_DATE, min_autoindex=MIN_AUTOINDEX, stream=STREAM)
         
         # 关闭引擎
         engine.dispose()